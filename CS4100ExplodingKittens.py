@@ -1,8 +1,179 @@
 from email import policy
 import random
-import copy
-from collections import Counter
+from collections import Counter, namedtuple
 from shutil import move
+import multiprocessing
+import os
+import sys
+import mmap
+import struct
+import tempfile
+import time
+import json
+import bisect
+from array import array
+import numpy as np
+
+
+# every card type in a fixed order, so a card type can be stored as a small integer
+CARD_TYPES = ('Defuse', 'Exploding Kitten', 'Attack', 'Skip', 'See The Future', 'Shuffle', 'Favor',
+              'Tacocat', 'Cattermelon', 'Rainbow-Ralphing Cat')
+CARD_CODES = {card_type: code for code, card_type in enumerate(CARD_TYPES)}
+CAT_CARDS = ('Tacocat', 'Cattermelon', 'Rainbow-Ralphing Cat')
+# the moves a hand can make in a game state, one bit each
+HAND_ACTIONS = ('Attack', 'Skip', 'See The Future', 'Shuffle', 'Favor', 'Cat')
+HAND_ACTION_BITS = {action: 1 << bit for bit, action in enumerate(HAND_ACTIONS)}
+DEFUSE_CODE = CARD_CODES['Defuse']
+ATTACK_CODE = CARD_CODES['Attack']
+SKIP_CODE = CARD_CODES['Skip']
+SEE_THE_FUTURE_CODE = CARD_CODES['See The Future']
+SHUFFLE_CODE = CARD_CODES['Shuffle']
+FAVOR_CODE = CARD_CODES['Favor']
+TACOCAT_CODE = CARD_CODES['Tacocat']
+CATTERMELON_CODE = CARD_CODES['Cattermelon']
+RAINBOW_RALPHING_CAT_CODE = CARD_CODES['Rainbow-Ralphing Cat']
+
+# the number of each card type in the deck of a two-player game, not counting Defuses and Exploding Kittens
+DECK_CARD_COUNTS = {
+    'Attack': 4,
+    'Skip': 4,
+    'See The Future': 3,
+    'Shuffle': 2,
+    'Favor': 2,
+    'Tacocat': 3,
+    'Cattermelon': 3,
+    'Rainbow-Ralphing Cat': 3
+}
+
+
+# the deck for a table of num_players; bigger tables get proportionally more of every card so the draw pile left
+# after dealing stays about as long per player (with the two-player deck, four players would empty it dealing)
+def deck_card_counts(num_players):
+    return {card_type: count * num_players // 2 for card_type, count in DECK_CARD_COUNTS.items()}
+
+
+# raise a ValueError for a table the state keys have no room for (see MAX_PLAYERS)
+def check_num_players(num_players):
+    if not 2 <= num_players <= MAX_PLAYERS:
+        raise ValueError(f"games need 2 to {MAX_PLAYERS} players, not {num_players}")
+
+
+# bit layout of an encoded game state, lowest bits first:
+#   hand actions (6) | deck size (6) | future card (4) | attack counter (3) | defuses owned (3) |
+#   defuses with opponents (3) | number of opponents (3) | opponent hand sizes (6 each, sorted)
+# only living opponents are counted, and their defuses are added up, so a state grows by one sorted hand size per
+# opponent and the same situation at a bigger table shares keys no matter who sits where
+# the fields are sized for tables of up to MAX_PLAYERS: there is one Defuse per player, so a 3 bit defuse count
+# holds all of them, and the hand sizes of 5 opponents plus the risk level below end at bit 61, which still fits
+# the uint64 keys of saved policies and the int64 keys of BatchSimulator
+MAX_PLAYERS = 6
+DECK_SIZE_SHIFT = 6
+FUTURE_SHIFT = 12
+ATTACK_SHIFT = 16
+DEFUSES_OWNED_SHIFT = 19
+DEFUSES_WITH_OPP_SHIFT = 22
+NUM_OPPONENTS_SHIFT = 25
+OPPONENT_HANDS_SHIFT = 28
+HAND_SIZE_BITS = 6
+# players with risk_in_state also get the kitten risk level (see kitten_risk) right after the last opponent hand
+# size, plus one so a key with a risk level never equals one without
+RISK_BITS = 3
+assert OPPONENT_HANDS_SHIFT + (MAX_PLAYERS - 1) * HAND_SIZE_BITS + RISK_BITS < 63
+# the risk levels: 0 when the top card is known to be safe, the last one when it is known to be a kitten, and in
+# between one level for each range these bounds split the other risks into
+RISK_BOUNDS = (0.1, 0.2, 0.35, 0.5)
+CERTAIN_RISK_LEVEL = len(RISK_BOUNDS) + 2
+
+
+# pack the fields of a game state into one integer
+# the packing is one-to-one, so two states share a key exactly when their fields are all equal
+def encode_game_state(hand, opponent_hand_sizes, deck_size, future, attack_counter, defuses_owned,
+                      defuses_with_opp, risk_level=None):
+    key = (hand
+           | deck_size << DECK_SIZE_SHIFT
+           | (0 if future is None else CARD_CODES[future] + 1) << FUTURE_SHIFT
+           | attack_counter << ATTACK_SHIFT
+           | defuses_owned << DEFUSES_OWNED_SHIFT
+           | opponent_state_key(defuses_with_opp, opponent_hand_sizes))
+    if risk_level is not None:
+        key |= risk_state_key(risk_level, len(opponent_hand_sizes))
+    return key
+
+
+# the part of an encoded game state that describes the opponents
+def opponent_state_key(defuses_with_opp, opponent_hand_sizes):
+    key = defuses_with_opp << DEFUSES_WITH_OPP_SHIFT | len(opponent_hand_sizes) << NUM_OPPONENTS_SHIFT
+    shift = OPPONENT_HANDS_SHIFT
+    for size in opponent_hand_sizes:
+        key |= size << shift
+        shift += HAND_SIZE_BITS
+    return key
+
+
+# the risk part of an encoded game state, which goes after the hand sizes of num_opponents opponents
+def risk_state_key(risk_level, num_opponents):
+    return (risk_level + 1) << (OPPONENT_HANDS_SHIFT + num_opponents * HAND_SIZE_BITS)
+
+
+# memoized kitten_risk results, by (deck size, kittens, kitten depths, known depths)
+KITTEN_RISKS = {}
+
+
+# the chance that the top card of the deck is an Exploding Kitten, and its risk level, for a player that knows what
+# some of the cards are: kittens and known are bitmasks of depths (bit 0 is the top card) holding a kitten and
+# holding a card the player knows; the kittens it has not placed are equally likely to be in any other spot
+# the same few configurations come up in every game, so each one is only worked out once
+def kitten_risk(deck_size, num_kittens, kittens, known):
+    config = (deck_size, num_kittens, kittens, known)
+    risk = KITTEN_RISKS.get(config)
+    if risk is None:
+        if kittens & 1:
+            risk = (1.0, CERTAIN_RISK_LEVEL)
+        elif known & 1:
+            risk = (0.0, 0)
+        else:
+            unknown_spots = deck_size - bin(known).count('1')
+            unknown_kittens = num_kittens - bin(kittens).count('1')
+            chance = unknown_kittens / unknown_spots if unknown_spots > 0 else 0.0
+            if chance == 0:
+                risk = (chance, 0)
+            elif chance == 1:
+                risk = (chance, CERTAIN_RISK_LEVEL)
+            else:
+                risk = (chance, bisect.bisect_right(RISK_BOUNDS, chance) + 1)
+        KITTEN_RISKS[config] = risk
+    return risk
+
+
+# the hand actions of an encoded game state for a list of card counts indexed by card code
+# every recorded state needs one, so the bits (in HAND_ACTIONS order) are worked out in a single expression
+def hand_bits(counts):
+    return ((counts[ATTACK_CODE] > 0)
+            | (counts[SKIP_CODE] > 0) << 1
+            | (counts[SEE_THE_FUTURE_CODE] > 0) << 2
+            | (counts[SHUFFLE_CODE] > 0) << 3
+            | (counts[FAVOR_CODE] > 0) << 4
+            | (counts[TACOCAT_CODE] > 1 or counts[CATTERMELON_CODE] > 1 or counts[RAINBOW_RALPHING_CAT_CODE] > 1) << 5)
+
+
+# unpack an encoded game state back into its fields, mostly for debugging and inspecting policies
+def decode_game_state(key):
+    future = key >> FUTURE_SHIFT & 0xF
+    num_opponents = key >> NUM_OPPONENTS_SHIFT & 0x7
+    opponent_hand_sizes = []
+    for i in range(num_opponents):
+        opponent_hand_sizes.append(key >> (OPPONENT_HANDS_SHIFT + i * HAND_SIZE_BITS) & 0x3F)
+    risk = key >> (OPPONENT_HANDS_SHIFT + num_opponents * HAND_SIZE_BITS) & 0x7
+    return {
+        'hand': [action for action in HAND_ACTIONS if key & HAND_ACTION_BITS[action]],
+        'opponent_hand_sizes': opponent_hand_sizes,
+        'deck_size': key >> DECK_SIZE_SHIFT & 0x3F,
+        'future': CARD_TYPES[future - 1] if future else None,
+        'attack_counter': key >> ATTACK_SHIFT & 0x7,
+        'defuses_owned': key >> DEFUSES_OWNED_SHIFT & 0x7,
+        'defuses_with_opp': key >> DEFUSES_WITH_OPP_SHIFT & 0x7,
+        'risk_level': risk - 1 if risk else None
+    }
 
 
 # An agent in an Exploding Kittens Game
@@ -22,8 +193,14 @@ class Player:
         # (we will probably have other variables to store gamestate knowledge)
         self.deck_size = None
         self.future_seen = []
+        # how many cards from the top the Exploding Kitten this player replanted is, until the deck is reordered
+        self.kitten_depth = None
+        # whether this player's game states include its kitten risk level (see encode_game_state)
+        self.risk_in_state = False
         self.game_states = []
         self.actions = []
+        # where the player's random decisions come from; a Game hands all of its players its own RNG
+        self.rng = random
 
     def __str__(self):
         return self.player_ID
@@ -31,59 +208,108 @@ class Player:
     def __repr__(self):
         return str(self.player_ID)
 
+    # a copy of the player for simulating the rest of a game, as a player_type (the player's own type if None)
+    # the copy shares the Cards but has its own hand and future_seen, and starts without a history; the game it is
+    # copied into sets other_players and rng
+    def clone(self, player_type=None):
+        player_type = type(self) if player_type is None else player_type
+        player = player_type.__new__(player_type)
+        player.__dict__.update(self.__dict__)
+        player.hand = list(self.hand)
+        player.future_seen = list(self.future_seen)
+        player.game_states = []
+        player.actions = []
+        return player
+
+    # the opponents still in the game
+    def living_opponents(self):
+        return [p for p in self.other_players if p.alive]
+
+    # the opponents a Favor or a cat pair could take a card from
+    def steal_targets(self):
+        return [p for p in self.other_players if len(p.hand) > 0 and p.alive]
+
+    # whether a Favor or a cat pair would have anyone to take a card from
+    def can_steal(self):
+        return len(self.steal_targets()) > 0
+
     # decide which player to target with a favor card
     def choose_favor_target(self):
-        possible_choices = list(filter(lambda p: len(p.hand) > 0 and p.alive, self.other_players))
-        return random.choice(possible_choices)
+        return self.rng.choice(self.steal_targets())
 
     # decide which player to target with a cat card pairing
     def choose_cat_target(self):
-        possible_choices = list(filter(lambda p: len(p.hand) > 0 and p.alive, self.other_players))
-        return random.choice(possible_choices)
+        return self.rng.choice(self.steal_targets())
 
     # decide which card to give to a player asking for a favor
     def give_card(self, other_player):
-        return random.choice(self.hand)
+        return self.rng.choice(self.hand)
 
     # decide where in the deck to replant an exploding kitten
     def choose_spot_in_deck(self, deck_size):
-        return random.randrange(deck_size)
+        return self.rng.randrange(deck_size)
 
+    # the player's view of the game, packed into an integer (see encode_game_state)
     def get_game_state(self, game):
+        return game.state_key(self)
+
+    # where in the deck this player knows there are Exploding Kittens, as (kitten depths, known depths) bitmasks
+    # with the top card as bit 0; it knows the cards it saw with See The Future and the kitten it replanted
+    def known_deck(self):
+        kittens = 0
+        known = 0
+        for depth, card in enumerate(self.future_seen):
+            known |= 1 << depth
+            if card.card_type == 'Exploding Kitten':
+                kittens |= 1 << depth
+        if self.kitten_depth is not None:
+            known |= 1 << self.kitten_depth
+            kittens |= 1 << self.kitten_depth
+        return kittens, known
+
+    # the chance, as far as this player knows, that the next card drawn is an Exploding Kitten; every kitten that
+    # has not exploded is in the deck, one fewer than the players left
+    def draw_risk(self, game):
+        kittens, known = self.known_deck()
+        return kitten_risk(len(game.deck), game.players_left - 1, kittens, known)[0]
+
+    # the same key built from scratch out of the hands; state_key keeps it up to date incrementally instead
+    def compute_game_state(self, game):
         player_hand = Counter([card.card_type for card in self.hand])
-        opponent = self.other_players[0]
-        opp_hand = Counter([card.card_type for card in opponent.hand])
-        possible_actions = []
+        opponents = self.living_opponents()
+        opp_defuses = sum(1 for opp in opponents for card in opp.hand if card.card_type == 'Defuse')
+        hand = 0
         for card_type in player_hand:
             if card_type != 'Defuse':
                 # need two or more like cat cards to play
-                if card_type in ['Cattermelon', 'Tacocat', 'Rainbow-Ralphing Cat']:
+                if card_type in CAT_CARDS:
                     if player_hand[card_type] > 1:
-                        possible_actions.append('Cat')
+                        hand |= HAND_ACTION_BITS['Cat']
                 # otherwise only one card is needed
                 else:
-                    possible_actions.append(card_type)
-        hand = list(set(sorted(possible_actions)))
-        deck_size = len(game.deck)
-        future = self.future_seen[0] if self.future_seen else None
-        players_left = game.players_left
-        attack_counter = game.attack_counter
-        game_key = {
-            'hand': hand,
-            'opponent_hand_sizes': list(sorted([len(opp.hand) for opp in self.other_players])),
-            'deck_size': deck_size,
-            'future': future,
-            'attack_counter': attack_counter,
-            'defuses_owned': player_hand['Defuse'],
-            'defuses_with_opp': opp_hand['Defuse']
-        }
-        return str(game_key)
+                    hand |= HAND_ACTION_BITS[card_type]
+        future = self.future_seen[0].card_type if self.future_seen else None
+        risk_level = None
+        if self.risk_in_state:
+            kittens, known = self.known_deck()
+            risk_level = kitten_risk(len(game.deck), game.players_left - 1, kittens, known)[1]
+        return encode_game_state(
+            hand,
+            sorted([len(opp.hand) for opp in opponents]),
+            len(game.deck),
+            future,
+            game.attack_counter,
+            player_hand['Defuse'],
+            opp_defuses,
+            risk_level
+        )
 
     # player makes a turn
     def player_card_play(self, game):
         # 50/50 of playing a card or not
-        opponent_hand_sizes = [len(opp.hand) for opp in self.other_players]
-        playing = random.randrange(0, 2)
+        # whether anyone can be stolen from is only checked at the start of the turn
+        can_steal = self.can_steal()
+        playing = self.rng.randrange(0, 2)
         while playing == 1 and not self.skipping:
             game_state = self.get_game_state(game)
             # get all possible actions for a player
@@ -93,19 +319,19 @@ class Player:
                 if card_type != 'Defuse':
                     # need two or more like cat cards to play
                     if card_type in ['Cattermelon', 'Tacocat', 'Rainbow-Ralphing Cat']:
-                        if 0 not in opponent_hand_sizes:
+                        if can_steal:
                             if player_hand[card_type] > 1:
                                 possible_actions.append(card_type)
                     # otherwise only one card is needed
                     elif card_type == 'Favor':
-                        if 0 not in opponent_hand_sizes:
+                        if can_steal:
                             possible_actions.append(card_type)
                     else:
                         possible_actions.append(card_type)
             # if a move can be made, decide which move to make
             if possible_actions:
                 # randomly select an action and play the appropriate card(s)
-                action = possible_actions[random.randrange(len(possible_actions))]
+                action = possible_actions[self.rng.randrange(len(possible_actions))]
                 game.last_played = Card(action)
                 game.play_card(self, action)
                 if action in ['Rainbow-Ralphing Cat', 'Tacocat', 'Cattermelon']:
@@ -114,7 +340,7 @@ class Player:
                     self.actions.append(action)
                 self.game_states.append(game_state)
             # randomly decide to play another card or not
-            playing = random.randrange(0, 2)
+            playing = self.rng.randrange(0, 2)
         game_state = self.get_game_state(game)
         self.actions.append('Finish Turn')
         self.game_states.append(game_state)
@@ -175,63 +401,86 @@ class SmartPlayer(NonRandomPlayer):
 class ObservedPolicyPlayer(SmartPlayer):
     def __init__(self, ID):
         super().__init__(ID)
-        self.policy = {}
+        self.policy = PolicyTable()
 
     def __repr__(self):
         return 'Observed-Policy PLayer'
 
-    def train(self, player_type):
-        policy = {}
-        for i in range(2500000):
-            players = [
-                player_type('Player1'),
-                player_type('Player2')
-            ]
-            game = Game(players)
-            game.start_game()
-            winner = game.decide_winner()
-            for player in players:
-                states_seen = player.game_states
-                actions = player.actions
-                did_win = player.player_ID == winner
-                moves = len(states_seen)
-                move_on = 0
-                while move_on < moves:
-                    state = states_seen[move_on]
-                    action = actions[move_on]
-                    if state not in policy.keys():
-                        policy[state] = {}
-                    if action not in policy[state].keys():
-                        policy[state][action] = {
-                            'win': 0,
-                            'loss': 0
-                        }
-                    if did_win:
-                        policy[state][action]['win'] += 1
-                    else:
-                        policy[state][action]['loss'] += 1
-                    move_on += 1
-        self.policy = policy
+    # observe num_games games between num_players player_type agents and build a win/loss policy from them
+    # with workers > 1 the games are split across a process pool and the partial policies are merged
+    def train(self, player_type, num_games=2500000, workers=1, seed=None, num_players=2):
+        if workers <= 1:
+            self.policy = observe_games(player_type, num_games, seed, num_players=num_players)
+            self.policy.index_best_actions()
+            return
+        with multiprocessing.Pool(workers) as pool:
+            partial_policies = pool.map(_observe_games_job, worker_jobs(player_type, num_games, workers, seed,
+                                                                        num_players))
+        self.policy = merge_policies(partial_policies)
+        self.policy.index_best_actions()
+
+    # keep adding games to the policy saved at path, with checkpoints, until it levels off (see train_policy_online)
+    def train_online(self, player_type, path, max_games, checkpoint_games=100000, tolerance=0.001, seed=None,
+                     num_players=2, first_game=None):
+        self.policy, _ = train_policy_online(path, aggregate_win_loss, player_type, max_games, checkpoint_games,
+                                             tolerance, seed, num_players, first_game)
+
+    # the policy lookups of one turn as a generator: for every lookup it yields the actions to exclude and is sent
+    # the policy's best action for the player's current game state, so a turn can be played one lookup at a time
+    # (player_card_play) or with the lookups of many games batched together (see batch_decisions.py)
+    def policy_turn(self, game):
+        action = yield from self.best_move_lookup(game)
+        opponent_hands = [len(opp.hand) for opp in self.other_players]
+        if action in ['Cat', 'Favor'] and 0 in opponent_hands:
+            action = yield from self.best_move_lookup(game, INDEPENDENT_EXCLUDE)
+        # best_move_lookup falls back to a random move, so there always is an action
+        while action != 'Finish Turn':
+            action = self.card_to_play(game, action)
+            if action == 'Finish Turn':
+                break
+            game.last_played = Card(action)
+            game.play_card(self, action)
+            action = yield from self.best_move_lookup(game)
+            opponent_hands = [len(opp.hand) for opp in self.other_players]
+            if action in ['Cat', 'Favor'] and 0 in opponent_hands:
+                action = yield from self.best_move_lookup(game, INDEPENDENT_EXCLUDE)
+
+    # the card to play for a policy move: a 'Cat' move plays one of the cat pairs in the hand, and if the hand has
+    # none the move cannot be made, so a random legal move is made instead (which may be 'Finish Turn')
+    def card_to_play(self, game, action):
+        if action != 'Cat':
+            return action
+        player_hand = Counter([card.card_type for card in self.hand])
+        for possible_cat in ['Rainbow-Ralphing Cat', 'Tacocat', 'Cattermelon']:
+            if possible_cat in player_hand and player_hand[possible_cat] > 1:
+                action = possible_cat
+        if action == 'Cat':
+            return self.random_move(game)
+        return action
+
+    # the policy's best move for the current game state, or a random move if the policy has none
+    def best_move_lookup(self, game, exclude=()):
+        action = yield exclude
+        return action if action is not None else self.random_move(game)
+
+    # answer the lookups of a generator like policy_turn from this player's policy and return what it returns
+    def run_lookups(self, game, lookups):
+        best_action = self.policy.best_action
+        try:
+            exclude = next(lookups)
+            while True:
+                exclude = lookups.send(best_action(self.get_game_state(game), exclude))
+        except StopIteration as stop:
+            return stop.value
 
     # player makes a turn
     def policy_best_independent_move(self, game):
-        game_state = self.get_game_state(game)
-        if game_state in self.policy.keys():
-            precedent = self.policy[game_state]
-            probabilities = {}
-            for action in precedent.keys():
-                if action not in ['Cat', 'Favor']:
-                    wins = precedent[action]['win']
-                    losses = precedent[action]['loss']
-                    probabilities[action] = wins / (wins + losses)
-            return max(probabilities, key=probabilities.get) if probabilities else self.random_move(game)
-        else:
-            return self.random_move(game)
+        return self.run_lookups(game, self.best_move_lookup(game, INDEPENDENT_EXCLUDE))
 
     def random_move(self, game):
         # 50/50 of playing a card or not
-        opponent_hand_sizes = [len(opp.hand) for opp in self.other_players]
-        playing = random.randrange(0, 2)
+        can_steal = self.can_steal()
+        playing = self.rng.randrange(0, 2)
         if playing == 0:
             return 'Finish Turn'
         game_state = self.get_game_state(game)
@@ -249,65 +498,27 @@ class ObservedPolicyPlayer(SmartPlayer):
             if card_type != 'Defuse':
                 # need two or more like cat cards to play
                 if card_type in ['Cattermelon', 'Tacocat', 'Rainbow-Ralphing Cat']:
-                    if 0 not in opponent_hand_sizes:
+                    if can_steal:
                         if player_hand[card_type] > 1:
                             possible_actions.append(card_type)
                 # otherwise only one card is needed
                 elif card_type == 'Favor':
-                    if 0 not in opponent_hand_sizes:
+                    if can_steal:
                         possible_actions.append(card_type)
                 else:
                     possible_actions.append(card_type)
         # if a move can be made, decide which move to make
         if possible_actions:
             # randomly select an action and play the appropriate card(s)
-            return possible_actions[random.randrange(len(possible_actions))]
+            return possible_actions[self.rng.randrange(len(possible_actions))]
         return 'Finish Turn'
 
     # player makes a turn
     def policy_best_move(self, game):
-        game_state = self.get_game_state(game)
-        if game_state in self.policy.keys():
-            precedent = self.policy[game_state]
-            probabilities = {}
-            for action in precedent.keys():
-                wins = precedent[action]['win']
-                losses = precedent[action]['loss']
-                probabilities[action] = wins / (wins + losses)
-            return max(probabilities, key=probabilities.get) if probabilities else self.random_move(game)
-        else:
-            return self.random_move(game)
-
-        # player makes a turn
+        return self.run_lookups(game, self.best_move_lookup(game))
 
     def player_card_play(self, game):
-        action = self.policy_best_move(game)
-        if action is None:
-            super().player_card_play(game)
-        else:
-            opponent_hands = [len(opp.hand) for opp in self.other_players]
-            if action in ['Cat', 'Favor'] and 0 in opponent_hands:
-                action = self.policy_best_independent_move(game)
-            while action != 'Finish Turn':
-                if action is None:
-                    super().player_card_play(game)
-                else:
-                    if action == 'Cat':
-                        player_hand = Counter([card.card_type for card in self.hand])
-                        for possible_cat in ['Rainbow-Ralphing Cat', 'Tacocat', 'Cattermelon']:
-                            if possible_cat in player_hand and player_hand[possible_cat] > 1:
-                                action = possible_cat
-                    if action == 'Cat':
-                        print(self.hand)
-                        print("NOOOOOOOOOOOOOOOOOOO")
-                    game.last_played = Card(action)
-                    game.play_card(self, action)
-                    action = self.policy_best_move(game)
-                    opponent_hands = [len(opp.hand) for opp in self.other_players]
-                    if action in ['Cat', 'Favor'] and 0 in opponent_hands:
-                        action = self.policy_best_independent_move(game)
-
-                    # a class for a card
+        self.run_lookups(game, self.policy_turn(game))
 
 
 # An agent that is going to watch a lot of games, and see which moves in different states
@@ -316,56 +527,36 @@ class ObservedPolicyPlayer(SmartPlayer):
 class SurvivalAgent(ObservedPolicyPlayer):
     def __init__(self, ID):
         super().__init__(ID)
-        self.policy = {}
+        self.policy = ValueTable()
 
-    def train(self, player_type):
-        policy = {}
-        iters = 50000
-        for i in range(iters):
-            if i % (iters / 10) == 0:
-                print(str((i / iters) * 100) + "%")
-            players = [
-                player_type('Player1'),
-                player_type('Player2')
-            ]
-            game = Game(players)
-            game.start_game()
-            for player in players:
-                states_seen = player.game_states
-                actions_taken = player.actions
-                num_moves = len(states_seen)
-                # Cycle through moves and assign reward, either a flat reward for
-                # length of moves, or reward based on how many more moves are survived
-                for pos, state in enumerate(states_seen):
-                    curr_action = actions_taken[pos]
-                    if state not in policy.keys():
-                        # state -> {action, value}
-                        policy[state] = {}
-                    if curr_action not in policy[state].keys():
-                        policy[state][curr_action] = 0
-                    policy[state][curr_action] = (policy[state][curr_action] + num_moves) / 2
-        self.policy = policy
+    # Cycle through the moves of num_games observed games and assign reward, the mean length of the games
+    # each move was made in; with several workers, each one keeps its own sums and counts and they are merged
+    def train(self, player_type, num_games=50000, workers=1, seed=None, num_players=2):
+        if workers <= 1:
+            self.policy = observe_survival(player_type, num_games, seed, progress=True, num_players=num_players)
+        else:
+            with multiprocessing.Pool(workers) as pool:
+                self.policy = merge_policies(pool.map(_observe_survival_job, worker_jobs(player_type, num_games,
+                                                                                         workers, seed, num_players)))
+        self.policy.index_best_actions()
+
+    def train_online(self, player_type, path, max_games, checkpoint_games=100000, tolerance=0.001, seed=None,
+                     num_players=2, first_game=None):
+        self.policy, _ = train_policy_online(path, aggregate_survival, player_type, max_games, checkpoint_games,
+                                             tolerance, seed, num_players, first_game)
 
     def policy_best_move(self, game):
         game_state = self.get_game_state(game)
-        if game_state in self.policy.keys():
-            actions = self.policy[game_state]
-            best_action = max(actions, key=actions.get)
-            return best_action
-        else:
-            return None
+        return self.policy.best_action(game_state)
 
-    def player_card_play(self, game):
-        action = self.policy_best_move(game)
+    # the lookups of one turn (see ObservedPolicyPlayer.policy_turn); Favor and cat pairs are left out while there is
+    # nobody to steal from, since a Favor nobody can answer goes back into the hand and would be played again forever
+    def policy_turn(self, game):
+        action = yield () if self.can_steal() else INDEPENDENT_EXCLUDE
         while action != 'Finish Turn':
-            if action == 'Cat':
-                player_hand = Counter([card.card_type for card in self.hand])
-                for possible_cat in ['Rainbow-Ralphing Cat', 'Tacocat', 'Cattermelon']:
-                    if possible_cat in player_hand and player_hand[possible_cat] > 1:
-                        action = possible_cat
-            if action == 'Cat':
-                print(self.hand)
-                print("NOOOOOOOOOOOOOOOOOOO")
+            action = self.card_to_play(game, action)
+            if action == 'Finish Turn':
+                break
 
             # ========== I added this clause to just return if the action is None cause it was giving ============== #
             # ========== an error, lmk if there is something better to be done but this seems to work ============== #
@@ -374,7 +565,7 @@ class SurvivalAgent(ObservedPolicyPlayer):
                 return
             game.last_played = Card(action)
             game.play_card(self, action)
-            action = self.policy_best_move(game)
+            action = yield () if self.can_steal() else INDEPENDENT_EXCLUDE
 
 
 class Card:
@@ -389,35 +580,134 @@ class Card:
         return str(self.card_type)
 
 
+# call counts and cumulative time of the instrumented parts of a game, added up over every Game it is passed to
+# Game(players, profile) swaps its own methods for timed wrappers on that one instance, so a Game without a
+# profile runs exactly the code it always did and pays nothing
+# timings are inclusive: play_game contains take_turn, which contains the card functions, draws and lookups
+class GameProfile:
+    def __init__(self):
+        self.calls = Counter()
+        self.times = Counter()
+
+    # a version of function that counts its calls and time under name
+    def timed(self, name, function):
+        calls = self.calls
+        times = self.times
+        perf_counter = time.perf_counter
+
+        def timed_function(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                times[name] += perf_counter() - start
+                calls[name] += 1
+        return timed_function
+
+    # add the counts of another profile, e.g. one from each worker of a training run
+    def merge(self, other):
+        self.calls.update(other.calls)
+        self.times.update(other.times)
+
+    def summary(self):
+        lines = [f"{'':<36}{'calls':>12}{'total s':>12}{'per call us':>14}"]
+        for name, total in self.times.most_common():
+            calls = self.calls[name]
+            lines.append(f"{name:<36}{calls:>12}{total:>12.3f}{total / calls * 1e6:>14.2f}")
+        return '\n'.join(lines)
+
+    def to_dict(self):
+        return {name: {'calls': self.calls[name], 'seconds': self.times[name]} for name in self.times}
+
+    # write the profile as JSON, {name: {'calls': n, 'seconds': s}}
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        profile = cls()
+        with open(path) as f:
+            for name, entry in json.load(f).items():
+                profile.calls[name] = entry['calls']
+                profile.times[name] = entry['seconds']
+        return profile
+
+
+# a policy whose lookups are timed by a GameProfile; everything else goes to the wrapped policy
+class ProfiledPolicy:
+    def __init__(self, policy, profile):
+        self.policy = policy
+        self.best_action = profile.timed('policy_lookup', policy.best_action)
+
+    def __getattr__(self, name):
+        return getattr(self.policy, name)
+
+
+# the events a Game records with record_events=True, in a fixed order so an event can be stored as a small integer
+# every event is two bytes, the event code << 3 | the seat of the player it happened to, then one argument byte:
+#   Deal     a player's starting hand; the argument is the number of cards, followed by that many card codes
+#   Deck     the whole draw pile, bottom to top, after the deal or a Shuffle; encoded like Deal
+#   Turn     a player's turn starts; the argument is the attack counter
+#   Play     a player plays a card (a cat pair counts as one play); the argument is the card code
+#   Steal    a player takes a card with a Favor or a cat pair; the argument is the target's seat << 4 | the card code
+#   Return   a Favor nobody could be asked for goes back to the hand it was played from
+#   Draw     a player draws a card that is not an Exploding Kitten; the argument is the card code
+#   Defuse   a player draws an Exploding Kitten and uses a Defuse
+#   Insert   the defused Exploding Kitten goes back into the deck; the argument is its spot counted from the top
+#   Explode  a player draws an Exploding Kitten without a Defuse and is out
+# game_log.py writes recorded games to disk and replays them
+GAME_EVENTS = ('Deal', 'Deck', 'Turn', 'Play', 'Steal', 'Return', 'Draw', 'Defuse', 'Insert', 'Explode')
+EVENT_CODES = {event: code for code, event in enumerate(GAME_EVENTS)}
+DEAL_EVENT = EVENT_CODES['Deal']
+DECK_EVENT = EVENT_CODES['Deck']
+TURN_EVENT = EVENT_CODES['Turn']
+PLAY_EVENT = EVENT_CODES['Play']
+STEAL_EVENT = EVENT_CODES['Steal']
+RETURN_EVENT = EVENT_CODES['Return']
+DRAW_EVENT = EVENT_CODES['Draw']
+DEFUSE_EVENT = EVENT_CODES['Defuse']
+INSERT_EVENT = EVENT_CODES['Insert']
+EXPLODE_EVENT = EVENT_CODES['Explode']
+
+
 # a class for one game of Exploding Kittens
 # most of this class can be ignored as it does not related to the AI implementation directly and merely defines the course of the game
 class Game:
-    def __init__(self, players):
+    def __init__(self, players, profile=None, rng=None, record_events=False):
+        # the game's own RNG, which every player in it uses too; without one it is seeded from the global RNG, so
+        # seeding random still makes a run reproducible
+        self.rng = rng if rng is not None else random.Random(random.getrandbits(64))
+        for player in players:
+            player.rng = self.rng
         # the most recently-played card
         self.last_played = None
         # number of players
         self.num_players = len(players)
+        check_num_players(self.num_players)
         # the hand size for players
         self.hand_size = 7
         # the number of exploding kittens in the deck
         self.exploding_kittens = self.num_players - 1
+        # the deck grows with the table (see deck_card_counts)
+        deck_counts = deck_card_counts(self.num_players)
         # the number of Attack cards
-        self.attacks = 4
+        self.attacks = deck_counts['Attack']
         # the number of Skip cards
-        self.skips = 4
+        self.skips = deck_counts['Skip']
         # the number of StF cards
-        self.see_the_futures = 3
+        self.see_the_futures = deck_counts['See The Future']
         # the number of Shuffle cards
-        self.shuffles = 2
+        self.shuffles = deck_counts['Shuffle']
         # the number of Favor cards
-        self.favors = 2
+        self.favors = deck_counts['Favor']
         # the number of Tacocat cards
-        self.tacocats = 3
+        self.tacocats = deck_counts['Tacocat']
         # the number of Cattermelon cards
-        self.cattermelons = 3
+        self.cattermelons = deck_counts['Cattermelon']
         # the number of RRC cards
-        self.rainbow_ralphing_cats = 3
-        # the deck/draw pile
+        self.rainbow_ralphing_cats = deck_counts['Rainbow-Ralphing Cat']
+        # the deck/draw pile, stored bottom to top so the top card is the last element and draws are O(1)
         self.deck = []
         # the list of Players
         self.player_list = players
@@ -427,6 +717,18 @@ class Game:
         self.players_left = self.num_players
         # the number of queued attacks
         self.attack_counter = 0
+        # how many times the deck has been reordered by a Shuffle or a replanted Exploding Kitten; everyone sees
+        # these happen, so a player can tell when what it knew about the order of the deck stopped being true
+        self.deck_changes = 0
+        # card counts of each player's hand, indexed by card code, kept up to date as cards move
+        self.hand_counts = {}
+        # the cached parts of each player's state key (see state_key); None means it has to be recomputed
+        self.hand_keys = {}
+        self.opponent_keys = {}
+        # each player's seat, the index used for them in recorded events
+        self.seats = {player: seat for seat, player in enumerate(players)}
+        # the game's events so far (see GAME_EVENTS), or None if they are not recorded
+        self.events = bytearray() if record_events else None
         # a map of cards and their behavior
         self.card_functions = {
             'Attack': self.play_attack,
@@ -438,6 +740,72 @@ class Game:
             'Cattermelon': self.play_cat,
             'Rainbow-Ralphing Cat': self.play_cat
         }
+        self.profile = profile
+        if profile is not None:
+            self.instrument(profile)
+
+    # time the card functions, turns, draws, state encoding and policy lookups of this game into a GameProfile
+    def instrument(self, profile):
+        self.card_functions = {card_type: profile.timed(f'card_function.{card_type}', function)
+                               for card_type, function in self.card_functions.items()}
+        for name in ['start_game', 'play_game', 'take_turn', 'draw_card']:
+            setattr(self, name, profile.timed(name, getattr(self, name)))
+        self.state_key = profile.timed('state_encoding', self.state_key)
+        for player in self.player_list:
+            if getattr(player, 'policy', None) is not None:
+                player.policy = ProfiledPolicy(player.policy, profile)
+
+    # every card that enters or leaves a hand goes through these two, so the hand counts and cached state keys
+    # stay current
+    def add_to_hand(self, player, card):
+        player.hand.append(card)
+        self.hand_counts[player][CARD_CODES[card.card_type]] += 1
+        self.hand_changed(player)
+
+    def remove_from_hand(self, player, card):
+        player.hand.remove(card)
+        self.hand_counts[player][CARD_CODES[card.card_type]] -= 1
+        self.hand_changed(player)
+
+    # add an event to the recording; callers check that events are recorded first, so a plain game pays nothing
+    def record(self, event, player, argument=0):
+        self.events.extend((event << 3 | self.seats[player], argument))
+
+    # a Deal or Deck event followed by the codes of its cards
+    def record_cards(self, event, player, cards):
+        self.record(event, player, len(cards))
+        self.events.extend([CARD_CODES[card.card_type] for card in cards])
+
+    # a player's own hand part is stale, and so is the opponent part of everyone else
+    def hand_changed(self, player):
+        self.hand_keys[player] = None
+        for p in self.player_list:
+            if p is not player:
+                self.opponent_keys[p] = None
+
+    # the encoded game state (see encode_game_state) of a player
+    # the hand and opponent parts are cached and only rebuilt after a hand changes; the deck size, attack counter
+    # and future card are read fresh since they are single integers
+    def state_key(self, player):
+        hand_key = self.hand_keys[player]
+        if hand_key is None:
+            counts = self.hand_counts[player]
+            hand_key = hand_bits(counts) | counts[DEFUSE_CODE] << DEFUSES_OWNED_SHIFT
+            self.hand_keys[player] = hand_key
+        opponent_key = self.opponent_keys[player]
+        if opponent_key is None:
+            opponents = player.living_opponents()
+            opponent_key = opponent_state_key(sum(self.hand_counts[opp][DEFUSE_CODE] for opp in opponents),
+                                              sorted([len(opp.hand) for opp in opponents]))
+            self.opponent_keys[player] = opponent_key
+        key = hand_key | opponent_key | len(self.deck) << DECK_SIZE_SHIFT | self.attack_counter << ATTACK_SHIFT
+        if player.future_seen:
+            key |= (CARD_CODES[player.future_seen[0].card_type] + 1) << FUTURE_SHIFT
+        if player.risk_in_state:
+            kittens, known = player.known_deck()
+            risk_level = kitten_risk(len(self.deck), self.players_left - 1, kittens, known)[1]
+            key |= risk_state_key(risk_level, self.players_left - 1)
+        return key
 
     def do_nothing(self, player):
         print("This card does nothing!")
@@ -450,51 +818,69 @@ class Game:
         player.skipping = True
 
     def play_see_the_future(self, player):
-        max_deck_index = len(self.deck) - 1
-        card_on = 0
-        future = []
-        while card_on <= max_deck_index and card_on < 3:
-            future.append(self.deck[card_on])
-            card_on += 1
-        player.future_seen = future
+        # the top three cards, top card first
+        player.future_seen = self.deck[:-4:-1]
 
     def play_shuffle(self, player):
         self.shuffle_deck()
+        self.deck_changes += 1
+        if self.events is not None:
+            self.record_cards(DECK_EVENT, player, self.deck)
         for p in self.player_list:
             p.future_seen = []
+            p.kitten_depth = None
 
     def play_favor(self, player):
         other_players = list(filter(lambda p: p != player and len(p.hand) > 0 and p.alive, self.player_list))
         if len(other_players) == 0:
-            player.hand.append(self.last_played)
+            self.add_to_hand(player, self.last_played)
+            if self.events is not None:
+                self.record(RETURN_EVENT, player)
         else:
             target_player = player.choose_favor_target()
             card_given = target_player.give_card(player)
-            target_player.hand.remove(card_given)
-            player.hand.append(card_given)
+            if self.events is not None:
+                self.record(STEAL_EVENT, player, self.seats[target_player] << 4 | CARD_CODES[card_given.card_type])
+            self.remove_from_hand(target_player, card_given)
+            self.add_to_hand(player, card_given)
             # print(f"{target_player.player_ID} gives a(n) {card_given.card_type} to {player.player_ID}")
 
     def play_cat(self, player):
         other_players = list(filter(lambda p: p != player and len(p.hand) > 0 and p.alive, self.player_list))
         if len(other_players) != 0:
             target_player = player.choose_cat_target()
-            card_given = random.choice(target_player.hand)  # choice is always random
-            target_player.hand.remove(card_given)
-            player.hand.append(card_given)
+            card_given = self.rng.choice(target_player.hand)  # choice is always random
+            if self.events is not None:
+                self.record(STEAL_EVENT, player, self.seats[target_player] << 4 | CARD_CODES[card_given.card_type])
+            self.remove_from_hand(target_player, card_given)
+            self.add_to_hand(player, card_given)
             # print(f"{target_player.player_ID} gives a(n) {card_given.card_type} to {player.player_ID}")
 
     def play_game(self):
         while self.players_left > 1 and self.deck:
-            if self.attack_counter == 0:
-                self.turn = self.turn + 1 if self.turn < len(self.player_list) - 1 else 0
-            else:
-                self.attack_counter -= 1
-            player_on = self.player_list[self.turn]
+            player_on = self.next_turn()
             if player_on.alive:
                 self.take_turn(player_on)
 
+    # move on to the next turn, which stays with the same player while attacks are queued, and return its player
+    def next_turn(self):
+        if self.attack_counter == 0:
+            self.turn = self.turn + 1 if self.turn < len(self.player_list) - 1 else 0
+        else:
+            self.attack_counter -= 1
+        return self.player_list[self.turn]
+
+    # a turn is begin_turn, the player's card play and end_turn; batch_decisions.py plays the middle part itself
     def take_turn(self, player):
+        self.begin_turn(player)
         player.player_card_play(self)
+        self.end_turn(player)
+
+    def begin_turn(self, player):
+        if self.events is not None:
+            self.record(TURN_EVENT, player, self.attack_counter)
+
+    def end_turn(self, player):
         if not player.skipping:
             self.draw_card(player)
         else:
@@ -502,65 +888,106 @@ class Game:
             player.skipping = False
 
     def play_card(self, player, action):
+        if self.events is not None:
+            self.record(PLAY_EVENT, player, CARD_CODES[action])
         if action in ['Cattermelon', 'Tacocat', 'Rainbow-Ralphing Cat']:
             for card in player.hand:
                 if card.card_type == action:
                     # print(f"{player.player_ID} plays {action}")
-                    player.hand.remove(card)
+                    self.remove_from_hand(player, card)
                     break
         for card in player.hand:
             if card.card_type == action:
                 # print(f"{player.player_ID} plays {action}")
-                player.hand.remove(card)
+                self.remove_from_hand(player, card)
                 break
         self.card_functions[action](player)
 
     def reinsert_exploding_kitten(self, player, card, deck_size):
+        # spots count down from the top of the deck, which is the end of the list
         spot = player.choose_spot_in_deck(deck_size)
-        self.deck.insert(spot, card)
+        if self.events is not None:
+            self.record(INSERT_EVENT, player, spot)
+        self.deck.insert(len(self.deck) - spot, card)
+        return spot
 
     def draw_card(self, player):
-        next_card = self.deck.pop(0)
+        next_card = self.deck.pop()
         # print(f"{player.player_ID} draws a(n) {next_card.card_type}")
         if next_card.card_type == 'Exploding Kitten':
-            if 'Defuse' in [card.card_type for card in player.hand]:
+            if self.hand_counts[player][DEFUSE_CODE] > 0:
                 # print(f"{player.player_ID} uses a Defuse!")
+                if self.events is not None:
+                    self.record(DEFUSE_EVENT, player)
                 for card in player.hand:
                     if card.card_type == 'Defuse':
-                        player.hand.remove(card)
+                        self.remove_from_hand(player, card)
                         break
-                self.reinsert_exploding_kitten(player, next_card, len(self.deck) + 1)
+                spot = self.reinsert_exploding_kitten(player, next_card, len(self.deck) + 1)
+                self.deck_changes += 1
                 for p in self.player_list:
                     p.future_seen = []
+                    p.kitten_depth = None
+                player.kitten_depth = spot
             else:
                 # print(f"{player.player_ID} EXPLODES!")
+                if self.events is not None:
+                    self.record(EXPLODE_EVENT, player)
                 player.alive = False
                 self.players_left -= 1
+                # the player drops out of everyone's opponents
+                for p in self.player_list:
+                    self.opponent_keys[p] = None
+                self.card_drawn()
         else:
-            player.hand.append(next_card)
-            for p in self.player_list:
-                if len(p.future_seen) > 0:
-                    del p.future_seen[0]
+            if self.events is not None:
+                self.record(DRAW_EVENT, player, CARD_CODES[next_card.card_type])
+            self.add_to_hand(player, next_card)
+            self.card_drawn()
         for p in self.player_list:
             p.deck_size = len(self.deck)
 
+    # the top card is gone, exploded or not, so everything players knew about the deck moves up by one
+    def card_drawn(self):
+        for p in self.player_list:
+            if len(p.future_seen) > 0:
+                del p.future_seen[0]
+            if p.kitten_depth is not None:
+                p.kitten_depth = p.kitten_depth - 1 if p.kitten_depth > 0 else None
+
     def start_game(self):
+        self.deal()
+        self.play_game()
+
+    # shuffle, deal and put the Exploding Kittens in the deck
+    def deal(self):
         self.initialize_deck()
+        self.seat_players()
         for player in self.player_list:
-            player.other_players = list(filter(lambda p: p != player, self.player_list))
-            player.hand.append(Card('Defuse'))
+            self.add_to_hand(player, Card('Defuse'))
         for i in range(self.hand_size - 1):
             for player in self.player_list:
-                player.hand.append(self.deck.pop(0))
+                self.add_to_hand(player, self.deck.pop())
         for i in range(self.exploding_kittens):
             self.deck.append(Card('Exploding Kitten'))
         for player in self.player_list:
             player.deck_size = len(self.deck)
         self.shuffle_deck()
-        self.play_game()
+        if self.events is not None:
+            for player in self.player_list:
+                self.record_cards(DEAL_EVENT, player, player.hand)
+            self.record_cards(DECK_EVENT, self.player_list[0], self.deck)
+
+    # introduce the players to each other and start tracking their (empty) hands
+    def seat_players(self):
+        for player in self.player_list:
+            player.other_players = list(filter(lambda p: p != player, self.player_list))
+            self.hand_counts[player] = [0] * len(CARD_TYPES)
+            self.hand_keys[player] = None
+            self.opponent_keys[player] = None
 
     def shuffle_deck(self):
-        random.shuffle(self.deck)
+        self.rng.shuffle(self.deck)
 
     def initialize_deck(self):
         for i in range(self.attacks):
@@ -587,103 +1014,782 @@ class Game:
                 return player.player_ID
 
 
-if __name__ == "__main__":
-    random_player = Player('Player1')
-    random_player2 = Player('Player2')
-    nonrandom_player = NonRandomPlayer('Player2')
-    nonrandom_player_1 = NonRandomPlayer('Player1')
-    smart_player = SmartPlayer('Player2')
-
-    survival_player = SurvivalAgent('Player2')
-    print('Training Survival Agent...')
-    survival_player.train(Player)
-    surv_policy = survival_player.policy
-
-    observed_policy_player = ObservedPolicyPlayer('Player2')
-    print("Training OPP...")
-    observed_policy_player.train(SmartPlayer)
-    opp_policy = observed_policy_player.policy
-
-    print("Simulating Random v Random")
-    players = [
-        random_player,
-        random_player2
-    ]
-    wins = {player.player_ID: 0 for player in players}
-    for i in range(500):
-        players = [Player('Player1'), Player('Player2')]
-        game = Game(players)
-        game.start_game()
-        wins[game.decide_winner()] += 1
-    print(f"RESULTS (P1 is random): {wins}")
+# every action a policy keeps statistics for, in a fixed order so an action can be stored as a column index
+POLICY_ACTIONS = ('Attack', 'Skip', 'See The Future', 'Shuffle', 'Favor', 'Cat', 'Finish Turn')
+POLICY_ACTION_CODES = {action: code for code, action in enumerate(POLICY_ACTIONS)}
+NUM_POLICY_ACTIONS = len(POLICY_ACTIONS)
+
+
+# pick the action with the best win rate out of one row of a win/loss table
+# order holds the position each action was first seen in for the state (0 = never seen), and ties go
+# to the earliest one, which is the action max() picked when policies were dicts of dicts
+# actions played in fewer than min_visits games are left out, so a lookup can ask for enough evidence
+def best_row_action(wins, losses, order, start, exclude=(), min_visits=1):
+    best_action = None
+    best_rate = -1.0
+    best_seen = 0
+    for code in range(NUM_POLICY_ACTIONS):
+        seen = order[start + code]
+        if seen == 0 or POLICY_ACTIONS[code] in exclude:
+            continue
+        won = wins[start + code]
+        visits = won + losses[start + code]
+        if visits < min_visits:
+            continue
+        rate = won / visits
+        if rate > best_rate or (rate == best_rate and seen < best_seen):
+            best_action = POLICY_ACTIONS[code]
+            best_rate = rate
+            best_seen = seen
+    return best_action
+
+
+# the moves an ObservedPolicyPlayer leaves out when it has no one to steal from
+INDEPENDENT_EXCLUDE = ('Cat', 'Favor')
+# an entry of a best-action index is 0 if no action is allowed, otherwise the policy action code + 1
+INDEXED_ACTIONS = (None,) + POLICY_ACTIONS
+
+
+# precompute the best action of every row, two bytes per row: the unrestricted best and the best with
+# INDEPENDENT_EXCLUDE left out
+# scores and allowed hold the score of every cell and whether it can be picked at all; the whole table is done at
+# once with an argmax over its rows, which picks exactly what best_row_action and the like do: the best score, ties
+# going to the action seen first
+def build_best_action_index(scores, allowed, order):
+    order = np.asarray(order, dtype=np.uint8).reshape(-1, NUM_POLICY_ACTIONS)
+    scores = scores.reshape(order.shape)
+    allowed = allowed.reshape(order.shape) & (order > 0)
+    index = np.zeros((len(order), 2), dtype=np.uint8)
+    for column, exclude in enumerate(((), INDEPENDENT_EXCLUDE)):
+        picked = allowed & np.array([action not in exclude for action in POLICY_ACTIONS])
+        row_scores = np.where(picked, scores, -np.inf)
+        ties = picked & (row_scores == row_scores.max(axis=1, initial=-np.inf)[:, None])
+        # orders run 1-7, so 255 never wins a tie
+        codes = np.where(ties, order, 255).argmin(axis=1)
+        index[:, column] = np.where(picked.any(axis=1), codes + 1, 0)
+    return array('B', index.tobytes())
+
+
+# the best-action index of win/loss columns: the best win rate out of the actions played at least once
+def win_loss_index(wins, losses, order):
+    wins = np.asarray(wins, dtype=np.float64)
+    visits = wins + np.asarray(losses, dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return build_best_action_index(wins / visits, visits >= 1, order)
+
+
+# the best-action index of sum/count columns: the best mean out of the actions played at least once
+def mean_index(sums, counts, order):
+    counts = np.asarray(counts, dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return build_best_action_index(np.asarray(sums, dtype=np.float64) / counts, counts >= 1, order)
+
+
+# the best-action index of value columns: the best value out of the actions seen
+def value_index(values, order):
+    values = np.asarray(values, dtype=np.float64)
+    return build_best_action_index(values, np.ones(values.shape, dtype=bool), order)
+
+
+# win/loss counts for every (state, action) pair, kept in flat arrays with one row per state
+# the only dict maps state keys to their row, which makes a trained policy a fraction of the size of a
+# dict of {'win': n, 'loss': n} dicts
+class PolicyTable:
+    def __init__(self):
+        # state key -> row index
+        self.states = {}
+        self.wins = array('I')
+        self.losses = array('I')
+        # the position each action was first seen in for its state, 0 if never seen
+        self.order = array('B')
+        # how many actions have been seen for each state
+        self.actions_seen = array('B')
+        # the precomputed best actions (see build_best_action_index), None until indexed or after a change
+        self.best_actions = None
+
+    def __len__(self):
+        return len(self.states)
+
+    def __contains__(self, state):
+        return state in self.states
+
+    # the row for a state, adding an empty row if the state is new
+    def row(self, state):
+        row = self.states.get(state)
+        if row is None:
+            row = len(self.states)
+            self.states[state] = row
+            self.wins.extend(EMPTY_POLICY_ROW)
+            self.losses.extend(EMPTY_POLICY_ROW)
+            self.order.extend(EMPTY_ORDER_ROW)
+            self.actions_seen.append(0)
+        return row
+
+    def record(self, state, action, did_win, count=1):
+        self.best_actions = None
+        row = self.row(state)
+        cell = row * NUM_POLICY_ACTIONS + POLICY_ACTION_CODES[action]
+        if self.order[cell] == 0:
+            self.actions_seen[row] += 1
+            self.order[cell] = self.actions_seen[row]
+        if did_win:
+            self.wins[cell] += count
+        else:
+            self.losses[cell] += count
+
+    # the action with the highest win rate in a state, or None if the state (or every allowed action in
+    # it) has never been seen
+    # once indexed, no exclusions and INDEPENDENT_EXCLUDE are answered straight from the index
+    def best_action(self, state, exclude=(), min_visits=1):
+        row = self.states.get(state)
+        if row is None:
+            return None
+        if self.best_actions is not None and min_visits <= 1 and (not exclude or exclude == INDEPENDENT_EXCLUDE):
+            return INDEXED_ACTIONS[self.best_actions[2 * row + (1 if exclude else 0)]]
+        return self.row_best(row * NUM_POLICY_ACTIONS, exclude, min_visits)
+
+    def row_best(self, start, exclude=(), min_visits=1):
+        return best_row_action(self.wins, self.losses, self.order, start, exclude, min_visits)
+
+    # build the best-action index; call it once the table is done changing
+    def index_best_actions(self):
+        self.best_actions = win_loss_index(self.wins, self.losses, self.order)
+
+    # the actions seen in a state, in the order they were first seen
+    def actions(self, state):
+        start = self.states[state] * NUM_POLICY_ACTIONS
+        seen = [(self.order[start + code], action) for code, action in enumerate(POLICY_ACTIONS)
+                if self.order[start + code]]
+        return [action for _, action in sorted(seen)]
+
+    # the number of games each action seen in a state was played in, in the order they were first seen
+    def visits(self, state):
+        start = self.states[state] * NUM_POLICY_ACTIONS
+        cells = {action: start + POLICY_ACTION_CODES[action] for action in self.actions(state)}
+        return {action: self.wins[cell] + self.losses[cell] for action, cell in cells.items()}
+
+    # add the counts of another table into this one
+    def merge(self, other):
+        for state, other_row in other.states.items():
+            other_start = other_row * NUM_POLICY_ACTIONS
+            for action in other.actions(state):
+                cell = other_start + POLICY_ACTION_CODES[action]
+                self.record(state, action, True, other.wins[cell])
+                self.record(state, action, False, other.losses[cell])
+
+    # the number of bytes used by the count arrays and the state index
+    def nbytes(self):
+        arrays = [self.wins, self.losses, self.order, self.actions_seen]
+        size = sum(a.itemsize * len(a) for a in arrays) + sys.getsizeof(self.states)
+        return size + sum(sys.getsizeof(state) for state in self.states)
+
+    # build a table from a policy in the old {state: {action: {'win': n, 'loss': n}}} form
+    @classmethod
+    def from_dict(cls, policy):
+        table = cls()
+        for state, actions in policy.items():
+            for action, record in actions.items():
+                table.record(state, action, True, record['win'])
+                table.record(state, action, False, record['loss'])
+        return table
+
+    # convert back to the {state: {action: {'win': n, 'loss': n}}} form
+    def to_dict(self):
+        policy = {}
+        for state, row in self.states.items():
+            start = row * NUM_POLICY_ACTIONS
+            policy[state] = {}
+            for action in self.actions(state):
+                cell = start + POLICY_ACTION_CODES[action]
+                policy[state][action] = {
+                    'win': self.wins[cell],
+                    'loss': self.losses[cell]
+                }
+        return policy
+
+
+EMPTY_POLICY_ROW = array('I', [0] * NUM_POLICY_ACTIONS)
+EMPTY_ORDER_ROW = array('B', [0] * NUM_POLICY_ACTIONS)
+EMPTY_VALUE_ROW = array('d', [0.0] * NUM_POLICY_ACTIONS)
+
+
+# pick the action with the highest value out of one row of a value table, ties going to the action seen first
+def best_value_action(values, order, start, exclude=()):
+    best_action = None
+    best_value = None
+    best_seen = 0
+    for code in range(NUM_POLICY_ACTIONS):
+        seen = order[start + code]
+        if seen == 0 or POLICY_ACTIONS[code] in exclude:
+            continue
+        value = values[start + code]
+        if best_value is None or value > best_value or (value == best_value and seen < best_seen):
+            best_action = POLICY_ACTIONS[code]
+            best_value = value
+            best_seen = seen
+    return best_action
+
+
+# pick the action with the highest mean out of one row of a sum/count table, ties going to the action seen first
+# actions played in fewer than min_visits games are left out
+def best_mean_action(sums, counts, order, start, exclude=(), min_visits=1):
+    best_action = None
+    best_value = None
+    best_seen = 0
+    for code in range(NUM_POLICY_ACTIONS):
+        seen = order[start + code]
+        visits = counts[start + code]
+        if seen == 0 or visits < min_visits or POLICY_ACTIONS[code] in exclude:
+            continue
+        value = sums[start + code] / visits
+        if best_value is None or value > best_value or (value == best_value and seen < best_seen):
+            best_action = POLICY_ACTIONS[code]
+            best_value = value
+            best_seen = seen
+    return best_action
+
+
+# the survival agent's value for every (state, action) pair, laid out like a PolicyTable
+# each pair keeps the total length of the games it was played in and how many games that was, so its value is the
+# mean over every game seen, and tables trained apart (e.g. by workers) merge by adding up their arrays
+class ValueTable:
+    def __init__(self):
+        # state key -> row index
+        self.states = {}
+        self.sums = array('d')
+        self.counts = array('I')
+        # the position each action was first seen in for its state, 0 if never seen
+        self.order = array('B')
+        # how many actions have been seen for each state
+        self.actions_seen = array('B')
+        # the precomputed best actions (see build_best_action_index), None until indexed or after a change
+        self.best_actions = None
+
+    def __len__(self):
+        return len(self.states)
+
+    def __contains__(self, state):
+        return state in self.states
+
+    # the cell for a state and action, adding an empty row if the state is new
+    def cell(self, state, action):
+        self.best_actions = None
+        row = self.states.get(state)
+        if row is None:
+            row = len(self.states)
+            self.states[state] = row
+            self.sums.extend(EMPTY_VALUE_ROW)
+            self.counts.extend(EMPTY_POLICY_ROW)
+            self.order.extend(EMPTY_ORDER_ROW)
+            self.actions_seen.append(0)
+        cell = row * NUM_POLICY_ACTIONS + POLICY_ACTION_CODES[action]
+        if self.order[cell] == 0:
+            self.actions_seen[row] += 1
+            self.order[cell] = self.actions_seen[row]
+        return cell
+
+    # add count games with a total length of num_moves to a state and action
+    def update(self, state, action, num_moves, count=1):
+        cell = self.cell(state, action)
+        self.sums[cell] += num_moves
+        self.counts[cell] += count
+
+    # the mean game length of a state and action, or None if it has never been seen
+    def value(self, state, action):
+        row = self.states.get(state)
+        if row is None:
+            return None
+        cell = row * NUM_POLICY_ACTIONS + POLICY_ACTION_CODES[action]
+        return self.sums[cell] / self.counts[cell] if self.counts[cell] else None
+
+    # the number of games each action seen in a state was played in, in the order they were first seen
+    def visits(self, state):
+        start = self.states[state] * NUM_POLICY_ACTIONS
+        return {action: self.counts[start + POLICY_ACTION_CODES[action]] for action in self.actions(state)}
+
+    # the action with the highest value in a state, or None if the state has never been seen
+    def best_action(self, state, exclude=(), min_visits=1):
+        row = self.states.get(state)
+        if row is None:
+            return None
+        if self.best_actions is not None and min_visits <= 1 and (not exclude or exclude == INDEPENDENT_EXCLUDE):
+            return INDEXED_ACTIONS[self.best_actions[2 * row + (1 if exclude else 0)]]
+        return self.row_best(row * NUM_POLICY_ACTIONS, exclude, min_visits)
+
+    def row_best(self, start, exclude=(), min_visits=1):
+        return best_mean_action(self.sums, self.counts, self.order, start, exclude, min_visits)
+
+    # build the best-action index; call it once the table is done changing
+    def index_best_actions(self):
+        self.best_actions = mean_index(self.sums, self.counts, self.order)
+
+    # the actions seen in a state, in the order they were first seen
+    def actions(self, state):
+        start = self.states[state] * NUM_POLICY_ACTIONS
+        seen = [(self.order[start + code], action) for code, action in enumerate(POLICY_ACTIONS)
+                if self.order[start + code]]
+        return [action for _, action in sorted(seen)]
+
+    # add the sums and counts of another table into this one, a column at a time over the other table's rows
+    # actions this table has not seen in a state are numbered after the ones it has, in the order the other table
+    # saw them, just like adding the other table's cells one by one with update would
+    def merge(self, other):
+        if not other.states:
+            return
+        self.best_actions = None
+        size = len(self.states)
+        rows = np.fromiter((self.states.setdefault(state, len(self.states)) for state in other.states),
+                           dtype=np.int64, count=len(other.states))
+        new_rows = len(self.states) - size
+        self.sums.extend(EMPTY_VALUE_ROW * new_rows)
+        self.counts.extend(EMPTY_POLICY_ROW * new_rows)
+        self.order.extend(EMPTY_ORDER_ROW * new_rows)
+        self.actions_seen.extend(array('B', [0]) * new_rows)
+        # the arrays are grown first, since an array can't be resized while a NumPy view of it is alive
+        sums = np.frombuffer(self.sums, dtype=np.float64).reshape(-1, NUM_POLICY_ACTIONS)
+        counts = np.frombuffer(self.counts, dtype=np.uint32).reshape(-1, NUM_POLICY_ACTIONS)
+        order = np.frombuffer(self.order, dtype=np.uint8).reshape(-1, NUM_POLICY_ACTIONS)
+        actions_seen = np.frombuffer(self.actions_seen, dtype=np.uint8)
+        sums[rows] += np.frombuffer(other.sums, dtype=np.float64).reshape(-1, NUM_POLICY_ACTIONS)
+        counts[rows] += np.frombuffer(other.counts, dtype=np.uint32).reshape(-1, NUM_POLICY_ACTIONS)
+        other_order = np.frombuffer(other.order, dtype=np.uint8).reshape(-1, NUM_POLICY_ACTIONS)
+        own_order = order[rows]
+        unseen = (other_order > 0) & (own_order == 0)
+        # the rank of each newly seen action among the newly seen actions of its row, by the other table's order
+        ranks = np.where(unseen, other_order, 255).argsort(axis=1).argsort(axis=1) + 1
+        order[rows] = np.where(unseen, actions_seen[rows, None] + ranks, own_order)
+        actions_seen[rows] += unseen.sum(axis=1, dtype=np.uint8)
+
+    # the number of bytes used by the value arrays and the state index
+    def nbytes(self):
+        arrays = [self.sums, self.counts, self.order, self.actions_seen]
+        size = sum(a.itemsize * len(a) for a in arrays) + sys.getsizeof(self.states)
+        return size + sum(sys.getsizeof(state) for state in self.states)
+
+    # build a table from a policy in the old {state: {action: value}} form, counting every value as one game
+    @classmethod
+    def from_dict(cls, policy):
+        table = cls()
+        for state, actions in policy.items():
+            for action, value in actions.items():
+                table.update(state, action, value)
+        return table
+
+    # convert back to the {state: {action: value}} form
+    def to_dict(self):
+        policy = {}
+        for state, row in self.states.items():
+            start = row * NUM_POLICY_ACTIONS
+            policy[state] = {action: self.sums[start + POLICY_ACTION_CODES[action]]
+                             / self.counts[start + POLICY_ACTION_CODES[action]] for action in self.actions(state)}
+        return policy
+
+
+# saved policy files start with a 16 byte header: magic, format version, kind of table, number of states
+# after that come the state keys in sorted order (uint64), the table's columns for each state in the same
+# order (wins and losses as uint32, sums as float64 and counts as uint32, or values as float64), the first-seen
+# order bytes, and since version 2 the best-action index (see build_best_action_index) so loading never has to
+# compute it
+# value tables are saved as sums and counts since version 3; older files hold one value per pair instead
+# since version 4 the header is followed by the number of games the policy was trained on (0 if nobody said), so
+# train_policy_online can carry on where a checkpoint left off
+POLICY_FILE_MAGIC = b'EKPT'
+POLICY_FILE_VERSION = 4
+POLICY_FILE_HEADER = struct.Struct('<4sBBxxQ')
+POLICY_FILE_GAMES = struct.Struct('<Q')
+WIN_LOSS_POLICY = 1
+VALUE_POLICY = 2
+MEAN_POLICY = 3
+
+
+# write a trained policy to disk so it can be loaded with load_policy instead of retraining
+# accepts a PolicyTable, a ValueTable or either of the old dict policies; games is the number of games it was
+# trained on, read back as MappedPolicy.games
+def save_policy(policy, path, games=0):
+    if isinstance(policy, dict):
+        first = next(iter(policy.values()), {})
+        record = next(iter(first.values()), None)
+        policy = PolicyTable.from_dict(policy) if isinstance(record, dict) else ValueTable.from_dict(policy)
+    kind = WIN_LOSS_POLICY if isinstance(policy, PolicyTable) else MEAN_POLICY
+    if kind == WIN_LOSS_POLICY:
+        columns = [policy.wins, policy.losses]
+    else:
+        columns = [policy.sums, policy.counts]
+    columns.append(policy.order)
+    keys = np.fromiter(policy.states.keys(), dtype=np.uint64, count=len(policy.states))
+    rows = np.fromiter(policy.states.values(), dtype=np.int64, count=len(policy.states))
+    by_key = keys.argsort()
+    keys = keys[by_key]
+    sorted_columns = [np.asarray(column).reshape(-1, NUM_POLICY_ACTIONS)[rows[by_key]] for column in columns]
+    if kind == WIN_LOSS_POLICY:
+        best_actions = win_loss_index(*sorted_columns)
+    else:
+        best_actions = mean_index(*sorted_columns)
+    with open(path, 'wb') as f:
+        f.write(POLICY_FILE_HEADER.pack(POLICY_FILE_MAGIC, POLICY_FILE_VERSION, kind, len(keys)))
+        f.write(POLICY_FILE_GAMES.pack(games))
+        keys.tofile(f)
+        for sorted_column in sorted_columns:
+            sorted_column.tofile(f)
+        best_actions.tofile(f)
+
+
+# a saved policy opened with mmap; lookups read straight from the mapped pages, so loading is instant and
+# every process that opens the same file shares a single copy of it
+class MappedPolicy:
+    def __init__(self, path, owner=False):
+        self.path = path
+        # the process that made the file with share_policy removes it again on close
+        self.owner = owner
+        with open(path, 'rb') as f:
+            self.mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, kind, num_states = POLICY_FILE_HEADER.unpack_from(self.mapping)
+        if magic != POLICY_FILE_MAGIC or not 1 <= version <= POLICY_FILE_VERSION:
+            raise ValueError(f"{path} is not a saved policy")
+        self.kind = kind
+        self.num_states = num_states
+        view = memoryview(self.mapping)
+        offset = POLICY_FILE_HEADER.size
+        # files from before version 4 do not say how many games they were trained on
+        self.games = 0
+        if version >= 4:
+            self.games, = POLICY_FILE_GAMES.unpack_from(self.mapping, offset)
+            offset += POLICY_FILE_GAMES.size
+        cells = num_states * NUM_POLICY_ACTIONS
+        self.keys = view[offset:offset + 8 * num_states].cast('Q')
+        offset += 8 * num_states
+        if kind == WIN_LOSS_POLICY:
+            self.wins = view[offset:offset + 4 * cells].cast('I')
+            offset += 4 * cells
+            self.losses = view[offset:offset + 4 * cells].cast('I')
+            offset += 4 * cells
+        elif kind == MEAN_POLICY:
+            self.sums = view[offset:offset + 8 * cells].cast('d')
+            offset += 8 * cells
+            self.counts = view[offset:offset + 4 * cells].cast('I')
+            offset += 4 * cells
+        else:
+            self.values = view[offset:offset + 8 * cells].cast('d')
+            offset += 8 * cells
+        self.order = view[offset:offset + cells]
+        offset += cells
+        # version 1 files have no best-action index, so it is built once here instead
+        if version >= 2:
+            self.best_actions = view[offset:offset + 2 * num_states]
+        else:
+            self.best_actions = self.build_index()
 
-    print("Simulating Random v NonRandom")
-    players = [
-        random_player,
-        nonrandom_player
-    ]
-    wins = {player.player_ID: 0 for player in players}
-    for i in range(500):
-        players = [Player('Player1'), NonRandomPlayer('Player2')]
-        game = Game(players)
-        game.start_game()
-        wins[game.decide_winner()] += 1
-    print(f"RESULTS (P1 is random): {wins}")
+    def __len__(self):
+        return self.num_states
 
-    print("Simulating Random v Smart")
-    players = [
-        random_player,
-        smart_player
-    ]
-    wins = {player.player_ID: 0 for player in players}
-    for i in range(500):
-        players = [Player('Player1'), SmartPlayer('Player2')]
-        game = Game(players)
-        game.start_game()
-        wins[game.decide_winner()] += 1
-    print(f"RESULTS (P1 is random): {wins}")
+    def __contains__(self, state):
+        return self.find(state) is not None
 
-    print("Simulating Smart v NonRandom")
-    players = [
-        smart_player,
-        nonrandom_player_1
-    ]
-    wins = {player.player_ID: 0 for player in players}
-    for i in range(500):
-        players = [SmartPlayer('Player1'), NonRandomPlayer('Player2')]
-        game = Game(players)
-        game.start_game()
-        wins[game.decide_winner()] += 1
-    print(f"RESULTS (P1 is Smart): {wins}")
+    # the size of the mapped file; pages are only read into memory as lookups touch them
+    def nbytes(self):
+        return len(self.mapping)
 
-    print("Simulating Random v Survival")
-    players = [
-        random_player,
-        survival_player
-    ]
-    wins = {player.player_ID: 0 for player in players}
-    for i in range(500):
-        surv = SurvivalAgent('Player2')
-        surv.policy = surv_policy
-        players = [Player('Player1'), surv]
-        game = Game(players)
-        game.start_game()
-        wins[game.decide_winner()] += 1
-    print(f"RESULTS (P1 is random): {wins}")
+    # pickling only sends the path; the receiving process maps the same file
+    def __getstate__(self):
+        return {'path': self.path}
 
+    def __setstate__(self, state):
+        self.__init__(state['path'])
 
-    print("Simulating Random v OPP")
-    players = [
-        random_player,
-        observed_policy_player
-    ]
-    wins = {player.player_ID: 0 for player in players}
-    for i in range(500):
-        opp = ObservedPolicyPlayer('Player2')
-        opp.policy = opp_policy
-        players = [Player('Player1'), opp]
-        game = Game(players)
+    # the row of a state, found by binary search over the sorted keys, or None if it is not in the policy
+    def find(self, state):
+        row = bisect.bisect_left(self.keys, state)
+        if row < self.num_states and self.keys[row] == state:
+            return row
+        return None
+
+    def best_action(self, state, exclude=(), min_visits=1):
+        row = self.find(state)
+        if row is None:
+            return None
+        if min_visits <= 1 and (not exclude or exclude == INDEPENDENT_EXCLUDE):
+            return INDEXED_ACTIONS[self.best_actions[2 * row + (1 if exclude else 0)]]
+        return self.row_best(row * NUM_POLICY_ACTIONS, exclude, min_visits)
+
+    # the best-action index of the mapped columns
+    def build_index(self):
+        if self.kind == WIN_LOSS_POLICY:
+            return win_loss_index(self.wins, self.losses, self.order)
+        if self.kind == MEAN_POLICY:
+            return mean_index(self.sums, self.counts, self.order)
+        return value_index(self.values, self.order)
+
+    # files from before version 3 count every value of a value table as one game
+    def row_best(self, start, exclude=(), min_visits=1):
+        if self.kind == WIN_LOSS_POLICY:
+            return best_row_action(self.wins, self.losses, self.order, start, exclude, min_visits)
+        if self.kind == MEAN_POLICY:
+            return best_mean_action(self.sums, self.counts, self.order, start, exclude, min_visits)
+        return best_value_action(self.values, self.order, start, exclude) if min_visits <= 1 else None
+
+    # the number of games each action seen in a state was played in, in the order they were first seen
+    def visits(self, state):
+        start = self.find(state) * NUM_POLICY_ACTIONS
+        seen = sorted((self.order[start + code], code) for code in range(NUM_POLICY_ACTIONS)
+                      if self.order[start + code])
+        if self.kind == WIN_LOSS_POLICY:
+            return {POLICY_ACTIONS[code]: self.wins[start + code] + self.losses[start + code] for _, code in seen}
+        if self.kind == MEAN_POLICY:
+            return {POLICY_ACTIONS[code]: self.counts[start + code] for _, code in seen}
+        return {POLICY_ACTIONS[code]: 1 for _, code in seen}
+
+    # copy the policy back into an in-memory table, e.g. to keep training it
+    def to_table(self):
+        table = PolicyTable() if self.kind == WIN_LOSS_POLICY else ValueTable()
+        table.states = {state: row for row, state in enumerate(self.keys)}
+        table.order = array('B', self.order)
+        table.actions_seen = array('B', [sum(1 for seen in self.order[start:start + NUM_POLICY_ACTIONS] if seen)
+                                         for start in range(0, len(self.order), NUM_POLICY_ACTIONS)])
+        if self.kind == WIN_LOSS_POLICY:
+            table.wins = array('I', self.wins)
+            table.losses = array('I', self.losses)
+        elif self.kind == MEAN_POLICY:
+            table.sums = array('d', self.sums)
+            table.counts = array('I', self.counts)
+        else:
+            table.sums = array('d', self.values)
+            table.counts = array('I', [1 if seen else 0 for seen in self.order])
+        table.best_actions = array('B', self.best_actions)
+        return table
+
+    def close(self):
+        self.keys.release()
+        if self.kind == WIN_LOSS_POLICY:
+            self.wins.release()
+            self.losses.release()
+        elif self.kind == MEAN_POLICY:
+            self.sums.release()
+            self.counts.release()
+        else:
+            self.values.release()
+        self.order.release()
+        if isinstance(self.best_actions, memoryview):
+            self.best_actions.release()
+        self.mapping.close()
+        if self.owner:
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# open a policy written by save_policy
+def load_policy(path):
+    return MappedPolicy(path)
+
+
+# shared policies live in /dev/shm where it exists, so their pages are never written out to disk
+SHARED_POLICY_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+
+# an immutable, shareable copy of a trained policy
+# the table is written once in the policy file layout and mapped read-only; pickling sends only the path and forked
+# processes inherit the mapping, so every process reads the same physical pages and N workers cost about one policy
+# the copy is removed when the returned policy is closed
+def share_policy(policy):
+    if isinstance(policy, MappedPolicy):
+        return policy
+    fd, path = tempfile.mkstemp(suffix='.ekp', dir=SHARED_POLICY_DIR)
+    os.close(fd)
+    save_policy(policy, path)
+    return MappedPolicy(path, owner=True)
+
+
+SURVIVAL_POLICY_FILE = 'survival_policy.ekp'
+OBSERVED_POLICY_FILE = 'observed_policy.ekp'
+
+
+# the result of a finished game for one player, shared by every move that player made in it
+PlayerOutcome = namedtuple('PlayerOutcome', ['won', 'num_moves'])
+
+
+# the RNG for game number game_index of a run seeded with seed
+# every (seed, game index) pair gets its own stream, so any game of a run can be replayed on its own and workers can
+# split a run's game indices between them without any two playing the same game
+def game_rng(seed, game_index):
+    return random.Random(f'{seed}:{game_index}')
+
+
+# play num_games games between num_players player_type agents and yield (state, action, player ID, outcome) for every
+# move as soon as its game finishes, so a training run only ever holds one game's history at a time
+# with a seed, game i is played with game_rng(seed, first_game + i); a GameProfile collects where the games spend time
+def play_trajectories(player_type, num_games, seed=None, engine=None, progress=False, profile=None, num_players=2,
+                      first_game=0):
+    check_num_players(num_players)
+    if engine is None:
+        engine = Game
+    for i in range(num_games):
+        if progress and i % (num_games / 10) == 0:
+            print(str((i / num_games) * 100) + "%")
+        players = [player_type(f'Player{seat + 1}') for seat in range(num_players)]
+        rng = None if seed is None else game_rng(seed, first_game + i)
+        game = engine(players, rng=rng) if profile is None else engine(players, profile, rng)
         game.start_game()
-        wins[game.decide_winner()] += 1
-    print(f"RESULTS (P1 is random): {wins}")
+        winner = game.decide_winner()
+        for player in players:
+            outcome = PlayerOutcome(player.player_ID == winner, len(player.game_states))
+            for state, action in zip(player.game_states, player.actions):
+                yield state, action, player.player_ID, outcome
+
+
+# count the wins and losses of every (state, action) pair in a trajectory stream
+def aggregate_win_loss(trajectories, policy=None):
+    if policy is None:
+        policy = PolicyTable()
+    for state, action, player_ID, outcome in trajectories:
+        policy.record(state, action, outcome.won)
+    return policy
+
+
+# add the game length of every (state, action) pair in a trajectory stream to its survival value
+def aggregate_survival(trajectories, policy=None):
+    if policy is None:
+        policy = ValueTable()
+    for state, action, player_ID, outcome in trajectories:
+        policy.update(state, action, outcome.num_moves)
+    return policy
+
+
+# play num_games games between num_players player_type agents and record the win/loss count of every
+# (state, action) pair seen
+def observe_games(player_type, num_games, seed=None, profile=None, num_players=2, first_game=0):
+    return aggregate_win_loss(play_trajectories(player_type, num_games, seed, profile=profile, num_players=num_players,
+                                                first_game=first_game))
+
+
+# play num_games games between num_players player_type agents and add up the game lengths of every
+# (state, action) pair seen
+def observe_survival(player_type, num_games, seed=None, progress=False, num_players=2, first_game=0):
+    return aggregate_survival(play_trajectories(player_type, num_games, seed, progress=progress,
+                                                num_players=num_players, first_game=first_game))
+
+
+# pool.map only passes one argument, so unpack the job tuple here
+def _observe_games_job(job):
+    player_type, num_games, seed, first_game, num_players = job
+    return observe_games(player_type, num_games, seed, num_players=num_players, first_game=first_game)
+
+
+def _observe_survival_job(job):
+    player_type, num_games, seed, first_game, num_players = job
+    return observe_survival(player_type, num_games, seed, num_players=num_players, first_game=first_game)
+
+
+# split num_games games between workers: every worker plays its own range of game indices of one seed (see
+# game_rng), so no two workers play the same game and the games are exactly the ones a single process would play
+# returns the (player_type, num_games, seed, first_game, num_players) job of each worker
+def worker_jobs(player_type, num_games, workers, seed=None, num_players=2):
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    jobs = []
+    first_game = 0
+    for worker in range(workers):
+        worker_games = num_games // workers + (1 if worker < num_games % workers else 0)
+        jobs.append((player_type, worker_games, seed, first_game, num_players))
+        first_game += worker_games
+    return jobs
+
+
+# combine several policies of one kind (e.g. one per worker) into a single policy
+def merge_policies(policies):
+    merged = type(policies[0])() if policies else PolicyTable()
+    for policy in policies:
+        merged.merge(policy)
+    return merged
+
+
+# the fraction of best-action index entries that differ between two indexes of the same table, counting the
+# entries of states that only the newer one has as changed
+def policy_change(before, after):
+    if not after:
+        return 0.0
+    changed = sum(1 for old, new in zip(before, after) if old != new) + len(after) - len(before)
+    return changed / len(after)
+
+
+# write a checkpoint next to the old file and swap it in, so a crash never leaves half a policy behind and
+# processes that still have the old file mapped keep reading it
+def save_checkpoint(policy, path, games=0):
+    save_policy(policy, path + '.tmp', games)
+    os.replace(path + '.tmp', path)
+
+
+# keep training the policy saved at path (or a new one if there is no file yet) on more games between
+# num_players player_type agents, feeding every game to aggregate (aggregate_win_loss or aggregate_survival)
+# a checkpoint is saved every checkpoint_games games; training stops after max_games games, or earlier once a
+# checkpoint changes less than tolerance of the best actions (see policy_change)
+# checkpoints record how many games the policy has been trained on, and with a seed the game indices (see game_rng)
+# carry on from there, so resuming with the same seed plays new games; first_game overrides the count, which a
+# file saved by save_policy without one needs before it can be resumed with a seed
+# returns the trained table and the number of games played
+def train_policy_online(path, aggregate, player_type, max_games, checkpoint_games=100000, tolerance=0.001,
+                        seed=None, num_players=2, first_game=None):
+    trained = 0
+    if os.path.exists(path):
+        with load_policy(path) as saved:
+            policy = saved.to_table()
+            trained = saved.games
+        if seed is not None and first_game is None and trained == 0 and len(policy):
+            raise ValueError(f"{path} does not say how many games it was trained on, so resuming it with a seed "
+                             f"would replay them; pass first_game")
+    else:
+        policy = aggregate(iter(()))
+        policy.index_best_actions()
+    if first_game is not None:
+        trained = first_game
+    played = 0
+    while played < max_games:
+        num_games = min(checkpoint_games, max_games - played)
+        before = policy.best_actions
+        aggregate(play_trajectories(player_type, num_games, seed, num_players=num_players,
+                                    first_game=trained + played), policy)
+        played += num_games
+        policy.index_best_actions()
+        change = policy_change(before, policy.best_actions)
+        save_checkpoint(policy, path, trained + played)
+        print(f"{trained + played} games, {len(policy)} states, {change:.3%} of best actions changed")
+        if change < tolerance:
+            break
+    return policy, played
 
+
+if __name__ == "__main__":
+    from tournament import PolicyAgent, run_tournament, print_results
+
+    # trained policies are saved to the working directory so later runs can skip training
+    if not os.path.exists(SURVIVAL_POLICY_FILE):
+        print('Training Survival Agent...')
+        survival_player = SurvivalAgent('Player2')
+        survival_player.train(Player)
+        save_policy(survival_player.policy, SURVIVAL_POLICY_FILE)
+    if not os.path.exists(OBSERVED_POLICY_FILE):
+        print("Training OPP...")
+        observed_policy_player = ObservedPolicyPlayer('Player2')
+        observed_policy_player.train(SmartPlayer, workers=os.cpu_count())
+        save_policy(observed_policy_player.policy, OBSERVED_POLICY_FILE)
+
+    # the policies are always read back from disk, so the tournament workers share the mapped files
+    agents = {
+        'Random': Player,
+        'NonRandom': NonRandomPlayer,
+        'Smart': SmartPlayer,
+        'Survival': PolicyAgent(SurvivalAgent, load_policy(SURVIVAL_POLICY_FILE)),
+        'OPP': PolicyAgent(ObservedPolicyPlayer, load_policy(OBSERVED_POLICY_FILE)),
+    }
+    pairings = [
+        ('Random', 'Random'),
+        ('Random', 'NonRandom'),
+        ('Random', 'Smart'),
+        ('Smart', 'NonRandom'),
+        ('Random', 'Survival'),
+        ('Random', 'OPP'),
+    ]
+    print_results(run_tournament(agents, pairings, games=500))
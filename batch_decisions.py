@@ -0,0 +1,317 @@
+import asyncio
+import time
+import numpy as np
+from CS4100ExplodingKittens import (Player, SmartPlayer, ObservedPolicyPlayer, SurvivalAgent, Game, MappedPolicy,
+                                    PolicyTable, game_rng, load_policy, POLICY_ACTIONS, NUM_POLICY_ACTIONS,
+                                    INDEXED_ACTIONS, WIN_LOSS_POLICY, VALUE_POLICY, MEAN_POLICY,
+                                    SURVIVAL_POLICY_FILE, OBSERVED_POLICY_FILE)
+
+
+# Batched policy decisions for many live games
+# Every game runs as a generator (game_lookups) that stops whenever a policy player needs a lookup from its policy;
+# policy players play their turns through policy_turn, so their lookups can be collected from many games and
+# handed to a BatchDecider, which answers them all with one vectorized search and argmax per policy. Other players
+# take their turns as usual. run_games steps a list of games in lockstep, and play_game wraps one game in a
+# coroutine for an asyncio event loop.
+# The state keys come from Game.state_key: a Game keeps its state in Python objects, and the cached hand and
+# opponent parts of its keys make one key cheaper than reading the same fields into arrays would be, so the keys
+# are encoded one lookup at a time and only the search and argmax are vectorized.
+# A batched decision costs about as much as a lookup on its own at a few dozen lookups per batch and less in bigger
+# batches, but lookups are only a small part of the time a game takes: run_games plays about as fast as start_game
+# does one game after another, and what batching adds is one policy answering the players of many tables at once.
+# play_game pays for a future and a trip through the event loop on every lookup, so it is meant for games that
+# share a loop with other work rather than for simulations.
+#
+#   winners = run_games([Game([ObservedPolicyPlayer('Player1'), Player('Player2')]) for i in range(1000)])
+#
+# games that share an event loop with other work (e.g. tables waiting on remote players) can each be run with
+# play_game and one shared BatchDecider; whatever lookups are pending when the loop comes around form a batch
+
+
+# a trained policy as arrays, for looking up many states at once
+# a MappedPolicy is used in place (the arrays are views of its mapped file, so drop the BatchPolicy before closing
+# it); a PolicyTable or ValueTable is copied, sorted by state key
+# policies of other kinds give their own batched version with a batch_policy() method (see QTable and
+# HierarchicalPolicy)
+class BatchPolicy:
+    def __init__(self, policy):
+        if isinstance(policy, MappedPolicy):
+            self.kind = policy.kind
+            self.keys = np.frombuffer(policy.keys, dtype=np.uint64)
+            self.rows = None
+            if self.kind == WIN_LOSS_POLICY:
+                self.wins = np.frombuffer(policy.wins, dtype=np.uint32).reshape(-1, NUM_POLICY_ACTIONS)
+                self.losses = np.frombuffer(policy.losses, dtype=np.uint32).reshape(-1, NUM_POLICY_ACTIONS)
+            elif self.kind == MEAN_POLICY:
+                self.sums = np.frombuffer(policy.sums, dtype=np.float64).reshape(-1, NUM_POLICY_ACTIONS)
+                self.counts = np.frombuffer(policy.counts, dtype=np.uint32).reshape(-1, NUM_POLICY_ACTIONS)
+            else:
+                self.values = np.frombuffer(policy.values, dtype=np.float64).reshape(-1, NUM_POLICY_ACTIONS)
+            self.order = np.frombuffer(policy.order, dtype=np.uint8).reshape(-1, NUM_POLICY_ACTIONS)
+            return
+        self.sort_states(policy.states)
+        self.kind = WIN_LOSS_POLICY if isinstance(policy, PolicyTable) else MEAN_POLICY
+        if self.kind == WIN_LOSS_POLICY:
+            self.wins = np.array(policy.wins, dtype=np.uint32).reshape(-1, NUM_POLICY_ACTIONS)
+            self.losses = np.array(policy.losses, dtype=np.uint32).reshape(-1, NUM_POLICY_ACTIONS)
+        else:
+            self.sums = np.array(policy.sums, dtype=np.float64).reshape(-1, NUM_POLICY_ACTIONS)
+            self.counts = np.array(policy.counts, dtype=np.uint32).reshape(-1, NUM_POLICY_ACTIONS)
+        self.order = np.array(policy.order, dtype=np.uint8).reshape(-1, NUM_POLICY_ACTIONS)
+
+    # a BatchPolicy that scores each action by a value, for policies that keep one value per state and action
+    #   states: the row of each state key; values, order: a row of values and first-seen orders for each
+    @classmethod
+    def from_values(cls, states, values, order):
+        batch_policy = cls.__new__(cls)
+        batch_policy.sort_states(states)
+        batch_policy.kind = VALUE_POLICY
+        batch_policy.values = values
+        batch_policy.order = order
+        return batch_policy
+
+    # the state keys in sorted order, and the row of each
+    def sort_states(self, states):
+        keys = np.fromiter(states.keys(), dtype=np.uint64, count=len(states))
+        rows = np.fromiter(states.values(), dtype=np.int64, count=len(states))
+        by_key = keys.argsort()
+        self.keys = keys[by_key]
+        self.rows = rows[by_key]
+
+    # the best action code for each key out of the allowed ones (a boolean matrix with a column per policy action),
+    # or -1 for keys the policy has no allowed action for
+    # picks exactly what best_action does: the best win rate (or mean, or value), ties going to the action seen first
+    def best_action_codes(self, keys, allowed):
+        if len(self.keys) == 0:
+            return np.full(len(keys), -1)
+        found_at = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        found = self.keys[found_at] == keys
+        rows = found_at if self.rows is None else self.rows[found_at]
+        order = self.order[rows]
+        allowed = allowed & (order > 0) & found[:, None]
+        if self.kind == WIN_LOSS_POLICY:
+            wins = self.wins[rows].astype(np.float64)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                scores = wins / (wins + self.losses[rows])
+        elif self.kind == MEAN_POLICY:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                scores = self.sums[rows] / self.counts[rows]
+        else:
+            scores = self.values[rows]
+        scores = np.where(allowed, scores, -np.inf)
+        best = scores.max(axis=1)
+        ties = allowed & (scores == best[:, None])
+        # orders run 1-7, so 255 never wins a tie
+        codes = np.where(ties, order, 255).argmin(axis=1)
+        codes[~allowed.any(axis=1)] = -1
+        return codes
+
+
+# the batched version of any trained policy: its own batch_policy() if it has one, otherwise a BatchPolicy
+def batch_policy(policy):
+    if hasattr(policy, 'batch_policy'):
+        return policy.batch_policy()
+    return BatchPolicy(policy)
+
+
+# answers policy lookups from many games in batches
+# decide() answers a list of lookups at once; the asyncio side (best_action) collects lookups from coroutines
+#   max_batch: with asyncio, decide as soon as this many lookups are pending instead of waiting for every game
+class BatchDecider:
+    def __init__(self, max_batch=None):
+        self.max_batch = max_batch
+        # (game, player, exclude) for every lookup waiting for an answer, and the futures to answer them on
+        self.pending = []
+        self.futures = []
+        self.scheduled = False
+        # a BatchPolicy for every policy seen, by id; the policy is kept alongside so the id stays unique
+        self.policies = {}
+        # the row of allowed_actions for each exclude tuple seen so far
+        self.exclude_rows = {}
+        # which policy actions are allowed, a row for every exclude tuple
+        self.allowed_actions = np.ones((0, NUM_POLICY_ACTIONS), dtype=bool)
+        self.batches = 0
+        self.decisions = 0
+
+    def batch_policy(self, policy):
+        entry = self.policies.get(id(policy))
+        if entry is None:
+            entry = self.policies[id(policy)] = (policy, batch_policy(policy))
+        return entry[1]
+
+    def exclude_row(self, exclude):
+        row = self.exclude_rows.get(exclude)
+        if row is None:
+            row = self.exclude_rows[exclude] = len(self.allowed_actions)
+            allowed = np.array([[action not in exclude for action in POLICY_ACTIONS]])
+            self.allowed_actions = np.concatenate([self.allowed_actions, allowed])
+        return row
+
+    # the best action for each (game, player, exclude) lookup, from the player's policy in its current game state
+    # one array of keys for the whole batch, then one vectorized lookup per policy
+    def decide(self, lookups):
+        self.batches += 1
+        self.decisions += len(lookups)
+        keys = np.fromiter([game.state_key(player) for game, player, _ in lookups], dtype=np.uint64,
+                           count=len(lookups))
+        # a batch only holds a few different excludes and policies, so each is looked up once per batch
+        excludes = [exclude for _, _, exclude in lookups]
+        rows = {exclude: self.exclude_row(exclude) for exclude in set(excludes)}
+        allowed = self.allowed_actions[np.fromiter(map(rows.get, excludes), dtype=np.int64, count=len(lookups))]
+        policies = [player.policy for _, player, _ in lookups]
+        codes = np.empty(len(lookups), dtype=np.int64)
+        if all(policy is policies[0] for policy in policies):
+            codes[:] = self.batch_policy(policies[0]).best_action_codes(keys, allowed)
+        else:
+            by_policy = {}
+            for i, policy in enumerate(policies):
+                by_policy.setdefault(id(policy), (policy, []))[1].append(i)
+            for policy, indices in by_policy.values():
+                codes[indices] = self.batch_policy(policy).best_action_codes(keys[indices], allowed[indices])
+        # -1 (no action) becomes INDEXED_ACTIONS' None
+        return [INDEXED_ACTIONS[code] for code in (codes + 1).tolist()]
+
+    # a future for the best action of the player's policy in its current game state
+    # the first lookup of a batch schedules decide_pending() on the event loop, so it runs once every game that is
+    # ready has had its turn to ask
+    def best_action(self, game, player, exclude=()):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((game, player, exclude))
+        self.futures.append(future)
+        if self.max_batch is not None and len(self.pending) >= self.max_batch:
+            self.decide_pending()
+        elif not self.scheduled:
+            self.scheduled = True
+            loop.call_soon(self.decide_pending)
+        return future
+
+    def decide_pending(self):
+        self.scheduled = False
+        pending, futures = self.pending, self.futures
+        self.pending, self.futures = [], []
+        if pending:
+            for future, action in zip(futures, self.decide(pending)):
+                future.set_result(action)
+
+
+# Game.start_game as a generator that stops at every policy lookup: it yields the actions to exclude and is sent
+# the best action of the player whose turn it is (lookup_player); players without policy_turn take their turns as
+# usual
+def game_lookups(game):
+    game.deal()
+    while game.players_left > 1 and game.deck:
+        player_on = game.next_turn()
+        if not player_on.alive:
+            continue
+        if not hasattr(player_on, 'policy_turn'):
+            game.take_turn(player_on)
+            continue
+        game.begin_turn(player_on)
+        yield from player_on.policy_turn(game)
+        game.end_turn(player_on)
+
+
+# the player a game from game_lookups is waiting on a lookup for
+def lookup_player(game):
+    return game.player_list[game.turn]
+
+
+# answers every lookup on its own from the player's policy, like Player.run_lookups; run_games with a LookupDecider
+# plays the same interleaved games as with a BatchDecider without batching the lookups
+class LookupDecider:
+    def decide(self, lookups):
+        return [player.policy.best_action(game.state_key(player), exclude) for game, player, exclude in lookups]
+
+
+# play the games in lockstep, window of them at a time: every round answers the pending lookup of each game in play
+# in one batch, and each game that finishes makes room for the next one
+# a game's objects fall out of the CPU caches while it waits for the rest of its round, so playing many more games
+# at once than it takes to fill a batch slows every game down (2000 at once play about a third slower than 64)
+# returns the winner of each game
+def run_games(games, decider=None, window=64):
+    if decider is None:
+        decider = BatchDecider()
+    unstarted = iter(games)
+    waiting = []
+    while True:
+        while len(waiting) < window:
+            game = next(unstarted, None)
+            if game is None:
+                break
+            lookups = game_lookups(game)
+            for exclude in lookups:
+                waiting.append((lookups, game, exclude))
+                break
+        if not waiting:
+            break
+        actions = decider.decide([(game, game.player_list[game.turn], exclude) for _, game, exclude in waiting])
+        still_waiting = []
+        for (lookups, game, _), action in zip(waiting, actions):
+            try:
+                still_waiting.append((lookups, game, lookups.send(action)))
+            except StopIteration:
+                pass
+        waiting = still_waiting
+    return [game.decide_winner() for game in games]
+
+
+# the same game as a coroutine, for games that share an event loop; the lookups go to decider.best_action
+async def play_game(game, decider):
+    lookups = game_lookups(game)
+    try:
+        exclude = next(lookups)
+        while True:
+            exclude = lookups.send(await decider.best_action(game, lookup_player(game), exclude))
+    except StopIteration:
+        pass
+
+
+# play all the games as coroutines on the running event loop, window of them at a time (see run_games), and return
+# the winner of each
+async def play_games(games, max_batch=None, window=64):
+    decider = BatchDecider(max_batch)
+    in_play = asyncio.Semaphore(window)
+
+    async def play(game):
+        async with in_play:
+            await play_game(game, decider)
+    await asyncio.gather(*[play(game) for game in games])
+    return [game.decide_winner() for game in games]
+
+
+# fresh games of player_types, seeded like a tournament batch, with the policy agents sharing policies
+def make_games(player_types, policies, num_games, seed=0):
+    games = []
+    for i in range(num_games):
+        players = []
+        for seat, player_type in enumerate(player_types):
+            player = player_type(f'Player{seat + 1}')
+            if player_type in policies:
+                player.policy = policies[player_type]
+            players.append(player)
+        games.append(Game(players, rng=game_rng(seed, i)))
+    return games
+
+
+if __name__ == "__main__":
+    policies = {SurvivalAgent: load_policy(SURVIVAL_POLICY_FILE),
+                ObservedPolicyPlayer: load_policy(OBSERVED_POLICY_FILE)}
+    for player_types in [(ObservedPolicyPlayer, Player), (SurvivalAgent, SmartPlayer)]:
+        names = ' v '.join(player_type.__name__ for player_type in player_types)
+        start = time.perf_counter()
+        for game in make_games(player_types, policies, 2000):
+            game.start_game()
+        one_at_a_time = 2000 / (time.perf_counter() - start)
+        start = time.perf_counter()
+        run_games(make_games(player_types, policies, 2000), LookupDecider())
+        interleaved = 2000 / (time.perf_counter() - start)
+        start = time.perf_counter()
+        run_games(make_games(player_types, policies, 2000))
+        batched = 2000 / (time.perf_counter() - start)
+        start = time.perf_counter()
+        asyncio.run(play_games(make_games(player_types, policies, 2000)))
+        coroutines = 2000 / (time.perf_counter() - start)
+        print(f"{names}: {one_at_a_time:.0f} games/sec played one after another; interleaved, "
+              f"{interleaved:.0f} games/sec one lookup at a time, {batched:.0f} games/sec batched and "
+              f"{coroutines:.0f} games/sec batched as coroutines")
@@ -0,0 +1,395 @@
+import time
+import numpy as np
+from CS4100ExplodingKittens import (Player, SmartPlayer, PlayerOutcome, ValueTable, aggregate_win_loss,
+                                    aggregate_survival, observe_games,
+                                    CARD_TYPES, HAND_ACTION_BITS, POLICY_ACTIONS, POLICY_ACTION_CODES,
+                                    DECK_SIZE_SHIFT, FUTURE_SHIFT, ATTACK_SHIFT, DEFUSES_OWNED_SHIFT, DEFUSES_WITH_OPP_SHIFT, NUM_OPPONENTS_SHIFT,
+                                    OPPONENT_HANDS_SHIFT, HAND_SIZE_BITS, check_num_players)
+from fast_game import (DEFUSE, EXPLODING_KITTEN, ATTACK, SKIP, SEE_THE_FUTURE, SHUFFLE, FAVOR, CAT_CODES,
+                       SINGLE_CODES, NUM_CARD_TYPES, NON_RANDOM_GIVE_ORDER, NATIVE_AGENTS, RANDOM_AGENT,
+                       fresh_deck_counts)
+
+
+# Runs many games of the simple agents (Player, NonRandomPlayer, SmartPlayer) at once
+# Every game in a batch is a row of NumPy arrays (deck, hand counts, alive flags, attack counter...) and each call
+# to step() moves every unfinished game forward by one decision with array operations, so the Python overhead
+# is paid once per step instead of once per game
+# The agents follow the same rules as in Game; nothing sets last_played to a Defuse, so SmartPlayer plays like
+# NonRandomPlayer, exactly as it does there
+
+# stands in for the hand size of a dead opponent when sorting hand sizes; bigger than any real one
+DEAD_HAND_SIZE = 1 << HAND_SIZE_BITS
+
+# what a game is about to do on its next step
+TURN_START = 0
+PLAYING = 1
+
+# the policy action recorded for each card code, and for finishing a turn
+ACTION_OF_CARD = np.array([POLICY_ACTION_CODES.get('Cat' if code in CAT_CODES else name, -1)
+                           for code, name in enumerate(CARD_TYPES)], dtype=np.int8)
+FINISH_TURN = POLICY_ACTION_CODES['Finish Turn']
+GIVE_ORDER = np.array(NON_RANDOM_GIVE_ORDER)
+CAT_INDEX = list(CAT_CODES)
+
+
+# pick one True column per row of a boolean matrix, uniformly at random; rows without any True get -1
+def random_true_column(rng, mask):
+    keys = rng.random(mask.shape)
+    keys[~mask] = -1.0
+    choice = keys.argmax(axis=1)
+    choice[~mask.any(axis=1)] = -1
+    return choice
+
+
+# a random card from each row of hand counts, each card equally likely (like random.choice(player.hand))
+def random_cards(rng, hands):
+    totals = hands.cumsum(axis=1)
+    picks = (rng.random(len(hands)) * totals[:, -1]).astype(totals.dtype)
+    return (totals > picks[:, None]).argmax(axis=1)
+
+
+# shuffle the first deck_size cards of each deck row
+def shuffle_rows(rng, decks, deck_sizes):
+    keys = rng.random(decks.shape)
+    keys[np.arange(decks.shape[1]) >= deck_sizes[:, None]] = 2.0
+    return np.take_along_axis(decks, keys.argsort(axis=1), axis=1)
+
+
+class BatchSimulator:
+    def __init__(self, player_types, num_games, seed=None):
+        for player_type in player_types:
+            if player_type not in NATIVE_AGENTS:
+                raise ValueError(f"{player_type.__name__} has no batched version")
+        self.rng = np.random.default_rng(seed)
+        self.num_games = num_games
+        self.num_players = num_players = len(player_types)
+        check_num_players(num_players)
+        self.hand_size = 7
+        self.agents = np.array([NATIVE_AGENTS[player_type] for player_type in player_types])
+        # seats of everyone but the player in each seat
+        self.others = np.array([[other for other in range(num_players) if other != seat]
+                                for seat in range(num_players)])
+        # a fresh deck for this table, without Defuses and Exploding Kittens
+        self.fresh_deck = np.array([code for code, count in fresh_deck_counts(num_players).items()
+                                    for _ in range(count)], dtype=np.int8)
+        # the draw piles, bottom to top, and how many cards are in each
+        deck_capacity = len(self.fresh_deck) + num_players - 1
+        self.deck = np.zeros((num_games, deck_capacity), dtype=np.int8)
+        self.deck_size = np.zeros(num_games, dtype=np.int64)
+        # card counts of every hand
+        self.hands = np.zeros((num_games, num_players, NUM_CARD_TYPES), dtype=np.int64)
+        self.alive = np.ones((num_games, num_players), dtype=bool)
+        self.players_left = np.full(num_games, num_players)
+        self.turn = np.full(num_games, -1)
+        self.attack_counter = np.zeros(num_games, dtype=np.int64)
+        self.phase = np.full(num_games, TURN_START)
+        self.playing = np.zeros(num_games, dtype=bool)
+        self.skipping = np.zeros(num_games, dtype=bool)
+        self.can_steal = np.zeros(num_games, dtype=bool)
+        # the cards each player saw with See The Future, top card first
+        self.future = np.zeros((num_games, num_players, 3), dtype=np.int8)
+        self.future_size = np.zeros((num_games, num_players), dtype=np.int64)
+        self.done = np.zeros(num_games, dtype=bool)
+        # (game, seat, state, action) records, one array chunk per step
+        self.recorded = []
+
+    def deal(self):
+        rng = self.rng
+        num_games, num_players = self.num_games, self.num_players
+        fresh_deck = self.fresh_deck
+        decks = shuffle_rows(rng, np.tile(fresh_deck, (num_games, 1)), np.full(num_games, len(fresh_deck)))
+        self.hands[:, :, DEFUSE] = 1
+        # everyone is dealt a Defuse plus hand_size - 1 cards from the deck
+        dealt = (self.hand_size - 1) * num_players
+        one_hot = np.eye(NUM_CARD_TYPES, dtype=np.int64)
+        for seat in range(num_players):
+            # the top of the deck is its end; seat s gets every num_players-th card from there
+            cards = decks[:, len(fresh_deck) - 1 - seat::-num_players][:, :dealt // num_players]
+            self.hands[:, seat] += one_hot[cards].sum(axis=1)
+        rest = np.concatenate([decks[:, :len(fresh_deck) - dealt],
+                               np.full((num_games, num_players - 1), EXPLODING_KITTEN, dtype=np.int8)], axis=1)
+        self.deck_size[:] = rest.shape[1]
+        self.deck[:, :rest.shape[1]] = shuffle_rows(rng, rest, self.deck_size)
+
+    # encoded game states (see encode_game_state) for the players in seats of games
+    def state_keys(self, games, seats):
+        hands = self.hands[games, seats]
+        keys = np.zeros(len(games), dtype=np.int64)
+        for code in SINGLE_CODES + (FAVOR,):
+            keys |= (hands[:, code] > 0) * HAND_ACTION_BITS[CARD_TYPES[code]]
+        keys |= (hands[:, CAT_INDEX] > 1).any(axis=1) * HAND_ACTION_BITS['Cat']
+        keys |= self.deck_size[games] << DECK_SIZE_SHIFT
+        seen = self.future_size[games, seats] > 0
+        keys |= np.where(seen, self.future[games, seats, 0].astype(np.int64) + 1, 0) << FUTURE_SHIFT
+        keys |= self.attack_counter[games] << ATTACK_SHIFT
+        keys |= hands[:, DEFUSE] << DEFUSES_OWNED_SHIFT
+        # only living opponents count, like Game.state_key; the player deciding is alive, so they number
+        # players_left - 1
+        others = self.others[seats]
+        living = self.alive[games[:, None], others]
+        keys |= (self.hands[games[:, None], others, DEFUSE] * living).sum(axis=1) << DEFUSES_WITH_OPP_SHIFT
+        keys |= (self.players_left[games] - 1) << NUM_OPPONENTS_SHIFT
+        # dead opponents get a size past any real one, so sorting puts the living sizes first
+        opponent_sizes = np.where(living, self.hands[games[:, None], others].sum(axis=2), DEAD_HAND_SIZE)
+        opponent_sizes.sort(axis=1)
+        for i in range(self.num_players - 1):
+            sizes = opponent_sizes[:, i]
+            keys |= np.where(sizes < DEAD_HAND_SIZE, sizes, 0) << (OPPONENT_HANDS_SHIFT + i * HAND_SIZE_BITS)
+        return keys
+
+    def record(self, games, seats, keys, actions):
+        self.recorded.append((games, seats, keys, actions))
+
+    def step(self):
+        rng = self.rng
+        # start the turns of games that are between turns
+        starting = np.flatnonzero(~self.done & (self.phase == TURN_START))
+        attacked = self.attack_counter[starting] > 0
+        self.attack_counter[starting[attacked]] -= 1
+        advancing = starting[~attacked]
+        self.turn[advancing] = (self.turn[advancing] + 1) % self.num_players
+        starting = starting[self.alive[starting, self.turn[starting]]]
+        self.phase[starting] = PLAYING
+        seats = self.turn[starting]
+        # like the original, whether opponents can be stolen from is only checked at the start of the turn
+        others = self.others[seats]
+        opponent_sizes = self.hands[starting[:, None], others].sum(axis=2)
+        self.can_steal[starting] = ((opponent_sizes > 0) & self.alive[starting[:, None], others]).any(axis=1)
+        self.playing[starting] = self.keep_playing(starting)
+
+        in_turn = ~self.done & (self.phase == PLAYING)
+        attempting = np.flatnonzero(in_turn & self.playing & ~self.skipping)
+        finishing = np.flatnonzero(in_turn & ~(self.playing & ~self.skipping))
+        self.play_cards(attempting)
+        self.playing[attempting] = self.keep_playing(attempting)
+        self.finish_turns(finishing)
+        self.done |= (self.players_left <= 1) | (self.deck_size == 0)
+
+    # whether the player on turn in each game goes on to play a card: like Player, a coin flip at the start of the
+    # turn and after every card
+    def keep_playing(self, games):
+        return self.rng.random(len(games)) < 0.5
+
+    # the card code each game's player plays out of its possible ones (a boolean matrix with a column per card
+    # code), or -1 to play nothing this time: a random one, like Player
+    def choose_cards(self, games, seats, possible):
+        return random_true_column(self.rng, possible)
+
+    def play_cards(self, games):
+        seats = self.turn[games]
+        hands = self.hands[games, seats]
+        possible = np.zeros(hands.shape, dtype=bool)
+        possible[:, list(SINGLE_CODES)] = hands[:, list(SINGLE_CODES)] > 0
+        can_steal = self.can_steal[games][:, None]
+        possible[:, FAVOR] = (hands[:, FAVOR] > 0) & can_steal[:, 0]
+        possible[:, CAT_INDEX] = (hands[:, CAT_INDEX] > 1) & can_steal
+        codes = self.choose_cards(games, seats, possible)
+        playing = codes >= 0
+        games, seats, codes = games[playing], seats[playing], codes[playing]
+        self.record(games, seats, self.state_keys(games, seats), ACTION_OF_CARD[codes])
+        self.hands[games, seats, codes] -= 1
+        cats = np.isin(codes, CAT_INDEX)
+        self.hands[games[cats], seats[cats], codes[cats]] -= 1
+
+        attacks = codes == ATTACK
+        self.attack_counter[games[attacks]] += 1
+        self.skipping[games[attacks | (codes == SKIP)]] = True
+
+        futures = codes == SEE_THE_FUTURE
+        future_games, future_seats = games[futures], seats[futures]
+        tops = self.deck_size[future_games][:, None] - 1 - np.arange(3)
+        self.future[future_games, future_seats] = np.take_along_axis(self.deck[future_games],
+                                                                      np.maximum(tops, 0), axis=1)
+        self.future_size[future_games, future_seats] = np.minimum(self.deck_size[future_games], 3)
+
+        shuffled = games[codes == SHUFFLE]
+        self.deck[shuffled] = shuffle_rows(self.rng, self.deck[shuffled], self.deck_size[shuffled])
+        self.future_size[shuffled] = 0
+
+        steals = (codes == FAVOR) | cats
+        self.steal(games[steals], seats[steals], codes[steals] == FAVOR)
+
+    # resolve Favor and cat pairs: take a card from a random living opponent that has cards
+    def steal(self, games, seats, favors):
+        sizes = self.hands[games].sum(axis=2)
+        targets_mask = (sizes > 0) & self.alive[games]
+        targets_mask[np.arange(len(games)), seats] = False
+        targets = random_true_column(self.rng, targets_mask)
+        # a Favor with nobody to ask goes back into the player's hand
+        returned = favors & (targets < 0)
+        self.hands[games[returned], seats[returned], FAVOR] += 1
+        found = targets >= 0
+        games, seats, targets, favors = games[found], seats[found], targets[found], favors[found]
+        target_hands = self.hands[games, targets]
+        cards = random_cards(self.rng, target_hands)
+        # a non-random target picks the card it gives for a Favor; cat pairs always take a random card
+        choosing = favors & (self.agents[targets] != RANDOM_AGENT)
+        ordered = target_hands[choosing][:, GIVE_ORDER] > 0
+        cards[choosing] = GIVE_ORDER[ordered.argmax(axis=1)]
+        self.hands[games, targets, cards] -= 1
+        self.hands[games, seats, cards] += 1
+
+    def finish_turns(self, games):
+        seats = self.turn[games]
+        self.record(games, seats, self.state_keys(games, seats), np.full(len(games), FINISH_TURN, dtype=np.int8))
+        self.phase[games] = TURN_START
+        drawing = ~self.skipping[games]
+        self.skipping[games] = False
+        self.draw_cards(games[drawing], seats[drawing])
+
+    def draw_cards(self, games, seats):
+        self.deck_size[games] -= 1
+        cards = self.deck[games, self.deck_size[games]]
+        kittens = cards == EXPLODING_KITTEN
+
+        safe, safe_seats = games[~kittens], seats[~kittens]
+        self.hands[safe, safe_seats, cards[~kittens]] += 1
+
+        kitten_games, kitten_seats = games[kittens], seats[kittens]
+        defused = self.hands[kitten_games, kitten_seats, DEFUSE] > 0
+        exploded, exploded_seats = kitten_games[~defused], kitten_seats[~defused]
+        self.alive[exploded, exploded_seats] = False
+        self.players_left[exploded] -= 1
+
+        # every player that saw the future moves one card along it, whether the card drawn exploded or not
+        moved = np.concatenate([safe, exploded])
+        self.future[moved, :, :2] = self.future[moved, :, 1:]
+        self.future_size[moved] = np.maximum(self.future_size[moved] - 1, 0)
+
+        defused_games, defused_seats = kitten_games[defused], kitten_seats[defused]
+        self.hands[defused_games, defused_seats, DEFUSE] -= 1
+        sizes = self.deck_size[defused_games]
+        # spots count down from the top of the deck, which is the end of each row
+        random_spots = (self.rng.random(len(defused_games)) * (sizes + 1)).astype(np.int64)
+        spots = np.where(self.agents[defused_seats] == RANDOM_AGENT, random_spots, 0)
+        positions = (sizes - spots)[:, None]
+        column = np.arange(self.deck.shape[1])
+        decks = self.deck[defused_games]
+        shifted = np.take_along_axis(decks, np.maximum(column - 1, 0)[None, :].repeat(len(decks), axis=0), axis=1)
+        self.deck[defused_games] = np.where(column < positions, decks,
+                                            np.where(column == positions, EXPLODING_KITTEN, shifted))
+        self.deck_size[defused_games] += 1
+        self.future_size[defused_games] = 0
+
+    # the seat of the winner of every game
+    def winners(self):
+        return self.alive.argmax(axis=1)
+
+    # play every game to the end; the records stay in the simulator
+    def play(self):
+        self.deal()
+        while not self.done.all():
+            self.step()
+
+    # play every game to the end and return, for each game, one (game_states, actions, did_win) triple per seat,
+    # the same history train() reads from player.game_states and player.actions
+    def run(self):
+        self.play()
+        return self.histories()
+
+    # every record of the batch as (owners, state keys, policy action codes) arrays, sorted by owner (game *
+    # num_players + seat); a stable sort keeps every player's records in the order they were made
+    def records(self):
+        games = np.concatenate([chunk[0] for chunk in self.recorded])
+        seats = np.concatenate([chunk[1] for chunk in self.recorded])
+        keys = np.concatenate([chunk[2] for chunk in self.recorded])
+        actions = np.concatenate([chunk[3] for chunk in self.recorded])
+        order = np.argsort(games * self.num_players + seats, kind='stable')
+        return (games * self.num_players + seats)[order], keys[order], actions[order]
+
+    def histories(self):
+        owners, keys, actions = self.records()
+        keys, actions = keys.tolist(), actions.tolist()
+        bounds = np.searchsorted(owners, np.arange(self.num_games * self.num_players + 1)).tolist()
+        winners = self.winners().tolist()
+        histories = []
+        for game in range(self.num_games):
+            game_history = []
+            for seat in range(self.num_players):
+                owner = game * self.num_players + seat
+                start, end = bounds[owner], bounds[owner + 1]
+                game_history.append((keys[start:end], [POLICY_ACTIONS[action] for action in actions[start:end]],
+                                     seat == winners[game]))
+            histories.append(game_history)
+        return histories
+
+
+# like play_trajectories, but the games are played in batches of batch_size by a BatchSimulator; only one
+# batch of histories is held at a time
+def batch_trajectories(player_type, num_games, batch_size=10000, seed=None, num_players=2):
+    rng = np.random.default_rng(seed)
+    while num_games > 0:
+        batch = min(batch_size, num_games)
+        simulator = BatchSimulator([player_type] * num_players, batch, rng.integers(2 ** 63))
+        for game_history in simulator.run():
+            for seat, (states, actions, did_win) in enumerate(game_history):
+                player_ID = f'Player{seat + 1}'
+                outcome = PlayerOutcome(did_win, len(states))
+                for state, action in zip(states, actions):
+                    yield state, action, player_ID, outcome
+        num_games -= batch
+
+
+# like observe_games, but with the games played by a BatchSimulator
+def observe_batch_games(player_type, num_games, batch_size=10000, seed=None, num_players=2):
+    return aggregate_win_loss(batch_trajectories(player_type, num_games, batch_size, seed, num_players))
+
+
+# add the game lengths of a finished batch to a ValueTable in one go
+# every move's game length is the number of moves its player made; the moves are grouped by (state, action) with a
+# sort, so the table gets one update per distinct pair with its total and count, in the order the pairs were first
+# seen, which leaves it exactly as aggregate_survival would over the same games
+def aggregate_survival_batch(simulator, policy=None):
+    if policy is None:
+        policy = ValueTable()
+    owners, keys, actions = simulator.records()
+    if len(keys) == 0:
+        return policy
+    num_moves = np.bincount(owners, minlength=simulator.num_games * simulator.num_players)[owners]
+    order = np.lexsort((actions, keys))
+    keys, actions = keys[order], actions[order]
+    starts = np.flatnonzero(np.concatenate([[True], (keys[1:] != keys[:-1]) | (actions[1:] != actions[:-1])]))
+    totals = np.add.reduceat(num_moves[order], starts)
+    counts = np.diff(np.append(starts, len(keys)))
+    # with a stable sort the first record of each pair is its earliest
+    first_seen = np.argsort(order[starts])
+    for state, action, total, count in zip(keys[starts][first_seen].tolist(), actions[starts][first_seen].tolist(),
+                                           totals[first_seen].tolist(), counts[first_seen].tolist()):
+        policy.update(state, POLICY_ACTIONS[action], total, count)
+    return policy
+
+
+# like observe_survival, but with the games played in batches of batch_size by a BatchSimulator
+def observe_batch_survival(player_type, num_games, batch_size=10000, seed=None, num_players=2):
+    policy = ValueTable()
+    rng = np.random.default_rng(seed)
+    while num_games > 0:
+        batch = min(batch_size, num_games)
+        simulator = BatchSimulator([player_type] * num_players, batch, rng.integers(2 ** 63))
+        simulator.play()
+        aggregate_survival_batch(simulator, policy)
+        num_games -= batch
+    return policy
+
+
+if __name__ == "__main__":
+    for player_types in [(Player, Player), (SmartPlayer, Player)]:
+        names = ' v '.join(player_type.__name__ for player_type in player_types)
+        start = time.perf_counter()
+        simulator = BatchSimulator(list(player_types), 20000, seed=0)
+        simulator.run()
+        rate = 20000 / (time.perf_counter() - start)
+        wins = np.bincount(simulator.winners(), minlength=len(player_types))
+        print(f"{names} batched: {rate:.0f} games/sec, wins per seat {wins.tolist()}")
+    start = time.perf_counter()
+    observe_batch_games(SmartPlayer, 20000, seed=0)
+    print(f"observe_batch_games: {20000 / (time.perf_counter() - start):.0f} games/sec")
+    start = time.perf_counter()
+    observe_games(SmartPlayer, 20000, seed=0)
+    print(f"observe_games: {20000 / (time.perf_counter() - start):.0f} games/sec")
+    start = time.perf_counter()
+    aggregate_survival(batch_trajectories(Player, 20000, seed=0))
+    print(f"aggregate_survival over batch_trajectories: {20000 / (time.perf_counter() - start):.0f} games/sec")
+    start = time.perf_counter()
+    observe_batch_survival(Player, 20000, seed=0)
+    print(f"observe_batch_survival: {20000 / (time.perf_counter() - start):.0f} games/sec")
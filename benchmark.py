@@ -0,0 +1,225 @@
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from CS4100ExplodingKittens import (Player, NonRandomPlayer, SmartPlayer, ObservedPolicyPlayer, SurvivalAgent, Game,
+                                    GameProfile, game_rng, save_policy, load_policy, SURVIVAL_POLICY_FILE,
+                                    OBSERVED_POLICY_FILE)
+
+
+# Benchmarks for simulation throughput and training cost
+# Every matchup from the __main__ block of CS4100ExplodingKittens.py is played for a fixed number of seeded games
+# and timed, and both agents are trained once and timed. Each case runs in a fresh process so its peak RSS is its
+# own. Results are written as JSON so two commits can be compared with --compare
+#
+#   python benchmark.py --output before.json
+#   python benchmark.py --output after.json
+#   python benchmark.py --compare before.json after.json
+
+# name -> the two player classes, in seat order, exactly as the __main__ block plays them
+MATCHUPS = {
+    'Random v Random': (Player, Player),
+    'Random v NonRandom': (Player, NonRandomPlayer),
+    'Random v Smart': (Player, SmartPlayer),
+    'Smart v NonRandom': (SmartPlayer, NonRandomPlayer),
+    'Random v Survival': (Player, SurvivalAgent),
+    'Random v OPP': (Player, ObservedPolicyPlayer),
+}
+
+# name -> the agent trained, the player type it watches and the policy file it is saved to
+TRAININGS = {
+    'Survival training': (SurvivalAgent, Player, SURVIVAL_POLICY_FILE),
+    'OPP training': (ObservedPolicyPlayer, SmartPlayer, OBSERVED_POLICY_FILE),
+}
+
+
+# the peak resident set size of this process in KB (ru_maxrss is in KB on Linux but in bytes on macOS)
+def peak_rss_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+# fresh players for one game; policy agents share the loaded policy of their class
+def make_players(player_types, policies):
+    players = []
+    for seat, player_type in enumerate(player_types):
+        player = player_type(f'Player{seat + 1}')
+        if player_type in policies:
+            player.policy = policies[player_type]
+        players.append(player)
+    return players
+
+
+# play num_games seeded games of a matchup and count wins; engine(players, rng) makes each game
+def play_matchup(player_types, policies, num_games, seed, engine):
+    wins = {f'Player{seat + 1}': 0 for seat in range(len(player_types))}
+    for i in range(num_games):
+        players = make_players(player_types, policies)
+        game = engine(players, game_rng(seed, i))
+        game.start_game()
+        wins[game.decide_winner()] += 1
+    return wins
+
+
+def run_matchup(name, num_games, phase_games, seed, policy_paths):
+    player_types = MATCHUPS[name]
+    policies = {agent: load_policy(path) for agent, path in policy_paths.items() if agent in player_types}
+    start_rss = peak_rss_kb()
+    start = time.perf_counter()
+    wins = play_matchup(player_types, policies, num_games, seed, lambda players, rng: Game(players, rng=rng))
+    seconds = time.perf_counter() - start
+
+    # the profile's timers cost a perf_counter call per lookup, so phases get their own pass and games/sec
+    # always comes from a plain Game
+    profile = GameProfile()
+    play_matchup(player_types, policies, phase_games, seed, lambda players, rng: Game(players, profile, rng))
+    # every decision of every kind of player looks up its game state once, and policy agents don't keep a
+    # game_states history, so decisions are counted as the state lookups of the phase pass
+    decisions_per_game = profile.calls['state_encoding'] / phase_games if phase_games else None
+    timings = {
+        'deal': profile.times['start_game'] - profile.times['play_game'],
+        'turn_loop': profile.times['play_game'],
+        'state_encoding': profile.times['state_encoding'],
+        'policy_lookup': profile.times['policy_lookup'],
+    }
+
+    policy_states = sum(len(policy) for policy in policies.values())
+    policy_bytes = sum(policy.nbytes() for policy in policies.values())
+    for policy in policies.values():
+        policy.close()
+    return {
+        'name': name,
+        'kind': 'matchup',
+        'games': num_games,
+        'seconds': seconds,
+        'games_per_sec': num_games / seconds,
+        'decisions_per_game': decisions_per_game,
+        'decisions_per_sec': None if decisions_per_game is None else decisions_per_game * num_games / seconds,
+        'wins': wins,
+        'start_rss_kb': start_rss,
+        'peak_rss_kb': peak_rss_kb(),
+        'policy_states': policy_states,
+        'policy_bytes': policy_bytes,
+        # seconds per game spent in each phase; the turn loop includes state encoding and policy lookups
+        'phase_games': phase_games,
+        'phases': {phase: total / phase_games for phase, total in timings.items()} if phase_games else {},
+        # the full GameProfile of the phase pass, {name: {'calls': n, 'seconds': s}}
+        'profile': profile.to_dict(),
+    }
+
+
+def run_training(name, num_games, seed, policy_dir):
+    agent_type, player_type, file_name = TRAININGS[name]
+    agent = agent_type('Player1')
+    start_rss = peak_rss_kb()
+    start = time.perf_counter()
+    # SurvivalAgent.train prints its progress, which would only clutter the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        agent.train(player_type, num_games, seed=seed)
+    seconds = time.perf_counter() - start
+    save_policy(agent.policy, os.path.join(policy_dir, file_name))
+    return {
+        'name': name,
+        'kind': 'training',
+        'games': num_games,
+        'seconds': seconds,
+        'games_per_sec': num_games / seconds,
+        'start_rss_kb': start_rss,
+        'peak_rss_kb': peak_rss_kb(),
+        'policy_states': len(agent.policy),
+        'policy_bytes': agent.policy.nbytes(),
+    }
+
+
+# run one case in its own process so the peak RSS is not inherited from earlier cases
+def run_isolated(function, *args):
+    with multiprocessing.Pool(1) as pool:
+        return pool.apply(function, args)
+
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_benchmarks(num_games=2000, phase_games=500, train_games=20000, seed=0, only=None):
+    results = {
+        'commit': current_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'seed': seed,
+        'cases': [],
+    }
+    # the policy matchups use the policies trained here, so every run compares like with like
+    with tempfile.TemporaryDirectory() as policy_dir:
+        for name in TRAININGS:
+            case = run_isolated(run_training, name, train_games, seed, policy_dir)
+            print(f"{name}: {case['seconds']:.1f}s, {case['games_per_sec']:.0f} games/sec, "
+                  f"{case['policy_states']} states, {case['policy_bytes'] / 2 ** 20:.1f} MB, "
+                  f"peak RSS {case['peak_rss_kb'] / 1024:.0f} MB")
+            if only is None or name in only:
+                results['cases'].append(case)
+        policy_paths = {agent_type: os.path.join(policy_dir, file_name)
+                        for agent_type, _, file_name in TRAININGS.values()}
+        for name in MATCHUPS:
+            if only is not None and name not in only:
+                continue
+            case = run_isolated(run_matchup, name, num_games, phase_games, seed, policy_paths)
+            phases = ', '.join(f"{phase} {seconds * 1e6:.0f}us" for phase, seconds in case['phases'].items())
+            decisions = 'no' if case['decisions_per_sec'] is None else f"{case['decisions_per_sec']:.0f}"
+            print(f"{name}: {case['games_per_sec']:.0f} games/sec, {decisions} decisions/sec, "
+                  f"peak RSS {case['peak_rss_kb'] / 1024:.0f} MB, {case['wins']}")
+            print(f"    per game: {phases}")
+            results['cases'].append(case)
+    return results
+
+
+# print how each case changed between two result files
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{old['commit']} -> {new['commit']}")
+    old_cases = {case['name']: case for case in old['cases']}
+    for case in new['cases']:
+        before = old_cases.get(case['name'])
+        if before is None:
+            print(f"{case['name']}: new case")
+            continue
+        speedup = case['games_per_sec'] / before['games_per_sec']
+        rss = (case['peak_rss_kb'] - before['peak_rss_kb']) / 1024
+        print(f"{case['name']}: {before['games_per_sec']:.0f} -> {case['games_per_sec']:.0f} games/sec "
+              f"({speedup:.2f}x), peak RSS {rss:+.1f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark simulation throughput and training cost')
+    parser.add_argument('--games', type=int, default=2000, help='games played per matchup')
+    parser.add_argument('--phase-games', type=int, default=500, help='games played with phase timers per matchup')
+    parser.add_argument('--train-games', type=int, default=20000, help='games observed per training run')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', nargs='+', help='only report these cases (training always runs)')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files and exit')
+    args = parser.parse_args()
+    if args.compare:
+        compare(*args.compare)
+    else:
+        results = run_benchmarks(args.games, args.phase_games, args.train_games, args.seed, args.only)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"results written to {args.output}")
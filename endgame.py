@@ -0,0 +1,366 @@
+import math
+import time
+from itertools import islice
+from CS4100ExplodingKittens import Player, NonRandomPlayer, SmartPlayer, Card, CARD_CODES, CARD_TYPES, CAT_CARDS
+from fast_game import (DEFUSE, EXPLODING_KITTEN, ATTACK, SKIP, SEE_THE_FUTURE, SHUFFLE, FAVOR, CAT_CODES,
+                       SINGLE_CODES, NUM_CARD_TYPES, NON_RANDOM_GIVE_ORDER)
+
+
+# An exact endgame solver
+# Once two players are left and the deck is short, the rest of the game is small enough to search completely.
+# EndgameSolver works out the chance that the solving player (ME) wins with expectimax: ME takes the best move,
+# every card drawn from an unknown spot of the deck, every card taken at random and the opponent's moves are
+# averaged over. The opponent is played the way Player plays: it keeps playing with probability 1/2, picks a card
+# at random, gives random cards away and replants the kitten at a random spot. ME gives cards like NonRandomPlayer.
+# The rules of Game.play_card, Game.draw_card and Game.reinsert_exploding_kitten are written out again here on card
+# counts rather than played on copies of a Game or FastGame: a Game holds one order of the deck and one opponent
+# hand, while the search has to average over every order and hand ME cannot tell apart, and positions ME cannot tell
+# apart have to be one table entry. test_endgame.py plays the same moves with Game on small decks and checks that
+# they lead to the positions the solver expects, as often, so a change to the rules in one place and not the other
+# fails there.
+#
+# A position is canonical, the same whichever seat ME sits in:
+#   slots: the deck, top card first, as the card codes ME knows and UNKNOWN everywhere else
+#   hidden: the counts of the cards in the UNKNOWN slots, which are equally likely to be in any order
+#   hands: the card counts of ME's hand and the opponent's
+#   the player on turn, the attack counter and whether the player on turn could steal when the turn started
+# ME knows the cards it saw with See The Future and where it replanted a kitten, and forgets everything but the
+# kitten it replanted whenever the deck is shuffled or a kitten replanted, just as Game clears future_seen. Every
+# position solved is kept in the solver's transposition table, which EndgamePlayers share across games; its keys are
+# the position packed into bytes, a few times smaller than the tuples.
+#
+#   run_tournament({'Endgame': EndgamePlayer, 'Random': Player}, games=1000)
+
+# a slot ME does not know; one past the card codes, so slots fit in bytes like the counts
+UNKNOWN = NUM_CARD_TYPES
+ME = 0
+OPPONENT = 1
+
+
+# a copy of a tuple of counts with delta added at index code
+def add_count(counts, code, delta):
+    counts = list(counts)
+    counts[code] += delta
+    return tuple(counts)
+
+
+# the same hands with one player's hand replaced
+def with_hand(hands, player, hand):
+    return (hand, hands[1]) if player == ME else (hands[0], hand)
+
+
+# a deck where ME has forgotten every card it knew: all its slots are unknown
+def forget(slots, hidden):
+    hidden = list(hidden)
+    for code in slots:
+        if code != UNKNOWN:
+            hidden[code] += 1
+    return (UNKNOWN,) * len(slots), tuple(hidden)
+
+
+# every way the top count cards of a deck can turn out, as (probability, slots, hidden) with those slots known
+def reveal(slots, hidden, count):
+    outcomes = [(1.0, slots, hidden)]
+    for i in range(min(count, len(slots))):
+        revealed = []
+        for probability, outcome_slots, outcome_hidden in outcomes:
+            if outcome_slots[i] != UNKNOWN:
+                revealed.append((probability, outcome_slots, outcome_hidden))
+                continue
+            total = sum(outcome_hidden)
+            for code, number in enumerate(outcome_hidden):
+                if number:
+                    revealed.append((probability * number / total, outcome_slots[:i] + (code,) + outcome_slots[i + 1:],
+                                     add_count(outcome_hidden, code, -1)))
+        outcomes = revealed
+    return outcomes
+
+
+# the card codes a hand can play; Favors and cat pairs only if the player could steal when the turn started
+def playable(hand, can_steal):
+    codes = [code for code in SINGLE_CODES if hand[code]]
+    if can_steal:
+        if hand[FAVOR]:
+            codes.append(FAVOR)
+        codes.extend(code for code in CAT_CODES if hand[code] > 1)
+    return codes
+
+
+class EndgameSolver:
+    # max_positions: the table is emptied when it gets this big, so a long tournament cannot run out of memory
+    def __init__(self, max_positions=2000000):
+        self.max_positions = max_positions
+        # canonical position at the start of a card play -> the chance that ME wins from it
+        self.table = {}
+        self.hits = 0
+
+    def __len__(self):
+        return len(self.table)
+
+    # the chance ME wins from the start of player's turn
+    def turn_value(self, slots, hidden, hands, player, attack):
+        can_steal = sum(hands[1 - player]) > 0
+        return self.play_value(slots, hidden, hands, player, attack, can_steal)
+
+    # the chance ME wins when player is about to play a card or finish the turn
+    def play_value(self, slots, hidden, hands, player, attack, can_steal):
+        key = bytes((player, attack, can_steal) + hidden + hands[0] + hands[1] + slots)
+        value = self.table.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        finish = self.draw_value(slots, hidden, hands, player, attack)
+        codes = playable(hands[player], can_steal)
+        if player == ME:
+            value = finish
+            for code in codes:
+                card = self.card_value(slots, hidden, hands, player, attack, can_steal, code)
+                if card is not None and card > value:
+                    value = card
+        elif codes:
+            # Player.player_card_play: stop with probability 1/2, otherwise play a random card and go again; a
+            # Favor with nobody to ask changes nothing, so its share of the value is the value itself
+            total = 0.0
+            unchanged = 0
+            for code in codes:
+                card = self.card_value(slots, hidden, hands, player, attack, can_steal, code)
+                if card is None:
+                    unchanged += 1
+                else:
+                    total += card
+            value = (0.5 * finish + 0.5 * total / len(codes)) / (1 - 0.5 * unchanged / len(codes))
+        else:
+            value = finish
+        if len(self.table) >= self.max_positions:
+            self.table.clear()
+        self.table[key] = value
+        return value
+
+    # the chance ME wins after player plays the card code, or None if playing it changes nothing (a Favor with
+    # nobody to ask goes back into the hand)
+    def card_value(self, slots, hidden, hands, player, attack, can_steal, code):
+        other = 1 - player
+        if code == FAVOR and sum(hands[other]) == 0:
+            return None
+        hand = add_count(hands[player], code, -2 if code in CAT_CODES else -1)
+        hands = with_hand(hands, player, hand)
+        if code == ATTACK:
+            return self.next_turn(slots, hidden, hands, player, attack + 1)
+        if code == SKIP:
+            return self.next_turn(slots, hidden, hands, player, attack)
+        if code == SEE_THE_FUTURE:
+            # only what ME sees changes what ME knows; the opponent plays the same whatever it saw
+            if player == OPPONENT:
+                return self.play_value(slots, hidden, hands, player, attack, can_steal)
+            return sum(probability * self.play_value(seen_slots, seen_hidden, hands, player, attack, can_steal)
+                       for probability, seen_slots, seen_hidden in reveal(slots, hidden, 3))
+        if code == SHUFFLE:
+            slots, hidden = forget(slots, hidden)
+            return self.play_value(slots, hidden, hands, player, attack, can_steal)
+        target = hands[other]
+        target_size = sum(target)
+        if target_size == 0:
+            # a cat pair with nobody to take from is spent for nothing
+            return self.play_value(slots, hidden, hands, player, attack, can_steal)
+        if code == FAVOR and other == ME:
+            for given in NON_RANDOM_GIVE_ORDER:
+                if target[given]:
+                    break
+            return self.play_value(slots, hidden, self.take(hands, player, given), player, attack, can_steal)
+        # a cat pair always takes a random card, and so does a Favor asking the opponent
+        return sum(number / target_size
+                   * self.play_value(slots, hidden, self.take(hands, player, given), player, attack, can_steal)
+                   for given, number in enumerate(target) if number)
+
+    # player takes one card of code from the other player
+    def take(self, hands, player, code):
+        other = 1 - player
+        hands = with_hand(hands, other, add_count(hands[other], code, -1))
+        return with_hand(hands, player, add_count(hands[player], code, 1))
+
+    # the chance ME wins once player finishes the turn and draws
+    def draw_value(self, slots, hidden, hands, player, attack):
+        if slots[0] != UNKNOWN:
+            return self.after_draw(slots[0], slots[1:], hidden, hands, player, attack)
+        total = sum(hidden)
+        return sum(number / total * self.after_draw(code, slots[1:], add_count(hidden, code, -1), hands, player,
+                                                    attack)
+                   for code, number in enumerate(hidden) if number)
+
+    def after_draw(self, code, slots, hidden, hands, player, attack):
+        if code != EXPLODING_KITTEN:
+            return self.next_turn(slots, hidden, with_hand(hands, player, add_count(hands[player], code, 1)), player,
+                                  attack)
+        if hands[player][DEFUSE] == 0:
+            return 0.0 if player == ME else 1.0
+        hands = with_hand(hands, player, add_count(hands[player], DEFUSE, -1))
+        slots, hidden = forget(slots, hidden)
+        if player == OPPONENT:
+            # replanted at a random spot ME does not see, so the kitten could be anywhere
+            return self.next_turn(slots + (UNKNOWN,), add_count(hidden, EXPLODING_KITTEN, 1), hands, player, attack)
+        return max(self.replant_values(slots, hidden, hands, attack))
+
+    # the chance ME wins for every spot ME can replant a kitten at, from the top of the deck down
+    def replant_values(self, slots, hidden, hands, attack):
+        return [self.next_turn(slots[:spot] + (EXPLODING_KITTEN,) + slots[spot:], hidden, hands, ME, attack)
+                for spot in range(len(slots) + 1)]
+
+    # Game.next_turn: a queued attack gives the same player another turn
+    def next_turn(self, slots, hidden, hands, player, attack):
+        if attack == 0:
+            return self.turn_value(slots, hidden, hands, 1 - player, 0)
+        return self.turn_value(slots, hidden, hands, player, attack - 1)
+
+
+# every position the solver shares; EndgamePlayers use it unless given their own
+SHARED_SOLVER = EndgameSolver()
+
+
+# every way to deal the opponent's hand out of the unknown cards, as (probability, hand of card counts, hidden
+# counts of the rest), for an opponent with defuses Defuses and size cards in all; kittens are never in a hand
+def opponent_deals(pool, defuses, size):
+    total = sum(pool) - pool[EXPLODING_KITTEN]
+    ways = math.comb(total, size - defuses)
+
+    def deal(code, left):
+        if code == NUM_CARD_TYPES:
+            if left == 0:
+                yield 1, ()
+            return
+        most = 0 if code == EXPLODING_KITTEN else min(left, pool[code])
+        for count in range(most + 1):
+            for deal_ways, rest in deal(code + 1, left - count):
+                yield math.comb(pool[code], count) * deal_ways, (count,) + rest
+
+    for deal_ways, hand in deal(0, size - defuses):
+        hidden = tuple(number - count for number, count in zip(pool, hand))
+        yield deal_ways / ways, add_count(hand, DEFUSE, defuses), hidden
+
+
+# plays like NonRandomPlayer until two players are left, the deck has threshold cards or fewer and the two hands
+# max_cards or fewer between them, then plays and replants with an EndgameSolver; positions grow with the cards in
+# the hands as much as with the deck, since every card can be played or stolen in any order
+# the opponent's hand is the only thing the solver cannot average over itself, so every possible hand is solved and
+# weighted by how likely it is; with more than max_deals possible hands, max_deals of them are dealt at random
+class EndgamePlayer(NonRandomPlayer):
+    def __init__(self, ID, threshold=4, max_cards=10, max_deals=8, solver=None):
+        super().__init__(ID)
+        self.threshold = threshold
+        self.max_cards = max_cards
+        self.max_deals = max_deals
+        self.solver = SHARED_SOLVER if solver is None else solver
+        # the game being played, for replanting (choose_spot_in_deck is not passed it)
+        self.game = None
+
+    def __repr__(self):
+        return 'Endgame Player'
+
+    # whether the game is small enough to solve; the deck and the hands are counted as they are when a turn starts
+    # or a kitten is replanted
+    def in_endgame(self, game):
+        if game.players_left != 2 or len(game.deck) > self.threshold:
+            return False
+        return len(self.hand) + len(self.living_opponents()[0].hand) <= self.max_cards
+
+    # the deck as this player knows it: the cards it saw on top and the kitten it replanted, if the deck has not
+    # been reordered since
+    def known_slots(self, game):
+        slots = [UNKNOWN] * len(game.deck)
+        for i, card in enumerate(self.future_seen):
+            slots[i] = CARD_CODES[card.card_type]
+        if self.kitten_depth is not None:
+            slots[self.kitten_depth] = EXPLODING_KITTEN
+        return tuple(slots)
+
+    # (probability, hands, hidden) for the opponent's possible hands
+    # the unknown cards are the ones in the unknown slots and the opponent's hand apart from its Defuses, which the
+    # game state shows; like monte_carlo.determinize, they are read off the game, as counting the cards played would
+    def deals(self, game, slots):
+        opponent = self.living_opponents()[0]
+        pool = [0] * NUM_CARD_TYPES
+        for i, slot in enumerate(slots):
+            if slot == UNKNOWN:
+                pool[CARD_CODES[game.deck[-1 - i].card_type]] += 1
+        defuses = 0
+        for card in opponent.hand:
+            if card.card_type == 'Defuse':
+                defuses += 1
+            else:
+                pool[CARD_CODES[card.card_type]] += 1
+        hand = [0] * NUM_CARD_TYPES
+        for card in self.hand:
+            hand[CARD_CODES[card.card_type]] += 1
+        hand = tuple(hand)
+        deals = list(islice(opponent_deals(pool, defuses, len(opponent.hand)), self.max_deals + 1))
+        if len(deals) > self.max_deals:
+            cards = [code for code, number in enumerate(pool) if code != EXPLODING_KITTEN for i in range(number)]
+            deals = []
+            for i in range(self.max_deals):
+                dealt = self.rng.sample(cards, len(opponent.hand) - defuses)
+                opponent_hand = [0] * NUM_CARD_TYPES
+                for code in dealt:
+                    opponent_hand[code] += 1
+                hidden = tuple(number - count for number, count in zip(pool, opponent_hand))
+                deals.append((1 / self.max_deals, add_count(opponent_hand, DEFUSE, defuses), hidden))
+        return [(probability, (hand, opponent_hand), hidden) for probability, opponent_hand, hidden in deals]
+
+    # the card to play next, or None to finish the turn, by the chance to win averaged over the opponent's hands
+    def endgame_move(self, game, can_steal):
+        slots = self.known_slots(game)
+        codes = []
+        values = []
+        for probability, hands, hidden in self.deals(game, slots):
+            if not codes:
+                codes = [None] + playable(hands[ME], can_steal)
+                values = [0.0] * len(codes)
+            for i, code in enumerate(codes):
+                if code is None:
+                    value = self.solver.draw_value(slots, hidden, hands, ME, game.attack_counter)
+                else:
+                    value = self.solver.card_value(slots, hidden, hands, ME, game.attack_counter, can_steal, code)
+                # a Favor with nobody to ask would come straight back
+                values[i] += probability * (-1.0 if value is None else value)
+        best = max(range(len(codes)), key=lambda i: values[i])
+        return None if codes[best] is None else CARD_TYPES[codes[best]]
+
+    def player_card_play(self, game):
+        self.game = game
+        if not self.in_endgame(game):
+            super().player_card_play(game)
+            return
+        # whether anyone can be stolen from is only checked at the start of the turn, like the other agents
+        can_steal = self.can_steal()
+        while not self.skipping:
+            action = self.endgame_move(game, can_steal)
+            if action is None:
+                break
+            self.game_states.append(self.get_game_state(game))
+            self.actions.append('Cat' if action in CAT_CARDS else action)
+            game.last_played = Card(action)
+            game.play_card(self, action)
+        self.game_states.append(self.get_game_state(game))
+        self.actions.append('Finish Turn')
+
+    # the top spot outside the endgame, like NonRandomPlayer; in it, the spot with the best chance to win
+    # the game has already taken the kitten and the Defuse, so deck_size is one more than the deck
+    def choose_spot_in_deck(self, deck_size):
+        game = self.game
+        if game is None or not self.in_endgame(game):
+            return super().choose_spot_in_deck(deck_size)
+        values = [0.0] * deck_size
+        slots = (UNKNOWN,) * (deck_size - 1)
+        for probability, hands, hidden in self.deals(game, slots):
+            for spot, value in enumerate(self.solver.replant_values(slots, hidden, hands, game.attack_counter)):
+                values[spot] += probability * value
+        return max(range(deck_size), key=lambda spot: values[spot])
+
+
+if __name__ == "__main__":
+    from tournament import run_tournament, print_results
+    for opponent in [Player, NonRandomPlayer, SmartPlayer]:
+        start = time.perf_counter()
+        print_results(run_tournament({'Endgame': EndgamePlayer, opponent.__name__: opponent}, games=500, seed=0,
+                                     workers=1))
+        print_results(run_tournament({'NonRandom': NonRandomPlayer, opponent.__name__: opponent}, games=500, seed=0,
+                                     workers=1))
+        print(f"{time.perf_counter() - start:.1f}s, {len(SHARED_SOLVER)} positions solved")
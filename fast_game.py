@@ -0,0 +1,615 @@
+import functools
+import random
+import time
+from CS4100ExplodingKittens import (Player, NonRandomPlayer, SmartPlayer, Card, Game, CARD_TYPES, CARD_CODES,
+                                    DECK_SIZE_SHIFT, FUTURE_SHIFT, ATTACK_SHIFT, DEFUSES_OWNED_SHIFT,
+                                    DEFUSES_WITH_OPP_SHIFT, NUM_OPPONENTS_SHIFT,
+                                    OPPONENT_HANDS_SHIFT, HAND_SIZE_BITS, hand_bits, deck_card_counts,
+                                    check_num_players, kitten_risk, risk_state_key)
+
+
+# A faster engine for Exploding Kittens
+# Cards are small integers (their index in CARD_TYPES), hands are lists of per-type counts and the deck is a
+# list of codes with the top card at the end, so draws are a pop() from the end
+# Player, NonRandomPlayer and SmartPlayer are played natively on the counts; any other Player subclass is
+# plugged in through an adapter that keeps every player's hand list in sync so its own methods keep working
+# Against the original Game, Player v Player runs about 5-6x as fast recording game states, as training does, and
+# about 9-10x without recording; recording spends most of the difference encoding the states themselves
+
+DEFUSE = CARD_CODES['Defuse']
+EXPLODING_KITTEN = CARD_CODES['Exploding Kitten']
+ATTACK = CARD_CODES['Attack']
+SKIP = CARD_CODES['Skip']
+SEE_THE_FUTURE = CARD_CODES['See The Future']
+SHUFFLE = CARD_CODES['Shuffle']
+FAVOR = CARD_CODES['Favor']
+TACOCAT = CARD_CODES['Tacocat']
+CATTERMELON = CARD_CODES['Cattermelon']
+RAINBOW_RALPHING_CAT = CARD_CODES['Rainbow-Ralphing Cat']
+NUM_CARD_TYPES = len(CARD_TYPES)
+CAT_CODES = (TACOCAT, CATTERMELON, RAINBOW_RALPHING_CAT)
+# cards that can be played on their own
+SINGLE_CODES = (ATTACK, SKIP, SEE_THE_FUTURE, SHUFFLE)
+
+# one shared Card per type, used for the hand lists of adapted players and for future_seen
+CARDS = tuple(Card(card_type) for card_type in CARD_TYPES)
+
+# the action recorded in a player's history for each card code
+ACTION_NAMES = tuple('Cat' if code in CAT_CODES else card_type for code, card_type in enumerate(CARD_TYPES))
+# the order a NonRandomPlayer gives cards away in
+NON_RANDOM_GIVE_ORDER = tuple(CARD_CODES[name] for name in
+                              ['Tacocat', 'Cattermelon', 'Rainbow-Ralphing Cat', 'Favor', 'Shuffle',
+                               'See The Future', 'Skip', 'Attack', 'Defuse'])
+
+# agents the engine plays natively; only exact types count, so subclasses with their own decisions get adapted
+RANDOM_AGENT = 0
+NON_RANDOM_AGENT = 1
+SMART_AGENT = 2
+NATIVE_AGENTS = {
+    Player: RANDOM_AGENT,
+    NonRandomPlayer: NON_RANDOM_AGENT,
+    SmartPlayer: SMART_AGENT
+}
+
+
+# the helpers below take rand, the random() method of the game's RNG
+# a uniform random integer in [0, n); int(random() * n) is several times cheaper than randrange(n)
+def random_below(rand, n):
+    return int(rand() * n)
+
+
+# shuffle in place by sorting on random keys; every order is equally likely (ties between two random floats
+# are vanishingly rare) and the sort runs in C, so this is about twice as fast as random.shuffle
+def shuffle_cards(rand, cards):
+    cards.sort(key=lambda card: rand())
+
+
+# a random card out of a hand of card counts, each card equally likely (like random.choice(player.hand))
+def random_card(rand, hand, hand_size):
+    pick = random_below(rand, hand_size)
+    for code in range(NUM_CARD_TYPES):
+        pick -= hand[code]
+        if pick < 0:
+            return code
+
+
+class FastGame:
+    # record_states=False skips building the game_states/actions history of native players, for runs that
+    # only need the winner
+    def __init__(self, players, record_states=True, rng=None):
+        self.record_states = record_states
+        # the game's own RNG, shared with its players (see Game)
+        self.rng = rng if rng is not None else random.Random(random.getrandbits(64))
+        for player in players:
+            player.rng = self.rng
+        # the most recently-played card
+        self.last_played = None
+        self.num_players = len(players)
+        check_num_players(self.num_players)
+        self.hand_size = 7
+        self.exploding_kittens = self.num_players - 1
+        # the number of each card type in a fresh deck
+        self.deck_counts = fresh_deck_counts(self.num_players)
+        # the draw pile as card codes, top card last
+        self.deck = []
+        self.player_list = players
+        # seat of each player in player_list
+        self.seats = {player: seat for seat, player in enumerate(players)}
+        # card counts of each player's hand, and the total number of cards in it
+        self.hands = [[0] * NUM_CARD_TYPES for _ in players]
+        self.hand_sizes = [0] * self.num_players
+        # seats of everyone but the player in each seat
+        self.others = seat_others(self.num_players)
+        # how the engine runs each player, or None if the player is adapted
+        self.agents = [NATIVE_AGENTS.get(type(player)) for player in players]
+        # adapted players read Card lists (their own and their opponents'), so keep them if any are present
+        self.track_hands = None in self.agents
+        self.turn = -1
+        self.players_left = self.num_players
+        self.attack_counter = 0
+        # Shuffles and replanted kittens so far (see Game)
+        self.deck_changes = 0
+
+    # a FastGame at the same point as a Game that is being played, with a clone of every player (see Player.clone)
+    # played as player_type; lets a player look ahead from the middle of a Game on the faster engine
+    @classmethod
+    def from_game(cls, game, player_type=None, record_states=False, rng=None):
+        players = [player.clone(player_type) for player in game.player_list]
+        fast_game = cls(players, record_states, rng)
+        fast_game.last_played = game.last_played
+        fast_game.deck = [CARD_CODES[card.card_type] for card in game.deck]
+        fast_game.hands = [list(game.hand_counts[player]) for player in game.player_list]
+        fast_game.hand_sizes = [len(player.hand) for player in game.player_list]
+        fast_game.turn = game.turn
+        fast_game.players_left = game.players_left
+        fast_game.attack_counter = game.attack_counter
+        fast_game.deck_changes = game.deck_changes
+        for player in players:
+            player.other_players = [p for p in players if p is not player]
+        return fast_game
+
+    # a copy of the game at the same point, with every player cloned as player_type
+    # only the deck and the hands are copied, so a snapshot costs a few short list copies instead of a deepcopy,
+    # and playing the copy on leaves this game as it was
+    def clone(self, player_type=None, rng=None):
+        players = [player.clone(player_type) for player in self.player_list]
+        fast_game = FastGame.__new__(FastGame)
+        fast_game.__dict__.update(self.__dict__)
+        fast_game.rng = rng if rng is not None else random.Random(self.rng.getrandbits(64))
+        fast_game.player_list = players
+        fast_game.seats = {player: seat for seat, player in enumerate(players)}
+        fast_game.deck = list(self.deck)
+        fast_game.hands = [list(hand) for hand in self.hands]
+        fast_game.hand_sizes = list(self.hand_sizes)
+        fast_game.agents = [NATIVE_AGENTS.get(type(player)) for player in players]
+        fast_game.track_hands = None in fast_game.agents
+        for player in players:
+            player.rng = fast_game.rng
+            player.other_players = [p for p in players if p is not player]
+        return fast_game
+
+    def add_card(self, seat, code):
+        self.hands[seat][code] += 1
+        self.hand_sizes[seat] += 1
+        if self.track_hands:
+            self.player_list[seat].hand.append(CARDS[code])
+
+    def remove_card(self, seat, code):
+        self.hands[seat][code] -= 1
+        self.hand_sizes[seat] -= 1
+        # hands cloned from a Game hold its own Card objects, so the card is found by type
+        if self.track_hands:
+            hand = self.player_list[seat].hand
+            for i, card in enumerate(hand):
+                if card.card_type == CARD_TYPES[code]:
+                    del hand[i]
+                    break
+
+    # the encoded game state (see encode_game_state) of a player, which is what Player.get_game_state asks for
+    def state_key(self, player):
+        return self.seat_state_key(self.seats[player])
+
+    # the encoded game state from the view of the player in a seat
+    def seat_state_key(self, seat):
+        player = self.player_list[seat]
+        hand = self.hands[seat]
+        others = self.others[seat]
+        key = (hand_bits(hand)
+               | len(self.deck) << DECK_SIZE_SHIFT
+               | self.attack_counter << ATTACK_SHIFT
+               | hand[DEFUSE] << DEFUSES_OWNED_SHIFT)
+        if player.future_seen:
+            key |= (CARD_CODES[player.future_seen[0].card_type] + 1) << FUTURE_SHIFT
+        if player.risk_in_state:
+            kittens, known = player.known_deck()
+            risk_level = kitten_risk(len(self.deck), self.players_left - 1, kittens, known)[1]
+            key |= risk_state_key(risk_level, self.players_left - 1)
+        # with two players the opponent is always alive while anyone is deciding
+        if len(others) == 1:
+            other = others[0]
+            return (key
+                    | self.hands[other][DEFUSE] << DEFUSES_WITH_OPP_SHIFT
+                    | 1 << NUM_OPPONENTS_SHIFT
+                    | self.hand_sizes[other] << OPPONENT_HANDS_SHIFT)
+        # only living opponents count, like Game.state_key
+        living = [other for other in others if self.player_list[other].alive]
+        key |= (sum(self.hands[other][DEFUSE] for other in living) << DEFUSES_WITH_OPP_SHIFT
+                | len(living) << NUM_OPPONENTS_SHIFT)
+        shift = OPPONENT_HANDS_SHIFT
+        for size in sorted([self.hand_sizes[other] for other in living]):
+            key |= size << shift
+            shift += HAND_SIZE_BITS
+        return key
+
+    # the public entry point used by adapted players: play a card by name
+    def play_card(self, player, action):
+        self.play_code(self.seats[player], CARD_CODES[action])
+
+    def play_code(self, seat, code):
+        if code in CAT_CODES:
+            self.remove_card(seat, code)
+        self.remove_card(seat, code)
+        CARD_FUNCTIONS[code](self, seat)
+
+    def play_attack(self, seat):
+        self.player_list[seat].skipping = True
+        self.attack_counter += 1
+
+    def play_skip(self, seat):
+        self.player_list[seat].skipping = True
+
+    def play_see_the_future(self, seat):
+        self.player_list[seat].future_seen = [CARDS[code] for code in reversed(self.deck[-3:])]
+
+    def play_shuffle(self, seat):
+        self.shuffle_deck()
+        self.deck_changes += 1
+        for p in self.player_list:
+            p.future_seen = []
+            p.kitten_depth = None
+
+    # seats of the other living players that have cards to take
+    def targets(self, seat):
+        return [other for other in range(self.num_players)
+                if other != seat and self.hand_sizes[other] > 0 and self.player_list[other].alive]
+
+    def play_favor(self, seat):
+        targets = self.targets(seat)
+        if len(targets) == 0:
+            self.add_card(seat, CARD_CODES[self.last_played.card_type])
+            return
+        player = self.player_list[seat]
+        if self.agents[seat] is None:
+            target = self.seats[player.choose_favor_target()]
+        else:
+            target = targets[random_below(self.rng.random, len(targets))]
+        target_agent = self.agents[target]
+        if target_agent is None:
+            code = CARD_CODES[self.player_list[target].give_card(player).card_type]
+        elif target_agent == RANDOM_AGENT:
+            code = random_card(self.rng.random, self.hands[target], self.hand_sizes[target])
+        else:
+            target_hand = self.hands[target]
+            for code in NON_RANDOM_GIVE_ORDER:
+                if target_hand[code]:
+                    break
+        self.remove_card(target, code)
+        self.add_card(seat, code)
+
+    def play_cat(self, seat):
+        targets = self.targets(seat)
+        if len(targets) != 0:
+            if self.agents[seat] is None:
+                target = self.seats[self.player_list[seat].choose_cat_target()]
+            else:
+                target = targets[random_below(self.rng.random, len(targets))]
+            # choice is always random
+            code = random_card(self.rng.random, self.hands[target], self.hand_sizes[target])
+            self.remove_card(target, code)
+            self.add_card(seat, code)
+
+    def play_game(self):
+        if self.track_hands:
+            self.play_adapted_game()
+        else:
+            self.play_native_game()
+
+    # the game loop for tables with adapted players: every decision goes through take_turn
+    def play_adapted_game(self):
+        while self.players_left > 1 and self.deck:
+            if self.attack_counter == 0:
+                self.turn = self.turn + 1 if self.turn < self.num_players - 1 else 0
+            else:
+                self.attack_counter -= 1
+            player_on = self.player_list[self.turn]
+            if player_on.alive:
+                self.take_turn(self.turn, player_on)
+
+    # the game loop with every player's turn inlined, for tables where all players are native
+    # nothing in these games ever sets last_played to a Defuse, so SmartPlayer plays like NonRandomPlayer
+    # future_seen, kitten_depth and deck_size only feed the recorded game states, so they are only kept when recording
+    def play_native_game(self):
+        rand = self.rng.random
+        deck = self.deck
+        hands = self.hands
+        hand_sizes = self.hand_sizes
+        players = self.player_list
+        agents = self.agents
+        num_players = self.num_players
+        record = self.record_states
+        others = self.others
+        # the turn, attack counter and player count live in locals and are written back when the game ends
+        # (and before every recorded state, which reads the attack counter)
+        turn = self.turn
+        attack_counter = self.attack_counter
+        players_left = self.players_left
+        while players_left > 1 and deck:
+            if attack_counter == 0:
+                turn = turn + 1 if turn < num_players - 1 else 0
+            else:
+                attack_counter -= 1
+            seat = turn
+            player = players[seat]
+            if not player.alive:
+                continue
+            hand = hands[seat]
+            # like the original, whether opponents can be stolen from is only checked at the start of the turn
+            can_steal = False
+            for other in others[seat]:
+                if hand_sizes[other] and players[other].alive:
+                    can_steal = True
+            skipping = False
+            while rand() < 0.5 and not skipping:
+                # spelled out rather than a comprehension, this is the hottest spot of the engine
+                possible_actions = []
+                if hand[ATTACK]:
+                    possible_actions.append(ATTACK)
+                if hand[SKIP]:
+                    possible_actions.append(SKIP)
+                if hand[SEE_THE_FUTURE]:
+                    possible_actions.append(SEE_THE_FUTURE)
+                if hand[SHUFFLE]:
+                    possible_actions.append(SHUFFLE)
+                if can_steal:
+                    if hand[FAVOR]:
+                        possible_actions.append(FAVOR)
+                    if hand[TACOCAT] > 1:
+                        possible_actions.append(TACOCAT)
+                    if hand[CATTERMELON] > 1:
+                        possible_actions.append(CATTERMELON)
+                    if hand[RAINBOW_RALPHING_CAT] > 1:
+                        possible_actions.append(RAINBOW_RALPHING_CAT)
+                if not possible_actions:
+                    continue
+                code = possible_actions[int(rand() * len(possible_actions))]
+                if record:
+                    self.attack_counter = attack_counter
+                    self.players_left = players_left
+                    player.game_states.append(self.seat_state_key(seat))
+                    player.actions.append(ACTION_NAMES[code])
+                self.last_played = CARDS[code]
+                hand[code] -= 1
+                hand_sizes[seat] -= 1
+                if code == ATTACK:
+                    skipping = True
+                    attack_counter += 1
+                elif code == SKIP:
+                    skipping = True
+                elif code == SEE_THE_FUTURE:
+                    if record:
+                        player.future_seen = [CARDS[card] for card in reversed(deck[-3:])]
+                elif code == SHUFFLE:
+                    shuffle_cards(rand, deck)
+                    self.deck_changes += 1
+                    if record:
+                        for p in players:
+                            p.future_seen = []
+                            p.kitten_depth = None
+                else:
+                    if code != FAVOR:
+                        hand[code] -= 1
+                        hand_sizes[seat] -= 1
+                    targets = [other for other in range(num_players)
+                               if other != seat and hand_sizes[other] > 0 and players[other].alive]
+                    if not targets:
+                        if code == FAVOR:
+                            hand[FAVOR] += 1
+                            hand_sizes[seat] += 1
+                        continue
+                    target = targets[int(rand() * len(targets))]
+                    target_hand = hands[target]
+                    if code == FAVOR and agents[target] != RANDOM_AGENT:
+                        for card in NON_RANDOM_GIVE_ORDER:
+                            if target_hand[card]:
+                                break
+                    else:
+                        card = random_card(rand, target_hand, hand_sizes[target])
+                    target_hand[card] -= 1
+                    hand_sizes[target] -= 1
+                    hand[card] += 1
+                    hand_sizes[seat] += 1
+            if record:
+                self.attack_counter = attack_counter
+                self.players_left = players_left
+                player.actions.append('Finish Turn')
+                player.game_states.append(self.seat_state_key(seat))
+            if skipping:
+                continue
+            next_card = deck.pop()
+            if next_card == EXPLODING_KITTEN:
+                if hand[DEFUSE]:
+                    hand[DEFUSE] -= 1
+                    hand_sizes[seat] -= 1
+                    spot = int(rand() * (len(deck) + 1)) if agents[seat] == RANDOM_AGENT else 0
+                    deck.insert(len(deck) - spot, next_card)
+                    self.deck_changes += 1
+                    if record:
+                        for p in players:
+                            p.future_seen = []
+                            p.kitten_depth = None
+                        player.kitten_depth = spot
+                else:
+                    player.alive = False
+                    players_left -= 1
+                    if record:
+                        self.card_drawn()
+            else:
+                hand[next_card] += 1
+                hand_sizes[seat] += 1
+                if record:
+                    self.card_drawn()
+        self.turn = turn
+        self.attack_counter = attack_counter
+        self.players_left = players_left
+        for p in players:
+            p.deck_size = len(deck)
+
+    def take_turn(self, seat, player):
+        agent = self.agents[seat]
+        if agent is None:
+            player.player_card_play(self)
+        elif agent == SMART_AGENT:
+            self.smart_card_play(seat, player)
+        else:
+            self.random_card_play(seat, player)
+        if not player.skipping:
+            self.draw_card(seat, player)
+        else:
+            player.skipping = False
+
+    # Player.player_card_play on card counts
+    def random_card_play(self, seat, player):
+        hand = self.hands[seat]
+        record = self.record_states
+        rand = self.rng.random
+        # like the original, whether opponents can be stolen from is only checked at the start of the turn
+        can_steal = len(self.targets(seat)) > 0
+        playing = rand() < 0.5
+        while playing and not player.skipping:
+            possible_actions = [code for code in SINGLE_CODES if hand[code]]
+            if can_steal:
+                if hand[FAVOR]:
+                    possible_actions.append(FAVOR)
+                for code in CAT_CODES:
+                    if hand[code] > 1:
+                        possible_actions.append(code)
+            if possible_actions:
+                code = possible_actions[int(rand() * len(possible_actions))]
+                if record:
+                    player.game_states.append(self.seat_state_key(seat))
+                    player.actions.append(ACTION_NAMES[code])
+                self.last_played = CARDS[code]
+                self.play_code(seat, code)
+            playing = rand() < 0.5
+        if record:
+            player.actions.append('Finish Turn')
+            player.game_states.append(self.seat_state_key(seat))
+
+    # SmartPlayer.player_card_play on card counts
+    def smart_card_play(self, seat, player):
+        if self.last_played is not None and self.last_played.card_type == 'Defuse':
+            hand = self.hands[seat]
+            for code in (ATTACK, SKIP, SHUFFLE):
+                if hand[code]:
+                    self.last_played = CARDS[code]
+                    self.play_code(seat, code)
+                    return
+        else:
+            self.random_card_play(seat, player)
+
+    def choose_spot_in_deck(self, seat, deck_size):
+        agent = self.agents[seat]
+        if agent is None:
+            return self.player_list[seat].choose_spot_in_deck(deck_size)
+        if agent == RANDOM_AGENT:
+            return random_below(self.rng.random, deck_size)
+        return 0
+
+    def draw_card(self, seat, player):
+        next_card = self.deck.pop()
+        if next_card == EXPLODING_KITTEN:
+            if self.hands[seat][DEFUSE]:
+                self.remove_card(seat, DEFUSE)
+                # spots count down from the top of the deck, which is the end of the list
+                spot = self.choose_spot_in_deck(seat, len(self.deck) + 1)
+                self.deck.insert(len(self.deck) - spot, next_card)
+                self.deck_changes += 1
+                for p in self.player_list:
+                    p.future_seen = []
+                    p.kitten_depth = None
+                player.kitten_depth = spot
+            else:
+                player.alive = False
+                self.players_left -= 1
+                self.card_drawn()
+        else:
+            self.add_card(seat, next_card)
+            self.card_drawn()
+        deck_size = len(self.deck)
+        for p in self.player_list:
+            p.deck_size = deck_size
+
+    # the top card is gone, so what players knew about the deck moves up by one (see Game.card_drawn)
+    def card_drawn(self):
+        for p in self.player_list:
+            if p.future_seen:
+                del p.future_seen[0]
+            if p.kitten_depth is not None:
+                p.kitten_depth = p.kitten_depth - 1 if p.kitten_depth > 0 else None
+
+    def start_game(self):
+        self.initialize_deck()
+        deck = self.deck
+        rand = self.rng.random
+        for seat, player in enumerate(self.player_list):
+            player.other_players = [p for p in self.player_list if p is not player]
+            self.add_card(seat, DEFUSE)
+        if self.track_hands:
+            for i in range(self.hand_size - 1):
+                for seat in range(self.num_players):
+                    self.add_card(seat, deck.pop())
+        else:
+            # the same cards as dealing one at a time around the table: seat s gets every num_players-th card
+            # counting down from the top, starting s cards down
+            dealt = deck[-self.num_players * (self.hand_size - 1):]
+            del deck[-self.num_players * (self.hand_size - 1):]
+            for seat in range(self.num_players):
+                hand = self.hands[seat]
+                for code in dealt[len(dealt) - 1 - seat::-self.num_players]:
+                    hand[code] += 1
+            self.hand_sizes = [self.hand_size] * self.num_players
+        # what is left of the deck is still in random order, so putting each kitten at a random spot is the same
+        # as adding them and shuffling again
+        for i in range(self.exploding_kittens):
+            deck.insert(int(rand() * (len(deck) + 1)), EXPLODING_KITTEN)
+        for player in self.player_list:
+            player.deck_size = len(deck)
+        self.play_game()
+
+    def shuffle_deck(self):
+        shuffle_cards(self.rng.random, self.deck)
+
+    def initialize_deck(self):
+        self.deck.extend(fresh_deck(self.num_players))
+        self.shuffle_deck()
+
+    def decide_winner(self):
+        for player in self.player_list:
+            if player.alive:
+                return player.player_ID
+
+
+# the number of each card type in a fresh deck for a table of num_players (see deck_card_counts)
+# cached, since every game asks for it; callers must not change the returned dict
+@functools.lru_cache(maxsize=None)
+def fresh_deck_counts(num_players):
+    return {CARD_CODES[card_type]: count for card_type, count in deck_card_counts(num_players).items()}
+
+
+FRESH_DECK_COUNTS = fresh_deck_counts(2)
+
+
+# the cards of a fresh deck for a table of num_players, in a fixed order (see fresh_deck_counts)
+@functools.lru_cache(maxsize=None)
+def fresh_deck(num_players):
+    return tuple(code for code, count in fresh_deck_counts(num_players).items() for _ in range(count))
+
+
+# the seats of everyone but the player in each seat of a table of num_players
+@functools.lru_cache(maxsize=None)
+def seat_others(num_players):
+    return tuple(tuple(other for other in range(num_players) if other != seat) for seat in range(num_players))
+
+# a map of card codes and their behavior; shared by every game so creating a game stays cheap
+CARD_FUNCTIONS = {
+    ATTACK: FastGame.play_attack,
+    SKIP: FastGame.play_skip,
+    SEE_THE_FUTURE: FastGame.play_see_the_future,
+    SHUFFLE: FastGame.play_shuffle,
+    FAVOR: FastGame.play_favor,
+    TACOCAT: FastGame.play_cat,
+    CATTERMELON: FastGame.play_cat,
+    RAINBOW_RALPHING_CAT: FastGame.play_cat
+}
+
+
+# play num_games games of player_types against each other with an engine and return (wins per seat, games/sec)
+def time_games(engine, player_types, num_games):
+    wins = {f'Player{seat + 1}': 0 for seat in range(len(player_types))}
+    start = time.perf_counter()
+    for i in range(num_games):
+        players = [player_type(f'Player{seat + 1}') for seat, player_type in enumerate(player_types)]
+        game = engine(players)
+        game.start_game()
+        wins[game.decide_winner()] += 1
+    return wins, num_games / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    for player_types in [(Player, Player), (Player, NonRandomPlayer), (SmartPlayer, NonRandomPlayer)]:
+        names = ' v '.join(player_type.__name__ for player_type in player_types)
+        for engine in [Game, FastGame]:
+            wins, rate = time_games(engine, player_types, 10000)
+            print(f"{names} on {engine.__name__}: {rate:.0f} games/sec, {wins}")
+        wins, rate = time_games(lambda players: FastGame(players, record_states=False), player_types, 10000)
+        print(f"{names} on FastGame without recording: {rate:.0f} games/sec, {wins}")
@@ -0,0 +1,265 @@
+import struct
+import time
+from collections import namedtuple
+from CS4100ExplodingKittens import (Player, SmartPlayer, NonRandomPlayer, Card, Game, game_rng, CARD_TYPES,
+                                    CAT_CARDS, GAME_EVENTS, DEAL_EVENT, DECK_EVENT)
+
+
+# Binary logs of whole games
+# A Game made with record_events=True keeps its events (see GAME_EVENTS) in game.events, two bytes per event plus
+# the cards of the deal and of every Shuffle, so a game costs a few hundred bytes. A GameLog streams finished games
+# to a file in large writes, read_games reads them back and GameReplay rebuilds the Game at any step of one.
+#
+#   with GameLog('games.ekl') as log:
+#       for i in range(100000):
+#           game = Game([Player('Player1'), SmartPlayer('Player2')], rng=game_rng(seed, i), record_events=True)
+#           game.start_game()
+#           log.write(game)
+#   for record in read_games('games.ekl'):
+#       replay = GameReplay(record)
+#       game = replay.game_at(20)  # the game as it stood after its first 20 events
+
+# a log file starts with the magic and format version, then every game is its header followed by its events
+LOG_FILE_HEADER = struct.Struct('<4sB')
+LOG_FILE_MAGIC = b'EKLG'
+LOG_FILE_VERSION = 1
+# the number of players and the length of the events in bytes
+GAME_HEADER = struct.Struct('<BI')
+
+# one game read back from a log
+GameRecord = namedtuple('GameRecord', ['num_players', 'events'])
+# one decoded event; cards holds the card codes of a Deal or Deck event and is empty otherwise
+GameEvent = namedtuple('GameEvent', ['event', 'seat', 'argument', 'cards'])
+
+
+# a finished game in the log file layout; games encoded in worker processes can be handed to GameLog.write_encoded
+def encode_game(game):
+    return GAME_HEADER.pack(game.num_players, len(game.events)) + game.events
+
+
+# writes games to a log file
+# games are collected in memory and written buffer_size bytes at a time, so logging stays cheap enough to leave on
+# for long evaluation runs
+class GameLog:
+    def __init__(self, path, buffer_size=1 << 20):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.buffer = bytearray()
+        self.file = open(path, 'wb')
+        self.file.write(LOG_FILE_HEADER.pack(LOG_FILE_MAGIC, LOG_FILE_VERSION))
+
+    # add a finished game that was made with record_events=True
+    def write(self, game):
+        self.buffer += GAME_HEADER.pack(game.num_players, len(game.events))
+        self.buffer += game.events
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    # add games already encoded with encode_game, any number of them back to back
+    def write_encoded(self, data):
+        self.buffer += data
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        self.file.write(self.buffer)
+        self.buffer = bytearray()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# yield a GameRecord for every game in a log file, in the order they were written
+def read_games(path):
+    with open(path, 'rb') as f:
+        magic, version = LOG_FILE_HEADER.unpack(f.read(LOG_FILE_HEADER.size))
+        if magic != LOG_FILE_MAGIC or version != LOG_FILE_VERSION:
+            raise ValueError(f"{path} is not a game log")
+        while True:
+            header = f.read(GAME_HEADER.size)
+            if not header:
+                return
+            num_players, length = GAME_HEADER.unpack(header)
+            yield GameRecord(num_players, f.read(length))
+
+
+# split a game's events into GameEvents
+def decode_events(events):
+    i = 0
+    while i < len(events):
+        event = events[i] >> 3
+        seat = events[i] & 0x7
+        argument = events[i + 1]
+        i += 2
+        cards = b''
+        if event == DEAL_EVENT or event == DECK_EVENT:
+            cards = bytes(events[i:i + argument])
+            i += argument
+        yield GameEvent(GAME_EVENTS[event], seat, argument, cards)
+
+
+# one event as a line of text, for reading through a game
+def describe_event(event, players):
+    player = players[event.seat]
+    if event.event == 'Deal':
+        return f"{player} is dealt {', '.join(CARD_TYPES[code] for code in event.cards)}"
+    if event.event == 'Deck':
+        return f"the deck is now {', '.join(CARD_TYPES[code] for code in reversed(event.cards))} (top first)"
+    if event.event == 'Turn':
+        return f"{player} starts a turn with {event.argument} attacks queued"
+    if event.event == 'Play':
+        return f"{player} plays {CARD_TYPES[event.argument]}"
+    if event.event == 'Steal':
+        return f"{player} takes a(n) {CARD_TYPES[event.argument & 0xF]} from {players[event.argument >> 4]}"
+    if event.event == 'Return':
+        return f"{player} has nobody to ask for a favor and takes the Favor back"
+    if event.event == 'Draw':
+        return f"{player} draws a(n) {CARD_TYPES[event.argument]}"
+    if event.event == 'Defuse':
+        return f"{player} draws an Exploding Kitten and uses a Defuse!"
+    if event.event == 'Insert':
+        return f"{player} puts the Exploding Kitten back {event.argument} cards from the top"
+    return f"{player} EXPLODES!"
+
+
+# rebuilds the Game of a recorded game at any of its steps
+# the replayed game has plain Players named Player1, Player2, ... in seat order; hands hold the same cards as in
+# the original game, though not always in the same order, so state keys and card counts match at every step
+class GameReplay:
+    def __init__(self, record):
+        self.num_players = record.num_players
+        self.events = list(decode_events(record.events))
+
+    def __len__(self):
+        return len(self.events)
+
+    # a game with the players seated and nothing dealt yet, as it stands at step 0
+    def new_game(self):
+        game = Game([Player(f'Player{seat + 1}') for seat in range(self.num_players)])
+        game.seat_players()
+        return game
+
+    # the game as it stood after its first step events
+    def game_at(self, step):
+        game = self.new_game()
+        for event in self.events[:step]:
+            self.apply(game, event)
+        return game
+
+    # yield every event together with the game right after it; the same game is updated in place each step
+    def __iter__(self):
+        game = self.new_game()
+        for event in self.events:
+            self.apply(game, event)
+            yield event, game
+
+    # the names of the players in seat order
+    def players(self):
+        return [f'Player{seat + 1}' for seat in range(self.num_players)]
+
+    # every event as a line of text
+    def describe(self):
+        players = self.players()
+        return '\n'.join(describe_event(event, players) for event in self.events)
+
+    # update a game the way the recorded event changed the original
+    def apply(self, game, event):
+        player = game.player_list[event.seat]
+        kind = event.event
+        if kind == 'Deal':
+            for code in event.cards:
+                game.add_to_hand(player, Card(CARD_TYPES[code]))
+        elif kind == 'Deck':
+            game.deck = [Card(CARD_TYPES[code]) for code in event.cards]
+        elif kind == 'Turn':
+            game.turn = event.seat
+            game.attack_counter = event.argument
+            for p in game.player_list:
+                p.skipping = False
+        elif kind == 'Play':
+            card_type = CARD_TYPES[event.argument]
+            game.last_played = Card(card_type)
+            self.discard(game, player, card_type)
+            if card_type in CAT_CARDS:
+                self.discard(game, player, card_type)
+            if card_type == 'Attack':
+                player.skipping = True
+                game.attack_counter += 1
+            elif card_type == 'Skip':
+                player.skipping = True
+            elif card_type == 'See The Future':
+                player.future_seen = game.deck[:-4:-1]
+            elif card_type == 'Shuffle':
+                game.deck_changes += 1
+                for p in game.player_list:
+                    p.future_seen = []
+                    p.kitten_depth = None
+        elif kind == 'Steal':
+            target = game.player_list[event.argument >> 4]
+            card_type = CARD_TYPES[event.argument & 0xF]
+            game.add_to_hand(player, self.discard(game, target, card_type))
+        elif kind == 'Return':
+            game.add_to_hand(player, Card('Favor'))
+        elif kind == 'Draw':
+            game.add_to_hand(player, game.deck.pop())
+            game.card_drawn()
+        elif kind == 'Defuse':
+            game.deck.pop()
+            self.discard(game, player, 'Defuse')
+        elif kind == 'Insert':
+            game.deck.insert(len(game.deck) - event.argument, Card('Exploding Kitten'))
+            game.deck_changes += 1
+            for p in game.player_list:
+                p.future_seen = []
+                p.kitten_depth = None
+            player.kitten_depth = event.argument
+        elif kind == 'Explode':
+            game.deck.pop()
+            player.alive = False
+            game.players_left -= 1
+            for p in game.player_list:
+                game.opponent_keys[p] = None
+            game.card_drawn()
+        for p in game.player_list:
+            p.deck_size = len(game.deck)
+
+    # take the first card of a type out of a hand and return it
+    def discard(self, game, player, card_type):
+        for card in player.hand:
+            if card.card_type == card_type:
+                game.remove_from_hand(player, card)
+                return card
+
+
+# play num_games logged games of player_types against each other and return (bytes per game, games/sec)
+def time_logging(player_types, num_games, path, seed=0):
+    start = time.perf_counter()
+    with GameLog(path) as log:
+        for i in range(num_games):
+            players = [player_type(f'Player{seat + 1}') for seat, player_type in enumerate(player_types)]
+            game = Game(players, rng=game_rng(seed, i), record_events=True)
+            game.start_game()
+            log.write(game)
+    seconds = time.perf_counter() - start
+    total = sum(GAME_HEADER.size + len(record.events) for record in read_games(path))
+    return total / num_games, num_games / seconds
+
+
+if __name__ == "__main__":
+    import os
+    import tempfile
+    with tempfile.TemporaryDirectory() as log_dir:
+        path = os.path.join(log_dir, 'games.ekl')
+        for player_types in [(Player, Player), (SmartPlayer, NonRandomPlayer)]:
+            names = ' v '.join(player_type.__name__ for player_type in player_types)
+            size, rate = time_logging(player_types, 10000, path)
+            print(f"{names}: {rate:.0f} games/sec logged, {size:.0f} bytes per game")
+        print(GameReplay(next(read_games(path))).describe())
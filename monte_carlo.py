@@ -0,0 +1,150 @@
+import math
+import random
+import time
+from collections import Counter
+from CS4100ExplodingKittens import Player, NonRandomPlayer, SmartPlayer, Card, CAT_CARDS, CARD_CODES
+from fast_game import (FastGame, CARDS, NUM_CARD_TYPES, DEFUSE, EXPLODING_KITTEN, shuffle_cards)
+
+
+# A Monte Carlo search agent
+# Before every card it plays, MonteCarloPlayer snapshots the game into a FastGame and runs rollouts: each one deals
+# the cards it cannot see at random (see determinize), plays one of its possible actions and then plays the rest of
+# the game out with random players. The actions are tried with UCB1, so the rollouts go mostly to the actions that
+# look best, and the one with the best win rate is played.
+#
+#   run_tournament({'MC': MonteCarloPlayer, 'Smart': SmartPlayer}, games=200)
+
+
+# deal the cards the player in seat cannot see at random, consistent with what it knows
+# the player knows its own hand, the top cards it saw with a See The Future, the deck size, every opponent's hand
+# size and Defuses (which the game state shows too), where it put back the last kitten it defused until the deck is
+# shuffled and, by counting the cards played, which cards are left between the deck and the opponents' hands; only
+# where those cards are is unknown
+def determinize(game, seat, rand):
+    known = [CARD_CODES[card.card_type] for card in game.player_list[seat].future_seen]
+    unseen = len(game.deck) - len(known)
+    # a kitten depth past the cards seen is a kitten the player knows the spot of in the unseen part of the deck
+    depth = game.player_list[seat].kitten_depth
+    pinned = depth is not None and depth >= len(known)
+    pool = []
+    kittens = 0
+    for code in game.deck[:unseen]:
+        if code == EXPLODING_KITTEN:
+            kittens += 1
+        else:
+            pool.append(code)
+    opponents = [other for other in game.others[seat] if game.player_list[other].alive]
+    for other in opponents:
+        hand = game.hands[other]
+        for code in range(NUM_CARD_TYPES):
+            if code != DEFUSE:
+                pool.extend([code] * hand[code])
+    shuffle_cards(rand, pool)
+    for other in opponents:
+        hand = [0] * NUM_CARD_TYPES
+        hand[DEFUSE] = game.hands[other][DEFUSE]
+        for i in range(game.hand_sizes[other] - hand[DEFUSE]):
+            hand[pool.pop()] += 1
+        game.hands[other] = hand
+    # the kittens go anywhere in the unseen part of the deck, and the cards seen stay on top, first seen last
+    pool.extend([EXPLODING_KITTEN] * (kittens - pinned))
+    shuffle_cards(rand, pool)
+    if pinned:
+        pool.insert(unseen - 1 - (depth - len(known)), EXPLODING_KITTEN)
+    pool.extend(reversed(known))
+    game.deck = pool
+
+
+class MonteCarloPlayer(NonRandomPlayer):
+    # rollouts: rollouts run for every decision with more than one possible action
+    # exploration: the UCB1 exploration constant
+    # rollout_type: the player type every seat is played by in rollouts; types FastGame plays natively are fastest
+    def __init__(self, ID, rollouts=1000, exploration=1.4, rollout_type=Player):
+        super().__init__(ID)
+        self.rollouts = rollouts
+        self.exploration = exploration
+        self.rollout_type = rollout_type
+
+    def __repr__(self):
+        return 'Monte Carlo Player'
+
+    # the moves open to the player, card types to play and 'Finish Turn'
+    def possible_actions(self, can_steal):
+        card_types = Counter(card.card_type for card in self.hand)
+        actions = []
+        for card_type, count in card_types.items():
+            if card_type == 'Defuse':
+                continue
+            if card_type in CAT_CARDS:
+                if can_steal and count > 1:
+                    actions.append(card_type)
+            elif card_type == 'Favor':
+                if can_steal:
+                    actions.append(card_type)
+            else:
+                actions.append(card_type)
+        actions.append('Finish Turn')
+        return actions
+
+    # pick the action with the best win rate over the rollouts
+    def search(self, game, actions):
+        seat = game.player_list.index(self)
+        if isinstance(game, FastGame):
+            root = game.clone(self.rollout_type)
+        else:
+            root = FastGame.from_game(game, self.rollout_type)
+        rng = random.Random(self.rng.getrandbits(64))
+        wins = [0] * len(actions)
+        visits = [0] * len(actions)
+        for i in range(self.rollouts):
+            if i < len(actions):
+                choice = i
+            else:
+                log_visits = math.log(i)
+                choice = max(range(len(actions)), key=lambda a: wins[a] / visits[a]
+                             + self.exploration * math.sqrt(log_visits / visits[a]))
+            wins[choice] += self.rollout(root, seat, actions[choice], rng)
+            visits[choice] += 1
+        return actions[max(range(len(actions)), key=lambda a: wins[a] / visits[a] if visits[a] else -1)]
+
+    # play a snapshot of the game out after action, with the hidden cards dealt at random; 1 if the player wins
+    def rollout(self, root, seat, action, rng):
+        game = root.clone(rng=rng)
+        determinize(game, seat, rng.random)
+        player = game.player_list[seat]
+        if action != 'Finish Turn':
+            code = CARD_CODES[action]
+            game.last_played = CARDS[code]
+            game.play_code(seat, code)
+            # the rest of the turn is played out like everyone else's
+            game.random_card_play(seat, player)
+        if player.skipping:
+            player.skipping = False
+        else:
+            game.draw_card(seat, player)
+        game.play_game()
+        return 1 if game.decide_winner() == player.player_ID else 0
+
+    def player_card_play(self, game):
+        # whether anyone can be stolen from is only checked at the start of the turn, like the other agents
+        can_steal = self.can_steal()
+        while not self.skipping:
+            actions = self.possible_actions(can_steal)
+            action = 'Finish Turn' if len(actions) == 1 else self.search(game, actions)
+            if action == 'Finish Turn':
+                break
+            self.game_states.append(self.get_game_state(game))
+            self.actions.append('Cat' if action in CAT_CARDS else action)
+            game.last_played = Card(action)
+            game.play_card(self, action)
+        self.game_states.append(self.get_game_state(game))
+        self.actions.append('Finish Turn')
+
+
+if __name__ == "__main__":
+    from tournament import run_tournament, print_results
+    start = time.perf_counter()
+    for opponent in [Player, SmartPlayer]:
+        print_results(run_tournament({'Monte Carlo': MonteCarloPlayer, opponent.__name__: opponent}, games=100,
+                                     seed=0))
+    print(f"{time.perf_counter() - start:.1f}s")
@@ -0,0 +1,283 @@
+import bisect
+import time
+import numpy as np
+from CS4100ExplodingKittens import (Player, SmartPlayer, ObservedPolicyPlayer, SurvivalAgent, PolicyTable, ValueTable,
+                                    MappedPolicy, share_policy, POLICY_ACTION_CODES, NUM_POLICY_ACTIONS,
+                                    DECK_SIZE_SHIFT, NUM_OPPONENTS_SHIFT, OPPONENT_HANDS_SHIFT, HAND_SIZE_BITS)
+from td_learning import QTable
+from batch_decisions import batch_policy
+
+
+# Shrinking trained policies after training
+# The deck size and the exact opponent hand sizes in a state key split a trained table into a great many states
+# that were only seen once or twice, and a state the table has not seen makes a policy player fall back to a random
+# move. compact_policy turns a trained table into a HierarchicalPolicy: one table per level of a list of
+# StateAbstractions, from the exact states to ones with the deck and hand sizes put into ever wider buckets, each
+# built from the whole trained table and then pruned of the actions seen fewer than min_visits times. A lookup
+# tries the levels in turn and answers from the first one that has the state, so rare states borrow the statistics
+# of the nearest coarser state instead of playing at random. To keep the levels together smaller than the trained
+# table, a coarser level only keeps the coarse states of the trained states that the level before it has no row
+# for. A state never seen in training is answered by the first level that has its coarse state, which at the
+# coarser levels it only finds if that coarse state was kept for some trained state; otherwise the player falls
+# back to a random move as with any other unknown state.
+#
+#   observed_policy_player.train(SmartPlayer)
+#   observed_policy_player.policy = compact_policy(observed_policy_player.policy, min_visits=3)
+#
+# each level is an ordinary PolicyTable or ValueTable, so the levels can be saved with save_policy and put back
+# together with HierarchicalPolicy([(abstraction, load_policy(path)), ...])
+
+# the bits of a deck size or hand size field
+SIZE_MASK = (1 << HAND_SIZE_BITS) - 1
+assert SIZE_MASK == 0x3F
+
+
+# a coarser view of game states: every deck size and opponent hand size is replaced by the lower bound of the
+# bucket it falls in, and the other fields are kept
+#   deck_bounds, hand_bounds: the sorted lower bounds of the buckets, starting at 0; None keeps the exact sizes
+# a coarse key is laid out like any other state key (decode_game_state reads the bucket bounds as the sizes);
+# bucketing never changes the order of the sorted hand sizes, so equal situations still share a key
+class StateAbstraction:
+    def __init__(self, deck_bounds=None, hand_bounds=None):
+        self.deck_bounds = deck_bounds
+        self.hand_bounds = hand_bounds
+        # the bucketed size of every size a field can hold
+        self.deck_sizes = bucket_sizes(deck_bounds)
+        self.hand_sizes = bucket_sizes(hand_bounds)
+
+    def __repr__(self):
+        return f'StateAbstraction({self.deck_bounds}, {self.hand_bounds})'
+
+    # the coarse key of a state key
+    def coarsen(self, key):
+        size = key >> DECK_SIZE_SHIFT & SIZE_MASK
+        key -= (size - self.deck_sizes[size]) << DECK_SIZE_SHIFT
+        shift = OPPONENT_HANDS_SHIFT
+        for _ in range(key >> NUM_OPPONENTS_SHIFT & 0x7):
+            size = key >> shift & SIZE_MASK
+            key -= (size - self.hand_sizes[size]) << shift
+            shift += HAND_SIZE_BITS
+        return key
+
+    # coarsen for an array of uint64 state keys
+    def coarsen_keys(self, keys):
+        deck_sizes = np.array(self.deck_sizes, dtype=np.uint64)
+        hand_sizes = np.array(self.hand_sizes, dtype=np.uint64)
+        mask = np.uint64(SIZE_MASK)
+        sizes = keys >> np.uint64(DECK_SIZE_SHIFT) & mask
+        keys = keys - ((sizes - deck_sizes[sizes]) << np.uint64(DECK_SIZE_SHIFT))
+        num_opponents = keys >> np.uint64(NUM_OPPONENTS_SHIFT) & np.uint64(0x7)
+        for i in range(int(num_opponents.max(initial=0))):
+            shift = np.uint64(OPPONENT_HANDS_SHIFT + i * HAND_SIZE_BITS)
+            sizes = np.where(num_opponents > i, keys >> shift & mask, np.uint64(0))
+            keys = keys - ((sizes - hand_sizes[sizes]) << shift)
+        return keys
+
+
+# the bucketed size for every size from 0 to SIZE_MASK, given the lower bounds of the buckets
+def bucket_sizes(bounds):
+    if bounds is None:
+        return tuple(range(SIZE_MASK + 1))
+    return tuple(bounds[bisect.bisect_right(bounds, size) - 1] for size in range(SIZE_MASK + 1))
+
+
+# the levels compact_policy builds by default: the exact states, then deck and hand sizes in buckets that widen as
+# the sizes grow (the last few cards and the last few cards in a hand matter the most), then in fewer buckets still
+DEFAULT_LEVELS = (
+    StateAbstraction(),
+    StateAbstraction((0, 1, 2, 3, 4, 5, 6, 8, 10, 12, 15, 20, 25, 30, 40), (0, 1, 2, 3, 4, 5, 6, 8, 10, 12, 16)),
+    StateAbstraction((0, 1, 2, 3, 5, 8, 13, 21, 34), (0, 1, 2, 4, 8, 16)),
+)
+
+
+# a trained policy as an in-memory PolicyTable or ValueTable; a QTable goes through to_value_table and a
+# MappedPolicy is copied back with to_table
+def policy_table(policy):
+    if isinstance(policy, QTable):
+        return policy.to_value_table()
+    if isinstance(policy, MappedPolicy):
+        return policy.to_table()
+    return policy
+
+
+# yield (state, action, cell) for every action seen in every state of a table, in row order and then in the order
+# the actions were first seen
+def table_cells(table):
+    for state, row in table.states.items():
+        start = row * NUM_POLICY_ACTIONS
+        for action in table.actions(state):
+            yield state, action, start + POLICY_ACTION_CODES[action]
+
+
+# the number of games behind one cell of a table
+def cell_visits(table, cell):
+    if isinstance(table, PolicyTable):
+        return table.wins[cell] + table.losses[cell]
+    return table.counts[cell]
+
+
+# add the counts of one cell of table to the same action of state in compact, a table of the same kind
+def add_cell(compact, state, action, table, cell):
+    if isinstance(table, PolicyTable):
+        compact.record(state, action, True, table.wins[cell])
+        compact.record(state, action, False, table.losses[cell])
+    else:
+        compact.update(state, action, table.sums[cell], table.counts[cell])
+
+
+# a table with the counts of every state added up under its coarse key; the table stays as it is
+def coarsen_policy(policy, abstraction):
+    table = policy_table(policy)
+    coarse = PolicyTable() if isinstance(table, PolicyTable) else ValueTable()
+    coarsened = {}
+    for state, action, cell in table_cells(table):
+        key = coarsened.get(state)
+        if key is None:
+            key = coarsened[state] = abstraction.coarsen(state)
+        add_cell(coarse, key, action, table, cell)
+    return coarse
+
+
+# a copy of a table without the actions seen in fewer than min_visits games, or the states left with no actions
+# (or, given a set of states, the states not in it); the actions kept stay in the order they were first seen
+def prune_policy(policy, min_visits, states=None):
+    table = policy_table(policy)
+    pruned = PolicyTable() if isinstance(table, PolicyTable) else ValueTable()
+    for state, action, cell in table_cells(table):
+        if cell_visits(table, cell) >= min_visits and (states is None or state in states):
+            add_cell(pruned, state, action, table, cell)
+    return pruned
+
+
+# the compacted form of a trained policy (a PolicyTable, ValueTable, QTable or MappedPolicy): a HierarchicalPolicy
+# with a table for every level, each built from the whole trained table and then pruned to min_visits
+# past the first level, only the coarse states of trained states that the level before has no row for are kept, so
+# a coarse state that only unseen states lead to is not kept
+def compact_policy(policy, min_visits=3, levels=DEFAULT_LEVELS):
+    table = policy_table(policy)
+    compacted = []
+    for abstraction in levels:
+        needed = None
+        if compacted:
+            finer, finer_level = compacted[-1]
+            needed = {abstraction.coarsen(state) for state in table.states
+                      if finer.coarsen(state) not in finer_level}
+        level = prune_policy(coarsen_policy(table, abstraction), min_visits, needed)
+        level.index_best_actions()
+        compacted.append((abstraction, level))
+    return HierarchicalPolicy(compacted)
+
+
+# a policy made of (StateAbstraction, policy) levels, looked up like any other trained policy
+# a lookup coarsens the state for each level in turn and returns the best action of the first level that has one,
+# so a state too rare to be kept at one level is answered by the nearest coarser state
+class HierarchicalPolicy:
+    def __init__(self, levels):
+        self.levels = list(levels)
+
+    # the number of states over all the levels
+    def __len__(self):
+        return sum(len(policy) for _, policy in self.levels)
+
+    def __contains__(self, state):
+        return self.level(state) is not None
+
+    # the index of the first level that has the state, or None if none of them do
+    def level(self, state):
+        for i, (abstraction, policy) in enumerate(self.levels):
+            if abstraction.coarsen(state) in policy:
+                return i
+        return None
+
+    def best_action(self, state, exclude=(), min_visits=1):
+        for abstraction, policy in self.levels:
+            action = policy.best_action(abstraction.coarsen(state), exclude, min_visits)
+            if action is not None:
+                return action
+        return None
+
+    # the number of games each action seen in the state was played in, from the first level that has the state
+    def visits(self, state):
+        for abstraction, policy in self.levels:
+            key = abstraction.coarsen(state)
+            if key in policy:
+                return policy.visits(key)
+        raise KeyError(state)
+
+    def index_best_actions(self):
+        for _, policy in self.levels:
+            if hasattr(policy, 'index_best_actions'):
+                policy.index_best_actions()
+
+    def nbytes(self):
+        return sum(policy.nbytes() for _, policy in self.levels)
+
+    # the levels batched for batch_decisions.py
+    def batch_policy(self):
+        return BatchHierarchicalPolicy(self)
+
+    # the same policy with every level shared with share_policy, for tournaments and worker pools
+    def share(self):
+        return HierarchicalPolicy([(abstraction, share_policy(policy)) for abstraction, policy in self.levels])
+
+    def close(self):
+        for _, policy in self.levels:
+            if isinstance(policy, MappedPolicy):
+                policy.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# a HierarchicalPolicy with every level batched (see batch_decisions.batch_policy); the keys a level has no allowed
+# action for are coarsened for the next one, like HierarchicalPolicy.best_action does one key at a time
+class BatchHierarchicalPolicy:
+    def __init__(self, policy):
+        self.levels = [(abstraction, batch_policy(level)) for abstraction, level in policy.levels]
+
+    def best_action_codes(self, keys, allowed):
+        codes = np.full(len(keys), -1)
+        for abstraction, level in self.levels:
+            missing = codes < 0
+            if not missing.any():
+                break
+            codes[missing] = level.best_action_codes(abstraction.coarsen_keys(keys[missing]), allowed[missing])
+        return codes
+
+
+# the fraction of a list of states that a policy has a best action for, e.g. the states of games it was not
+# trained on
+def hit_rate(policy, states):
+    if not states:
+        return 0.0
+    return sum(1 for state in states if policy.best_action(state) is not None) / len(states)
+
+
+if __name__ == "__main__":
+    from batch_simulator import observe_batch_games, observe_batch_survival, batch_trajectories
+    from tournament import PolicyAgent, run_tournament, print_results
+
+    # states from games neither policy is trained on, to see how often a lookup finds something
+    held_out = [state for state, _, _, _ in batch_trajectories(SmartPlayer, 20000, seed=1)]
+    trained = {
+        'OPP': (ObservedPolicyPlayer, observe_batch_games(SmartPlayer, 500000, seed=0)),
+        'Survival': (SurvivalAgent, observe_batch_survival(Player, 200000, seed=0)),
+    }
+    agents = {'Random': Player}
+    pairings = []
+    for name, (agent_type, table) in trained.items():
+        table.index_best_actions()
+        start = time.perf_counter()
+        compacted = compact_policy(table)
+        seconds = time.perf_counter() - start
+        print(f"{name}: {len(table)} states, {table.nbytes() / 1e6:.1f} MB, {hit_rate(table, held_out):.1%} of "
+              f"unseen-game lookups answered")
+        print(f"{name} compacted in {seconds:.1f}s: {len(compacted.levels[0][1])} exact states, {len(compacted)} "
+              f"over every level, {compacted.nbytes() / 1e6:.1f} MB, {hit_rate(compacted, held_out):.1%} answered")
+        agents[name] = PolicyAgent(agent_type, share_policy(table))
+        agents[name + ' compacted'] = PolicyAgent(agent_type, compacted.share())
+        pairings += [(name, 'Random'), (name + ' compacted', 'Random')]
+    print_results(run_tournament(agents, pairings, games=4000))
@@ -0,0 +1,300 @@
+import time
+from collections import Counter
+import numpy as np
+from CS4100ExplodingKittens import (Player, NonRandomPlayer, SmartPlayer, ObservedPolicyPlayer, ValueTable, Card,
+                                    POLICY_ACTIONS, POLICY_ACTION_CODES, NUM_POLICY_ACTIONS, HAND_ACTIONS,
+                                    CAT_CARDS, INDEPENDENT_EXCLUDE, OPPONENT_HANDS_SHIFT)
+from fast_game import ATTACK, SKIP, SEE_THE_FUTURE, SHUFFLE, FAVOR
+from batch_simulator import BatchSimulator, random_true_column, CAT_INDEX, FINISH_TURN
+from batch_decisions import BatchPolicy
+
+
+# Temporal-difference learning by self-play
+# A QTable keeps the chance to win of every (state key, policy action) pair in NumPy arrays, with a dict that gives
+# every state key seen a dense row. train_td plays batches of games between TDPlayers on a TDBatchSimulator, where
+# the learning seats pick their moves epsilon-greedily from the table with one vectorized lookup per step. After
+# every batch each move is pulled toward its Q-learning target: the best value of its player's next decision, or
+# 1 for a win and 0 for a loss after its last one. The targets come from the next decision rather than the end of
+# the game, so a state gets useful values from far fewer games than ObservedPolicyPlayer needs.
+#
+#   td_player = TDPlayer('Player1')
+#   td_player.train(200000)
+#   run_tournament({'TD': PolicyAgent(TDPlayer, td_player.policy), 'Random': Player}, games=1000)
+#   save_policy(td_player.policy.to_value_table(), 'td_policy.ekp')
+
+# the hand actions of a state key are its lowest bits, in the same order as the policy actions
+assert POLICY_ACTIONS[:len(HAND_ACTIONS)] == HAND_ACTIONS
+STEAL_ACTIONS = [POLICY_ACTION_CODES['Favor'], POLICY_ACTION_CODES['Cat']]
+CAT_ACTION = POLICY_ACTION_CODES['Cat']
+# the card code played for each policy action that is a single card
+ACTION_CARDS = np.array([ATTACK, SKIP, SEE_THE_FUTURE, SHUFFLE, FAVOR, -1, -1])
+
+
+# the policy actions open in each of an array of state keys: the hand actions it shows and finishing the turn, with
+# Favor and cat pairs only if some opponent has cards
+# (the key cannot show that the player could not steal when the turn started, or keys with a kitten risk field)
+def allowed_actions(keys):
+    keys = np.asarray(keys, dtype=np.int64)
+    allowed = ((keys[:, None] >> np.arange(NUM_POLICY_ACTIONS)) & 1) > 0
+    allowed[:, FINISH_TURN] = True
+    allowed[:, STEAL_ACTIONS] &= (keys >> OPPONENT_HANDS_SHIFT != 0)[:, None]
+    return allowed
+
+
+# action values learned by TD, laid out by state and policy action like the other tables but as NumPy arrays
+# values start at initial_value, counts say how many moves each value was learned from, and best_action only picks
+# between actions that have been played, like PolicyTable and ValueTable
+class QTable:
+    def __init__(self, initial_value=0.5, capacity=1024):
+        self.initial_value = initial_value
+        # state key -> row index
+        self.states = {}
+        self.values = np.full((capacity, NUM_POLICY_ACTIONS), initial_value)
+        self.counts = np.zeros((capacity, NUM_POLICY_ACTIONS), dtype=np.uint32)
+        # which actions are open in each state (see allowed_actions)
+        self.allowed = np.zeros((capacity, NUM_POLICY_ACTIONS), dtype=bool)
+
+    def __len__(self):
+        return len(self.states)
+
+    def __contains__(self, state):
+        return state in self.states
+
+    # make room for size rows, doubling the arrays as often as needed
+    def grow(self, size):
+        capacity = len(self.values)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        values = np.full((capacity, NUM_POLICY_ACTIONS), self.initial_value)
+        counts = np.zeros((capacity, NUM_POLICY_ACTIONS), dtype=np.uint32)
+        allowed = np.zeros((capacity, NUM_POLICY_ACTIONS), dtype=bool)
+        used = len(self.values)
+        values[:used] = self.values
+        counts[:used] = self.counts
+        allowed[:used] = self.allowed
+        self.values, self.counts, self.allowed = values, counts, allowed
+
+    # the rows of an array of state keys, adding a row for every key not seen before
+    def rows(self, keys):
+        states = self.states
+        size = len(states)
+        rows = np.fromiter((states.setdefault(key, len(states)) for key in keys.tolist()), dtype=np.int64,
+                           count=len(keys))
+        if len(states) > size:
+            self.grow(len(states))
+            new = rows >= size
+            self.allowed[rows[new]] = allowed_actions(keys[new])
+        return rows
+
+    # the value of a state and action, or None if it has never been played
+    def value(self, state, action):
+        row = self.states.get(state)
+        if row is None or self.counts[row, POLICY_ACTION_CODES[action]] == 0:
+            return None
+        return float(self.values[row, POLICY_ACTION_CODES[action]])
+
+    # the number of moves each action played in a state was learned from
+    def visits(self, state):
+        row = self.states[state]
+        return {POLICY_ACTIONS[code]: int(self.counts[row, code]) for code in np.flatnonzero(self.counts[row])}
+
+    # the action with the highest value in a state, or None if the state has never been seen
+    def best_action(self, state, exclude=(), min_visits=1):
+        row = self.states.get(state)
+        if row is None:
+            return None
+        choices = self.allowed[row] & (self.counts[row] >= min_visits)
+        for action in exclude:
+            choices[POLICY_ACTION_CODES[action]] = False
+        if not choices.any():
+            return None
+        return POLICY_ACTIONS[np.where(choices, self.values[row], -np.inf).argmax()]
+
+    # move the values of (row, action code) pairs toward their targets
+    # the moves of one pair are averaged, and the pair steps by its share of every move it has been learned from,
+    # but never by less than learning_rate per move, so early values settle fast and later ones keep up as the
+    # targets change
+    def learn(self, rows, actions, targets, learning_rate):
+        cells, inverse, moves = np.unique(rows * NUM_POLICY_ACTIONS + actions, return_inverse=True,
+                                          return_counts=True)
+        values = self.values.reshape(-1)
+        counts = self.counts.reshape(-1)
+        errors = np.bincount(inverse, weights=targets - values[rows * NUM_POLICY_ACTIONS + actions]) / moves
+        counts[cells] += moves.astype(np.uint32)
+        steps = np.minimum(1.0, moves * np.maximum(1.0 / counts[cells], learning_rate))
+        values[cells] += steps * errors
+
+    # the number of bytes used by the arrays and the state index
+    def nbytes(self):
+        return self.values.nbytes + self.counts.nbytes + self.allowed.nbytes + len(self.states) * 100
+
+    # a copy of the table for batched lookups (see batch_decisions.py); the values are scored as they are, and the
+    # actions played are ordered by code, so ties go to the first one like in best_action
+    def batch_policy(self):
+        played = self.counts[:len(self)] > 0
+        order = np.where(played, np.arange(1, NUM_POLICY_ACTIONS + 1), 0).astype(np.uint8)
+        return BatchPolicy.from_values(self.states, self.values[:len(self)].copy(), order)
+
+    # the played values as a ValueTable, each counted as many times as it was learned from, so the table can be
+    # saved with save_policy and played from a MappedPolicy
+    def to_value_table(self):
+        table = ValueTable()
+        for state, row in self.states.items():
+            for code in np.flatnonzero(self.counts[row]).tolist():
+                count = int(self.counts[row, code])
+                table.update(state, POLICY_ACTIONS[code], float(self.values[row, code]) * count, count)
+        table.index_best_actions()
+        return table
+
+
+# a BatchSimulator where the TDPlayer seats play from a QTable: each decision they take the best open action with
+# probability 1 - epsilon and a random one otherwise, keep playing until they choose to finish the turn, and give
+# cards and replant kittens like NonRandomPlayer
+# their forced finishes after an Attack or Skip are not decisions, so they are not recorded
+class TDBatchSimulator(BatchSimulator):
+    def __init__(self, player_types, num_games, table, epsilon=0.1, seed=None):
+        super().__init__([NonRandomPlayer if player_type is TDPlayer else player_type
+                          for player_type in player_types], num_games, seed)
+        self.table = table
+        self.epsilon = epsilon
+        self.learning = np.array([player_type is TDPlayer for player_type in player_types])
+        # learning players that chose to finish their turn
+        self.stopped = np.zeros(num_games, dtype=bool)
+
+    def keep_playing(self, games):
+        playing = super().keep_playing(games)
+        learning = self.learning[self.turn[games]]
+        playing[learning] = ~self.stopped[games[learning]]
+        return playing
+
+    def choose_cards(self, games, seats, possible):
+        codes = super().choose_cards(games, seats, possible)
+        learning = self.learning[seats]
+        if not learning.any():
+            return codes
+        games, seats, possible = games[learning], seats[learning], possible[learning]
+        rows = self.table.rows(self.state_keys(games, seats))
+        allowed = np.zeros((len(games), NUM_POLICY_ACTIONS), dtype=bool)
+        allowed[:, :FAVOR - ATTACK + 1] = possible[:, ATTACK:FAVOR + 1]
+        allowed[:, CAT_ACTION] = possible[:, CAT_INDEX].any(axis=1)
+        allowed[:, FINISH_TURN] = True
+        # like ObservedPolicyPlayer, no Favors or cat pairs once nobody has cards left to take, or a Favor that
+        # comes straight back could be played forever
+        others = self.others[seats]
+        opponent_sizes = self.hands[games[:, None], others].sum(axis=2)
+        can_take = ((opponent_sizes > 0) & self.alive[games[:, None], others]).any(axis=1)
+        allowed[:, STEAL_ACTIONS] &= can_take[:, None]
+        # ties, like every action of a new state, are broken at random
+        values = self.table.values[rows] + self.rng.random(allowed.shape) * 1e-9
+        greedy = np.where(allowed, values, -np.inf).argmax(axis=1)
+        exploring = self.rng.random(len(games)) < self.epsilon
+        actions = np.where(exploring, random_true_column(self.rng, allowed), greedy)
+        # a cat pair is the first one the hand has
+        cats = np.array(CAT_INDEX)[possible[:, CAT_INDEX].argmax(axis=1)]
+        chosen = np.where(actions == CAT_ACTION, cats, ACTION_CARDS[actions])
+        finishing = actions == FINISH_TURN
+        self.stopped[games[finishing]] = True
+        codes[learning] = np.where(finishing, -1, chosen)
+        return codes
+
+    def record(self, games, seats, keys, actions):
+        forced = self.learning[seats] & self.skipping[games] & (actions == FINISH_TURN)
+        super().record(games[~forced], seats[~forced], keys[~forced], actions[~forced])
+
+    def finish_turns(self, games):
+        super().finish_turns(games)
+        self.stopped[games] = False
+
+
+# one Q-learning update from the finished games of a simulator: every decision of a learning seat is pulled toward
+# the best open value of the same player's next decision, or toward 1 or 0 if it was the player's last and it won
+# or lost; the targets are all read before any value changes
+def learn_batch(simulator, learning_rate=0.01):
+    table = simulator.table
+    owners, keys, actions = simulator.records()
+    learning = simulator.learning[owners % simulator.num_players]
+    owners, keys, actions = owners[learning], keys[learning], actions[learning].astype(np.int64)
+    if len(owners) == 0:
+        return
+    rows = table.rows(keys)
+    last = np.append(owners[1:] != owners[:-1], True)
+    next_rows = np.append(rows[1:], rows[-1])
+    next_values = np.where(table.allowed[next_rows], table.values[next_rows], -np.inf).max(axis=1)
+    won = simulator.winners()[owners // simulator.num_players] == owners % simulator.num_players
+    targets = np.where(last, won.astype(np.float64), next_values)
+    table.learn(rows, actions, targets, learning_rate)
+
+
+# train a QTable on num_games games of num_players TDPlayers (or of player_types, any mix of TDPlayer and the
+# simple agents), batch_size games at a time with an update after every batch; table carries on training one
+# epsilon starts at epsilon and falls linearly to final_epsilon over the run
+def train_td(num_games, num_players=2, batch_size=10000, epsilon=0.2, final_epsilon=0.02, learning_rate=0.01,
+             table=None, player_types=None, seed=None, progress=False):
+    if table is None:
+        table = QTable()
+    if player_types is None:
+        player_types = [TDPlayer] * num_players
+    rng = np.random.default_rng(seed)
+    played = 0
+    batches = 0
+    while played < num_games:
+        batch = min(batch_size, num_games - played)
+        batch_epsilon = epsilon + (final_epsilon - epsilon) * played / num_games
+        # the seats turn around every batch, so a mix of player types plays from every seat
+        turn = batches % len(player_types)
+        simulator = TDBatchSimulator(player_types[turn:] + player_types[:turn], batch, table, batch_epsilon,
+                                     rng.integers(2 ** 63))
+        simulator.play()
+        learn_batch(simulator, learning_rate)
+        played += batch
+        batches += 1
+        if progress:
+            print(f"{played} games, {len(table)} states")
+    return table
+
+
+# plays a QTable trained by train_td, looked up like the policies of the other trained agents, so it plays in a
+# Game, in tournaments through PolicyAgent and in batch_decisions
+class TDPlayer(ObservedPolicyPlayer):
+    def __init__(self, ID):
+        super().__init__(ID)
+        self.policy = QTable()
+
+    def __repr__(self):
+        return 'TD Player'
+
+    # the lookups of one turn, like ObservedPolicyPlayer.policy_turn but over once an Attack or Skip is played, as
+    # in the games the table learned from
+    def policy_turn(self, game):
+        while not self.skipping:
+            exclude = () if self.can_steal() else INDEPENDENT_EXCLUDE
+            action = yield from self.best_move_lookup(game, exclude)
+            if action == 'Finish Turn':
+                return
+            if action == 'Cat':
+                player_hand = Counter([card.card_type for card in self.hand])
+                for possible_cat in CAT_CARDS:
+                    if player_hand[possible_cat] > 1:
+                        action = possible_cat
+                        break
+            game.last_played = Card(action)
+            game.play_card(self, action)
+
+    # learn by self-play (see train_td)
+    def train(self, num_games=200000, num_players=2, batch_size=10000, epsilon=0.2, final_epsilon=0.02,
+              learning_rate=0.01, seed=None):
+        self.policy = train_td(num_games, num_players, batch_size, epsilon, final_epsilon, learning_rate,
+                               seed=seed, progress=True)
+
+
+if __name__ == "__main__":
+    from tournament import PolicyAgent, run_tournament, print_results
+    start = time.perf_counter()
+    table = train_td(200000, seed=0)
+    seconds = time.perf_counter() - start
+    print(f"trained on 200000 games in {seconds:.1f}s ({200000 / seconds:.0f} games/sec), {len(table)} states")
+    for opponent in [Player, SmartPlayer]:
+        print_results(run_tournament({'TD': PolicyAgent(TDPlayer, table), opponent.__name__: opponent}, games=2000,
+                                     seed=0))
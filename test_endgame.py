@@ -0,0 +1,215 @@
+import random
+import pytest
+from CS4100ExplodingKittens import Player, Game, Card, CARD_TYPES, CARD_CODES
+from fast_game import DEFUSE, EXPLODING_KITTEN, NUM_CARD_TYPES
+from endgame import EndgameSolver, EndgamePlayer, UNKNOWN, ME, add_count, reveal, playable, opponent_deals
+
+
+# Checks of the endgame solver's count model against Game
+# The solver has its own copy of the rules on card counts (see the endgame module comment), so these tests play
+# the same moves with Game's play_card, draw_card and reinsert_exploding_kitten from small random positions and
+# check that every position Game leads to is one the solver leads to, about as often
+
+# the cards small positions are made of; no Exploding Kittens, which only go in the deck
+HAND_CARDS = [code for code in range(NUM_CARD_TYPES) if code != EXPLODING_KITTEN]
+
+
+# an EndgameSolver that stops at the positions a move leads to instead of solving them: each one it reaches is
+# recorded, and is worth 1 if it is the answer and 0 otherwise, so a move's value with a position as the answer is
+# the chance the move leads there
+class TransitionRecorder(EndgameSolver):
+    def __init__(self):
+        super().__init__()
+        self.reached = []
+        self.answer = None
+
+    def record(self, position):
+        self.reached.append(position)
+        return 1.0 if position == self.answer else 0.0
+
+    def play_value(self, slots, hidden, hands, player, attack, can_steal):
+        return self.record(('play', slots, hidden, hands, player, attack, can_steal))
+
+    def turn_value(self, slots, hidden, hands, player, attack):
+        return self.record(('turn', slots, hidden, hands, player, attack))
+
+    # ME replanting is a choice rather than a chance, so it is a position of its own (see replant_positions)
+    def replant_values(self, slots, hidden, hands, attack):
+        return [self.record(('replant', slots, hidden, hands, attack))]
+
+    # {position: chance} for a move, value(recorder) being the move's value; the game ending is 'end'
+    # a game that ends is worth 0 or 1 whatever the answer, so its share is taken off every position's value
+    def outcomes(self, value):
+        self.reached = []
+        self.answer = None
+        ended = value(self)
+        chances = {}
+        for position in set(self.reached):
+            self.answer = position
+            chances[position] = value(self) - ended
+        end = 1.0 - sum(chances.values())
+        if end > 1e-9:
+            chances['end'] = end
+        return chances
+
+
+# the positions ME can replant a kitten into, from the top of the deck down
+def replant_positions(slots, hidden, hands, attack):
+    recorder = TransitionRecorder()
+    EndgameSolver.replant_values(recorder, slots, hidden, hands, attack)
+    return recorder.reached
+
+
+# a random small endgame: the deck top card first, both hands, how many top cards ME has seen, the depth of a
+# kitten ME replanted (or None), the player on turn and the attack counter
+def random_spec(rng):
+    deck = [rng.choice(HAND_CARDS[1:]) for _ in range(rng.randrange(0, 4))]
+    deck.insert(rng.randrange(len(deck) + 1), EXPLODING_KITTEN)
+    hands = [[rng.choice(HAND_CARDS) for _ in range(rng.randrange(0, 4))] for _ in range(2)]
+    seen = rng.randrange(min(3, len(deck)) + 1)
+    kitten = deck.index(EXPLODING_KITTEN)
+    replanted = kitten if kitten >= seen and rng.random() < 0.5 else None
+    return deck, hands, seen, replanted, rng.randrange(2), rng.randrange(2)
+
+
+# a Game at a spec's position, with the cards ME does not know dealt into their slots at random
+def make_game(spec, rng):
+    deck, hands, seen, replanted, turn, attack = spec
+    me = EndgamePlayer('Player1')
+    opponent = Player('Player2')
+    game = Game([me, opponent], rng=rng)
+    game.seat_players()
+    unknown = [depth for depth in range(len(deck)) if depth >= seen and depth != replanted]
+    cards = [deck[depth] for depth in unknown]
+    rng.shuffle(cards)
+    top_first = list(deck)
+    for depth, code in zip(unknown, cards):
+        top_first[depth] = code
+    game.deck = [Card(CARD_TYPES[code]) for code in reversed(top_first)]
+    for player, hand in zip(game.player_list, hands):
+        for code in hand:
+            game.add_to_hand(player, Card(CARD_TYPES[code]))
+    me.future_seen = [Card(CARD_TYPES[code]) for code in top_first[:seen]]
+    me.kitten_depth = replanted
+    game.turn = turn
+    game.attack_counter = attack
+    return game
+
+
+# the hands as the solver keeps them, ME's first
+def game_hands(game):
+    return tuple(tuple(game.hand_counts[player]) for player in game.player_list)
+
+
+# the deck as ME knows it, as (slots, hidden)
+def game_deck(game):
+    me = game.player_list[ME]
+    slots = me.known_slots(game)
+    hidden = [0] * NUM_CARD_TYPES
+    for depth, slot in enumerate(slots):
+        if slot == UNKNOWN:
+            hidden[CARD_CODES[game.deck[-1 - depth].card_type]] += 1
+    return slots, tuple(hidden)
+
+
+def turn_position(game):
+    slots, hidden = game_deck(game)
+    return 'turn', slots, hidden, game_hands(game), game.turn, game.attack_counter
+
+
+# play a card code or, for None, finish the turn and draw, with Game's own rules; returns the position reached
+# and, when ME replants a kitten, the spot it chose and the position after it
+def game_move(game, code, can_steal):
+    player = game.player_list[game.turn]
+    me = game.player_list[ME]
+    replant = []
+
+    # ME's replant is a choice, so it is recorded and a random spot taken; the kitten is out of the deck and ME
+    # forgets the order of the rest, so every card left is hidden
+    def choose_spot_in_deck(deck_size):
+        hidden = [0] * NUM_CARD_TYPES
+        for card in game.deck:
+            hidden[CARD_CODES[card.card_type]] += 1
+        replant.append(('replant', (UNKNOWN,) * len(game.deck), tuple(hidden), game_hands(game),
+                        game.attack_counter))
+        return game.rng.randrange(deck_size)
+    me.choose_spot_in_deck = choose_spot_in_deck
+    if code is not None:
+        game.last_played = Card(CARD_TYPES[code])
+        game.play_card(player, CARD_TYPES[code])
+        if not player.skipping:
+            slots, hidden = game_deck(game)
+            return ('play', slots, hidden, game_hands(game), game.turn, game.attack_counter, can_steal), None
+    game.end_turn(player)
+    if game.players_left == 1:
+        return 'end', None
+    spot = me.kitten_depth
+    game.next_turn()
+    if replant:
+        return replant[0], (spot, turn_position(game))
+    return turn_position(game), None
+
+
+# the solver's chances for the positions a move leads to, and how often Game led to each in samples games
+def compare_move(spec, code, samples, rng):
+    game = make_game(spec, random.Random(0))
+    slots, hidden = game_deck(game)
+    hands = game_hands(game)
+    player, attack = game.turn, game.attack_counter
+    can_steal = sum(hands[1 - player]) > 0
+    if code is None:
+        expected = TransitionRecorder().outcomes(lambda solver: solver.draw_value(slots, hidden, hands, player,
+                                                                                   attack))
+    else:
+        expected = TransitionRecorder().outcomes(lambda solver: solver.card_value(slots, hidden, hands, player,
+                                                                                   attack, can_steal, code))
+    seen = {}
+    for _ in range(samples):
+        position, replanted = game_move(make_game(spec, random.Random(rng.getrandbits(64))), code, can_steal)
+        seen[position] = seen.get(position, 0) + 1
+        if replanted is not None:
+            spot, after = replanted
+            assert after == replant_positions(*position[1:])[spot]
+    return expected, seen
+
+
+@pytest.mark.parametrize('seed', range(100))
+def test_solver_moves_match_game(seed):
+    rng = random.Random(seed)
+    spec = random_spec(rng)
+    game = make_game(spec, random.Random(0))
+    hands = game_hands(game)
+    player = game.turn
+    samples = 400
+    for code in [None] + playable(hands[player], sum(hands[1 - player]) > 0):
+        expected, seen = compare_move(spec, code, samples, rng)
+        assert set(seen) <= set(expected), (spec, code)
+        for position, chance in expected.items():
+            frequency = seen.get(position, 0) / samples
+            # about four standard deviations of the sampled frequency
+            assert abs(frequency - chance) <= 4 * (chance * (1 - chance) / samples) ** 0.5 + 0.01, (spec, code)
+
+
+# every chance node of the search (the cards revealed, the cards drawn and taken, the opponent's hands) is a
+# probability distribution, so each move's outcomes add up to 1 and every value is a probability
+@pytest.mark.parametrize('seed', range(100))
+def test_probabilities_sum_to_one(seed):
+    rng = random.Random(seed)
+    game = make_game(random_spec(rng), random.Random(0))
+    slots, hidden = game_deck(game)
+    hands = game_hands(game)
+    player, attack = game.turn, game.attack_counter
+    can_steal = sum(hands[1 - player]) > 0
+    assert sum(probability for probability, _, _ in reveal(slots, hidden, 3)) == pytest.approx(1.0)
+    pool = add_count(hidden, DEFUSE, 1)
+    size = min(3, sum(pool) - pool[EXPLODING_KITTEN])
+    assert sum(probability for probability, _, _ in opponent_deals(pool, 1, size)) == pytest.approx(1.0)
+    solver = EndgameSolver()
+    moves = [lambda solver: solver.draw_value(slots, hidden, hands, player, attack)]
+    moves += [lambda solver, code=code: solver.card_value(slots, hidden, hands, player, attack, can_steal, code)
+              for code in playable(hands[player], can_steal)]
+    for move in moves:
+        chances = TransitionRecorder().outcomes(move)
+        assert min(chances.values()) >= -1e-9
+        assert sum(chances.values()) == pytest.approx(1.0)
+        assert -1e-9 <= move(solver) <= 1 + 1e-9
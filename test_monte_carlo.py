@@ -0,0 +1,93 @@
+import random
+from collections import Counter
+import pytest
+from CS4100ExplodingKittens import Player
+from fast_game import FastGame, CARDS, NUM_CARD_TYPES, DEFUSE, EXPLODING_KITTEN
+from monte_carlo import determinize
+
+
+# Checks that determinize only deals out what the player cannot see
+# Whatever it deals, the player's own hand, the cards it saw on top, the kitten it replanted, the deck size and
+# every opponent's hand size and Defuses stay as they were, and the cards move between the deck and the opponents'
+# hands without any appearing or disappearing
+
+
+# a FastGame part way through: num_players players (one of them out if num_players > 2), random hands and deck
+# with a kitten per living opponent, and a player in seat 0 that has seen some top cards and maybe replanted a kitten
+def random_position(rng, num_players):
+    game = FastGame([Player(f'Player{seat + 1}') for seat in range(num_players)], rng=random.Random(0))
+    if num_players > 2:
+        game.player_list[-1].alive = False
+        game.players_left -= 1
+    deck = [rng.randrange(2, NUM_CARD_TYPES) for _ in range(rng.randrange(1, 12))]
+    for _ in range(game.players_left - 1):
+        deck.insert(rng.randrange(len(deck) + 1), EXPLODING_KITTEN)
+    game.deck = deck
+    for seat in range(num_players):
+        hand = [0] * NUM_CARD_TYPES
+        hand[DEFUSE] = rng.randrange(2)
+        for _ in range(rng.randrange(6)):
+            hand[rng.randrange(2, NUM_CARD_TYPES)] += 1
+        game.hands[seat] = hand
+        game.hand_sizes[seat] = sum(hand)
+    player = game.player_list[0]
+    seen = rng.randrange(min(3, len(deck)) + 1)
+    player.future_seen = [CARDS[code] for code in reversed(deck[len(deck) - seen:])]
+    kittens = [depth for depth in range(seen, len(deck)) if deck[-1 - depth] == EXPLODING_KITTEN]
+    player.kitten_depth = rng.choice(kittens) if kittens and rng.random() < 0.5 else None
+    return game
+
+
+# the cards the player in seat 0 cannot tell apart: the unseen deck and the opponents' hands apart from Defuses
+def unseen_cards(game):
+    cards = Counter(game.deck)
+    for seat in range(1, game.num_players):
+        hand = game.hands[seat]
+        cards.update({code: hand[code] for code in range(NUM_CARD_TYPES) if code != DEFUSE})
+    return cards
+
+
+@pytest.mark.parametrize('num_players', [2, 3, 4])
+@pytest.mark.parametrize('seed', range(50))
+def test_determinize_keeps_what_the_player_knows(num_players, seed):
+    rng = random.Random(seed)
+    game = random_position(rng, num_players)
+    player = game.player_list[0]
+    deck = list(game.deck)
+    hands = [list(hand) for hand in game.hands]
+    cards = unseen_cards(game)
+    determinize(game, 0, random.Random(seed).random)
+    assert len(game.deck) == len(deck)
+    # the cards seen are still on top, first seen on top
+    for depth, card in enumerate(player.future_seen):
+        assert game.deck[-1 - depth] == deck[-1 - depth]
+    if player.kitten_depth is not None:
+        assert game.deck[-1 - player.kitten_depth] == EXPLODING_KITTEN
+    assert game.deck.count(EXPLODING_KITTEN) == deck.count(EXPLODING_KITTEN)
+    assert game.hands[0] == hands[0]
+    for seat in range(1, num_players):
+        assert sum(game.hands[seat]) == game.hand_sizes[seat] == sum(hands[seat])
+        assert game.hands[seat][DEFUSE] == hands[seat][DEFUSE]
+        assert game.hands[seat][EXPLODING_KITTEN] == 0
+    assert unseen_cards(game) == cards
+
+
+# the kitten the player replanted stays put, while the other kittens and cards it has not seen get dealt anywhere
+def test_determinize_moves_the_unknown_cards():
+    rng = random.Random(0)
+    # a position with a replanted kitten, and another kitten somewhere in at least four cards the player has not seen
+    while True:
+        game = random_position(rng, 4)
+        seen = len(game.player_list[0].future_seen)
+        unseen = game.deck[:len(game.deck) - seen]
+        if game.player_list[0].kitten_depth is not None and len(unseen) >= 4 and unseen.count(EXPLODING_KITTEN) > 1:
+            break
+    depth = game.player_list[0].kitten_depth
+    other_spots = set()
+    for i in range(200):
+        dealt = game.clone(rng=random.Random(i))
+        determinize(dealt, 0, dealt.rng.random)
+        assert dealt.deck[-1 - depth] == EXPLODING_KITTEN
+        other_spots.update(spot for spot in range(len(dealt.deck))
+                           if spot != depth and dealt.deck[-1 - spot] == EXPLODING_KITTEN)
+    assert len(other_spots) > 1
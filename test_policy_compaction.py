@@ -0,0 +1,47 @@
+import pytest
+from CS4100ExplodingKittens import (SmartPlayer, INDEPENDENT_EXCLUDE, play_trajectories, aggregate_win_loss,
+                                    aggregate_survival)
+from fast_game import FastGame
+from policy_compaction import StateAbstraction, compact_policy
+
+
+# Checks that compacting a trained policy keeps its answers for the states it keeps exactly
+# A state kept at the exact level is answered from its own pruned row, so it should get the move the trained table
+# picks when asked for the same evidence, whatever is excluded
+
+EXCLUDES = [(), INDEPENDENT_EXCLUDE, ('Finish Turn',)]
+
+
+# a small trained table of each kind, from the same games
+@pytest.fixture(scope='module', params=[aggregate_win_loss, aggregate_survival])
+def trained(request):
+    return request.param(play_trajectories(SmartPlayer, 3000, seed=0, engine=FastGame))
+
+
+@pytest.mark.parametrize('min_visits', [2, 3, 5])
+def test_kept_states_agree(trained, min_visits):
+    compact = compact_policy(trained, min_visits)
+    kept = [state for state in trained.states if compact.level(state) == 0]
+    assert kept
+    for state in kept:
+        for exclude in EXCLUDES:
+            action = trained.best_action(state, exclude, min_visits)
+            # with nothing left at the exact level the lookup moves on to a coarser one
+            if action is not None:
+                assert compact.best_action(state, exclude) == action
+
+
+# with no pruning and only the exact level, compacting changes nothing
+def test_exact_level_keeps_everything(trained):
+    compact = compact_policy(trained, 1, levels=(StateAbstraction(),))
+    assert len(compact) == len(trained)
+    for state in trained.states:
+        assert compact.visits(state) == trained.visits(state)
+        for exclude in EXCLUDES:
+            assert compact.best_action(state, exclude) == trained.best_action(state, exclude)
+
+
+# a coarser level only keeps what the finer ones cannot answer, so the levels together are no bigger than the table
+def test_levels_are_smaller(trained):
+    compact = compact_policy(trained, 3)
+    assert len(compact) <= len(trained)
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+from CS4100ExplodingKittens import POLICY_ACTION_CODES, DECK_SIZE_SHIFT
+from td_learning import QTable, learn_batch
+
+
+# Checks that the TD updates settle on the right values when the games they learn from stay the same
+
+ATTACK = POLICY_ACTION_CODES['Attack']
+SKIP = POLICY_ACTION_CODES['Skip']
+FINISH_TURN = POLICY_ACTION_CODES['Finish Turn']
+# a state where the hand can Attack or Skip, and two where it can only finish the turn
+CHOICE = 0b11 | 7 << DECK_SIZE_SHIFT
+AFTER_ATTACK = 5 << DECK_SIZE_SHIFT
+AFTER_SKIP = 6 << DECK_SIZE_SHIFT
+
+
+# the same finished games every time, in the form learn_batch reads from a TDBatchSimulator: seat 0 learns and wins
+# whenever it attacks, and seat 1 does not learn
+class FixedGames:
+    def __init__(self, table):
+        self.table = table
+        self.num_players = 2
+        self.learning = np.array([True, False])
+
+    def records(self):
+        owners = np.array([0, 0, 1, 2, 2, 3])
+        keys = np.array([CHOICE, AFTER_ATTACK, CHOICE, CHOICE, AFTER_SKIP, AFTER_SKIP])
+        actions = np.array([ATTACK, FINISH_TURN, SKIP, SKIP, FINISH_TURN, FINISH_TURN])
+        return owners, keys, actions
+
+    def winners(self):
+        return np.array([0, 1])
+
+
+def test_updates_converge_on_fixed_games():
+    table = QTable()
+    games = FixedGames(table)
+    for _ in range(1000):
+        learn_batch(games)
+    assert table.value(AFTER_ATTACK, 'Finish Turn') == 1.0
+    assert table.value(AFTER_SKIP, 'Finish Turn') == 0.0
+    # the first decision is pulled toward the value of the next one, which reaches 1 or 0 as that one settles
+    assert table.value(CHOICE, 'Attack') == pytest.approx(1.0, abs=0.01)
+    assert table.value(CHOICE, 'Skip') == pytest.approx(0.0, abs=0.01)
+    assert table.best_action(CHOICE) == 'Attack'
+    # seat 1 does not learn, so its moves are not in the table
+    assert table.visits(CHOICE) == {'Attack': 1000, 'Skip': 1000}
+
+
+# with targets drawn around fixed means each value is the average of the targets it has seen until 1 / count drops
+# below the learning rate, and then an exponential average that stays close to the mean
+@pytest.mark.parametrize('learning_rate', [0.01, 0.1])
+def test_values_settle_on_the_mean_target(learning_rate):
+    rng = np.random.default_rng(0)
+    table = QTable()
+    rows = table.rows(np.array([CHOICE, AFTER_ATTACK, AFTER_SKIP]))
+    means = np.array([0.2, 0.5, 0.9])
+    for _ in range(2000):
+        targets = (rng.random(3) < means).astype(np.float64)
+        table.learn(rows, np.full(3, FINISH_TURN), targets, learning_rate)
+    # the standard deviation of an exponential average of 0/1 targets, at most
+    spread = 0.5 * (learning_rate / (2 - learning_rate)) ** 0.5
+    assert table.values[rows, FINISH_TURN] == pytest.approx(means, abs=4 * spread)
+
+
+# several moves of the same cell in one update are averaged into one step, and each counts as a move learned from
+def test_repeated_moves_are_averaged():
+    table = QTable()
+    rows = table.rows(np.array([CHOICE, CHOICE, CHOICE]))
+    table.learn(rows, np.full(3, ATTACK), np.array([1.0, 0.0, 0.5]), 0.01)
+    assert table.value(CHOICE, 'Attack') == pytest.approx(0.5)
+    assert table.visits(CHOICE) == {'Attack': 3}
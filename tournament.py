@@ -0,0 +1,168 @@
+import itertools
+import multiprocessing
+import os
+import random
+from collections import namedtuple
+from statistics import NormalDist
+from CS4100ExplodingKittens import Game, game_rng
+from game_log import GameLog, encode_game
+
+
+# Tournaments between agents
+# An agent is given as a factory: any picklable callable that takes a player ID and returns a fresh Player for one
+# game. Player classes are factories already, and PolicyAgent builds trained agents around a shared policy.
+# Every pairing is played in batches spread over a process pool, alternating which agent sits first, until either
+# the game limit is reached or the confidence interval on the win rate is narrow enough.
+#
+#   results = run_tournament({'Random': Player, 'Smart': SmartPlayer,
+#                             'OPP': PolicyAgent(ObservedPolicyPlayer, load_policy(OBSERVED_POLICY_FILE))})
+#   print_results(results)
+
+
+# the result of one pairing; wins, seat_wins and seat_games hold agent a's entry first, then agent b's
+# seat_wins is ((wins seated first, wins seated second) of a, the same of b), seat_games the same for games played
+# win_rate and interval are agent a's
+MatchupResult = namedtuple('MatchupResult', ['a', 'b', 'games', 'wins', 'win_rate', 'interval', 'seat_wins',
+                                             'seat_games'])
+
+
+# a factory for a trained agent; the policy is shared by every player it makes
+# a MappedPolicy pickles as its path, so workers map the same file instead of receiving a copy; wrap a table
+# trained in this process with share_policy first, otherwise every batch pickles the whole table
+class PolicyAgent:
+    def __init__(self, agent_type, policy):
+        self.agent_type = agent_type
+        self.policy = policy
+
+    def __call__(self, player_ID):
+        player = self.agent_type(player_ID)
+        player.policy = self.policy
+        return player
+
+
+# the log file of one pairing in a tournament's log_dir
+def pairing_log_path(log_dir, pairing):
+    return os.path.join(log_dir, f'{pairing[0]} v {pairing[1]}.ekl')
+
+
+# the Wilson score interval for wins out of games at the given confidence level
+def wilson_interval(wins, games, confidence=0.95):
+    if games == 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    rate = wins / games
+    center = (rate + z * z / (2 * games)) / (1 + z * z / games)
+    half_width = z * (rate * (1 - rate) / games + z * z / (4 * games * games)) ** 0.5 / (1 + z * z / games)
+    return max(0.0, center - half_width), min(1.0, center + half_width)
+
+
+# play one batch of a pairing; agent a sits first in the even games and second in the odd ones
+# returns [[a wins first, a wins second], [b wins first, b wins second]] and the games encoded for a GameLog, which
+# is empty unless record_events is set
+def play_batch(job):
+    factory_a, factory_b, num_games, seed, record_events = job
+    seat_wins = [[0, 0], [0, 0]]
+    encoded = bytearray()
+    for i in range(num_games):
+        a_first = i % 2 == 0
+        factories = [factory_a, factory_b] if a_first else [factory_b, factory_a]
+        players = [factory(f'Player{seat + 1}') for seat, factory in enumerate(factories)]
+        game = Game(players, rng=game_rng(seed, i), record_events=record_events)
+        game.start_game()
+        if record_events:
+            encoded += encode_game(game)
+        winner_seat = 0 if game.decide_winner() == 'Player1' else 1
+        winner = winner_seat if a_first else 1 - winner_seat
+        seat_wins[winner][winner_seat] += 1
+    return seat_wins, bytes(encoded)
+
+
+# play every pairing between the named agents and return a MatchupResult for each
+#   pairings: (name, name) tuples to play, every unordered pair of agents if None; an agent may play itself
+#   games: the most games played per pairing
+#   batch_size: games per job handed to a worker; keep it even so both seat orders get the same number of games
+#   target_width: stop a pairing once its confidence interval is at most this wide (never stop early if None)
+#   log_dir: if given, every game is recorded to a game log there, one file per pairing (see pairing_log_path)
+def run_tournament(agents, pairings=None, games=500, workers=None, batch_size=50, confidence=0.95,
+                   target_width=None, seed=None, log_dir=None):
+    if pairings is None:
+        pairings = list(itertools.combinations(agents, 2))
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    seeds = random.Random(seed)
+    # per pairing: [[a wins first, a wins second], [b wins first, b wins second]] and games scheduled so far
+    totals = {pairing: [[0, 0], [0, 0]] for pairing in pairings}
+    played = dict.fromkeys(pairings, 0)
+    running = list(pairings)
+    logs = {}
+    if log_dir is not None:
+        logs = {pairing: GameLog(pairing_log_path(log_dir, pairing)) for pairing in pairings}
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    try:
+        while running:
+            # one round hands every worker a batch of every pairing still running
+            jobs = []
+            owners = []
+            for pairing in running:
+                for worker in range(workers):
+                    num_games = min(batch_size, games - played[pairing])
+                    if num_games <= 0:
+                        break
+                    played[pairing] += num_games
+                    jobs.append((agents[pairing[0]], agents[pairing[1]], num_games, seeds.randrange(2 ** 32),
+                                 log_dir is not None))
+                    owners.append(pairing)
+            results = pool.map(play_batch, jobs) if pool is not None else [play_batch(job) for job in jobs]
+            for pairing, (seat_wins, encoded) in zip(owners, results):
+                if pairing in logs:
+                    logs[pairing].write_encoded(encoded)
+                for agent in range(2):
+                    for seat in range(2):
+                        totals[pairing][agent][seat] += seat_wins[agent][seat]
+            still_running = []
+            for pairing in running:
+                if played[pairing] >= games:
+                    continue
+                if target_width is not None:
+                    low, high = wilson_interval(sum(totals[pairing][0]), played[pairing], confidence)
+                    if high - low <= target_width:
+                        continue
+                still_running.append(pairing)
+            running = still_running
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        for log in logs.values():
+            log.close()
+    return [matchup_result(pairing, totals[pairing], played[pairing], confidence) for pairing in pairings]
+
+
+def matchup_result(pairing, seat_wins, games, confidence):
+    a, b = pairing
+    a_wins = sum(seat_wins[0])
+    # every game with a seated first was either won by a from the first seat or by b from the second
+    a_first_games = seat_wins[0][0] + seat_wins[1][1]
+    return MatchupResult(
+        a=a,
+        b=b,
+        games=games,
+        wins=(a_wins, sum(seat_wins[1])),
+        win_rate=a_wins / games if games else 0.0,
+        interval=wilson_interval(a_wins, games, confidence),
+        seat_wins=(tuple(seat_wins[0]), tuple(seat_wins[1])),
+        seat_games=((a_first_games, games - a_first_games), (games - a_first_games, a_first_games)),
+    )
+
+
+def print_results(results):
+    for result in results:
+        low, high = result.interval
+        print(f"{result.a} v {result.b}: {result.wins[0]} - {result.wins[1]} over {result.games} games, "
+              f"{result.a} wins {result.win_rate:.1%} ({low:.1%} - {high:.1%})")
+        for agent, name in enumerate((result.a, result.b)):
+            first_wins, second_wins = result.seat_wins[agent]
+            first_games, second_games = result.seat_games[agent]
+            print(f"    {name}: {first_wins}/{first_games} seated first, {second_wins}/{second_games} seated second")